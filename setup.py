@@ -17,5 +17,10 @@ setup(
 	author='Jérémy LAVARENNE (@codename5281)',
 	packages=find_packages(where='src'),
 	install_requires=parse_requirements('requirements.txt'),
+	extras_require={
+		'numba': ['numba'],
+		'zarr': ['zarr', 'dask'],
+		'netcdf': ['netCDF4', 'dask'],
+	},
 	package_dir={'': 'src'}
 	)
\ No newline at end of file
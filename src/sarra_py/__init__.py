@@ -1,5 +1,17 @@
+from .fields import *
 from .bilan_pheno import *
 from .bilan_carbo import *
 from .bilan_hydro import *
+from .regridding import *
 from .data_preparation import *
-from .models import *
\ No newline at end of file
+from .forcing_store import *
+from .state import *
+from .ensemble import *
+from .reducers import *
+from .writers import *
+from .numba_engine import *
+from .models import *
+from .tiling import *
+
+from .multiyear import *
+from .sites import *
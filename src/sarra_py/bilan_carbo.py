@@ -1,6 +1,8 @@
 import numpy as np
 import xarray as xr
 
+from .fields import constant_field, masked_constant_field, promote_fields
+
 def variable_dict():
     """
     Retrieve the dictionary of variables in the dataset with their respective units.
@@ -148,6 +150,14 @@ def initialize_simulation(data, grid_width, grid_height, duration, paramVariete,
     This code has been adapted from the original InitiationCulture procedure, from the `MilBilanCarbone.pas` code of the
     SARRA model. 
 
+    Variables that are constant at initialization, such as sowing_date,
+    irrigAuto, biomMc or ltr, are built as single-day views, see
+    `constant_field`, and returned as writable arrays, see `promote_fields`,
+    so that they can be written into before the simulation, such as
+    `data["biomMc"][j:,:,:] = ...`. Variables initialized at 0 only take
+    memory once written. The "rolling" engine holds the variables whose days
+    all have the same values as a single day until they are written.
+
     Args:
         data (_type_): _description_ grid_width (_type_): _description_
         grid_height (_type_): _description_ duration (_type_): _description_
@@ -167,19 +177,21 @@ def initialize_simulation(data, grid_width, grid_height, duration, paramVariete,
     #// data["sommeDegresJourMaximale"].attrs = {"units":"°C.j", "long_name":"Maximum thermal time"}
 
     # from paramITK : sowing date
-    data["sowing_date"] = (data["rain"].dims, np.full((duration, grid_width, grid_height), (paramITK["DateSemis"] - date_start).days))
+    # variables constant at initialization are stored as a single day, see constant_field ;
+    # their layout is the one of rain, which is (time, site) for a sites dataset
+    shape = (duration,) + data["rain"].shape[1:]
+    data["sowing_date"] = (data["rain"].dims, constant_field((paramITK["DateSemis"] - date_start).days, shape))
     
     # from paramITK : automatic irrigation indicator
-    data["irrigAuto"] = (data["rain"].dims, np.full((duration, grid_width, grid_height), paramITK["irrigAuto"]))
+    data["irrigAuto"] = (data["rain"].dims, constant_field(paramITK["irrigAuto"], shape))
     data["irrigAuto"].attrs = {"units":"binary", "long_name":"automatic irrigation indicator"}
 
     ####### variables qui viennent de initplotMc
     # Initial biomass of crop residues (mulch) (kg/ha)
     # Biomasse initiale des résidus de culture (mulch) (kg/ha)
     #   BiomMc := BiomIniMc;
-    data["biomMc"] = (data["rain"].dims, np.full((duration, grid_width, grid_height), paramITK["biomIniMc"]))
+    data["biomMc"] = (data["rain"].dims, constant_field(paramITK["biomIniMc"], shape, np.float32))
     data["biomMc"].attrs = {"units": "kg/ha", "long_name": "Initial biomass of crop residues (mulch)"}
-    data["biomMc"] = data["biomMc"].astype("float32")
 
 
     # ?
@@ -189,16 +201,14 @@ def initialize_simulation(data, grid_width, grid_height, duration, paramVariete,
 
     # ?
     #   Ltr := 1;
-    data["ltr"] = (data["rain"].dims, np.full((duration, grid_width, grid_height), 1.0))
-    data["ltr"] = data["ltr"].astype("float32")
+    data["ltr"] = (data["rain"].dims, constant_field(1.0, shape, np.float32))
 
 
     # Initial biomass of stem residues as litter (kg/ha)
     # Biomasse initiale des résidus de tiges sous forme de litière (kg/ha)
     #   LitTiges := BiomIniMc;
-    data["LitTige"] = (data["rain"].dims, np.full((duration, grid_width, grid_height), paramITK["biomIniMc"]))
+    data["LitTige"] = (data["rain"].dims, constant_field(paramITK["biomIniMc"], shape, np.float32))
     data["LitTige"].attrs = {"units": "kg/ha", "long_name": "Initial biomass of stem residues as litter"}
-    data["LitTige"] = data["LitTige"].astype("float32")
 
     ####### fin variables qui viennent de initplotMc
 
@@ -216,7 +226,7 @@ def initialize_simulation(data, grid_width, grid_height, duration, paramVariete,
     #   StRurMax := Ru * ProfRacIni / 1000;
     #! renaming stRurMax with root_tank_capacity
     #// data["stRurMax"] = data["ru"] * paramITK["profRacIni"] / 1000
-    data["root_tank_capacity"] = (data["rain"].dims, np.repeat(np.array(data["ru"] * paramITK["profRacIni"] / 1000)[np.newaxis,:,:], duration, axis=0))
+    data["root_tank_capacity"] = (data["rain"].dims, constant_field(data["ru"] * paramITK["profRacIni"] / 1000, shape))
     #// data["stRurMax"].attrs = {"units": "mm", "long_name": "Soil maximum water storage capacity"}
     data["root_tank_capacity"].attrs = {"units": "mm", "long_name": "Soil maximum water storage capacity"}
 
@@ -242,7 +252,7 @@ def initialize_simulation(data, grid_width, grid_height, duration, paramVariete,
     #// data["stTot"] = data["stockIniProf"]
     #//data["total_tank_stock"] = data["stockIniProf"]
     #! coorecting total_tank_stock initialization as it did not have the time dimensions that are required as stock evolves through time
-    data["total_tank_stock"] = (data["rain"].dims, np.repeat(np.array(data["stockIniProf"])[np.newaxis,:,:], duration, axis=0))
+    data["total_tank_stock"] = (data["rain"].dims, constant_field(data["stockIniProf"], shape))
     #// data["stTot"].attrs = {"units": "mm", "long_name": "?"}
     data["total_tank_stock"].attrs = {"units": "mm", "long_name": "?"}
     
@@ -262,20 +272,21 @@ def initialize_simulation(data, grid_width, grid_height, duration, paramVariete,
     #   Hum := max(RuSurf, StRurMax);
     #   // Hum mis a profRuSurf
     #   Hum := max(StTot, Hum);
-    data["humectation_front"] = (data["rain"].dims, np.full((duration, grid_width, grid_height),
+    data["humectation_front"] = (data["rain"].dims, constant_field(
         np.maximum(
             np.maximum(
                 #! renaming ruSurf with surface_tank_capacity
                 #// data["ruSurf"],
-                data["surface_tank_capacity"].expand_dims({"time":duration}),
+                data["surface_tank_capacity"].values,
                 #! renaming stRurMax with root_tank_capacity
                 #// data["stRurMax"],
-                data["root_tank_capacity"],
+                data["root_tank_capacity"].values[0],
             ),
             #! renaming stTot with total_tank_stock
             #// data["stTot"],
-            data["total_tank_stock"],
-        )
+            data["total_tank_stock"].values[0],
+        ),
+        shape,
     ))
     data["humectation_front"].attrs = {"units": "mm", "long_name": "Maximum water capacity to humectation front"}
 
@@ -308,18 +319,18 @@ def initialize_simulation(data, grid_width, grid_height, duration, paramVariete,
 
     # crop density
     if ~np.isnan(paramVariete["densOpti"]) :
-        data["rapDensite"] = data["rain"] * 0 + compute_rapDensite(paramITK, paramVariete)
+        data["rapDensite"] = masked_constant_field(data["rain"], compute_rapDensite(paramITK, paramVariete))
         data["rapDensite"].attrs = {"units":"none", "long_name":"sowing density adjustement factor"}
 
     # initialize variables with values at 0
     variables = variable_dict()
 
     for variable in variables :
-        data[variable] = (data["rain"].dims, np.zeros(shape=(duration, grid_width, grid_height)))
+        data[variable] = (data["rain"].dims, constant_field(0, shape, np.float32))
         data[variable].attrs = {"units":variables[variable][1], "long_name":variables[variable][0]}
-        data[variable] = data[variable].astype("float32")
 
-    return data
+    # constant fields are returned writable
+    return promote_fields(data)
 
 
     
@@ -137,8 +137,8 @@ def update_irrigation_tank_stock(j, data):
 
     data["irrigation_tank_stock"][j, :, :] = np.where(
         condition,
-        xr.where(
-            (data["root_tank_capacity"] < data["surface_tank_capacity"])[j, :, :],
+        np.where(
+            data["root_tank_capacity"][j, :, :] < data["surface_tank_capacity"],
             data["surface_tank_stock"][j, :, :],
             data["root_tank_stock"][j, :, :],
         ),
@@ -233,7 +233,7 @@ def compute_daily_irrigation(j, data, paramITK):
         (data["irrigation_tank_stock"][j, :, :] / data["irrigation_tank_capacity"][j,:,:] \
             < paramITK["irrigAutoTarget"])
         
-    data["irrigTotDay"][j, :, :] = xr.where(
+    data["irrigTotDay"][j, :, :] = np.where(
         condition,
         np.minimum(
             np.maximum(
@@ -459,7 +459,7 @@ def estimate_runoff(j, data):
         _type_: _description_
     """
     
-    data["runoff"][j,:,:] = xr.where(
+    data["runoff"][j,:,:] = np.where(
         data["rain"][j,:,:] > data["runoff_threshold"],
         (data["available_water"][j,:,:]  - data["runoff_threshold"]) * data["runoff_rate"],
         0,
@@ -540,7 +540,7 @@ def initialize_root_tank_capacity(j, data, paramITK):
         _type_: _description_
     """
     if np.any(data["numPhase"][j,:,:] == 1) :
-        data["root_tank_capacity"][j:,:,:] = xr.where(
+        data["root_tank_capacity"][j:,:,:] = np.where(
             (data["changePhase"][j,:,:] == 1) & (data["numPhase"][j,:,:] == 1),
             paramITK["profRacIni"] / 1000 * data["ru"],
             data["root_tank_capacity"][j,:,:],
@@ -600,9 +600,9 @@ def initialize_delta_root_tank_capacity(j, data):
     condition = (data["numPhase"][j,:,:] > 0) & \
         np.invert((data["numPhase"][j,:,:] == 1) & (data["changePhase"][j,:,:] == 1))
 
-    data["delta_root_tank_capacity"][j,:,:] = xr.where(
+    data["delta_root_tank_capacity"][j,:,:] = np.where(
         condition,
-        xr.where(
+        np.where(
             (data["root_tank_capacity"][j,:,:] > data["surface_tank_capacity"]),
             (data["vRac"][j,:,:] * np.minimum(data["cstr"][j,:,:] + 0.3, 1.0)) / 1000 * data["ru"],
             data["vRac"][j,:,:] / 1000 * data["ru"],
@@ -763,19 +763,19 @@ def update_root_tank_stock(j, data):
     """
 
     condition = (data["numPhase"][j,:,:] > 0) & \
-        np.invert((data["changePhase"][j,:,:] == 1) & (data["numPhase"][j,:,:] == 1)),
+        np.invert((data["changePhase"][j,:,:] == 1) & (data["numPhase"][j,:,:] == 1))
     
 
-    data["root_tank_stock"][j:,:,:] = xr.where(
+    data["root_tank_stock"][j:,:,:] = np.where(
         condition,
-        xr.where(
+        np.where(
             (data["root_tank_capacity"][j,:,:] > data["surface_tank_capacity"]),
             data["root_tank_stock"][j,:,:] + data["delta_root_tank_capacity"][j,:,:],
             np.maximum(
                 ((data["surface_tank_stock"][j,:,:] - data["surface_tank_capacity"] * 1/10) * \
                 (data["root_tank_capacity"][j,:,:] / data["surface_tank_capacity"])),
                 0),
-        ).expand_dims("time", axis=0), 
+        ),
         
         data["root_tank_stock"][j,:,:],
     )
@@ -2505,4 +2505,67 @@ def ConsoResSep(j, data):
 
     #// data = update_etr_etm(j, data)
 
+    return data
+
+
+
+
+def ConsoResSep_fused(j, data):
+    """
+    This function computes the water consumption from the soil tanks as
+    `ConsoResSep` does, in a single pass over the values of the day.
+
+    The ten procedures of `ConsoResSep` each read the values of the day from
+    the simulation data and write their result back over all the remaining
+    days. Here, the evaporation and transpiration withdrawals from the
+    surface, root and total tanks are chained on arrays of the day, and each
+    of the updated variables (`trSurf`, `consoRur`, `tr`,
+    `surface_tank_stock`, `root_tank_stock` and `total_tank_stock`) is
+    written once. Results are the same as with `ConsoResSep`, which this
+    function can replace in the daily procedures.
+
+    Args:
+        j (int): index of the day
+        data (xarray.Dataset or SimulationState): simulation data
+
+    Returns:
+        xarray.Dataset or SimulationState: updated simulation data
+    """
+
+    evap = np.asarray(data["evap"][j,:,:])
+    surface_tank_capacity = np.asarray(data["surface_tank_capacity"])
+
+    # evaporation, depleting the surface tank first
+    trSurf = np.maximum(0, np.asarray(data["surface_tank_stock"][j,:,:]))
+    surface_tank_stock = np.maximum(0, np.asarray(data["surface_tank_stock"][j,:,:]) - evap)
+    consoRur = np.where(evap > trSurf, trSurf, evap)
+    total_tank_stock = np.maximum(0, np.asarray(data["total_tank_stock"][j,:,:]) - consoRur)
+
+    # roots exploring only part of the surface tank are only depleted of the
+    # evaporation of that part
+    root_tank_stock = np.asarray(data["root_tank_stock"][j,:,:])
+    shallow = np.asarray(data["root_tank_capacity"][j,:,:]) < surface_tank_capacity
+    consoRur = np.where(shallow, evap * root_tank_stock / surface_tank_capacity, consoRur)
+    root_tank_stock = np.maximum(0, root_tank_stock - consoRur)
+
+    # transpiration
+    tr = np.asarray(data["tr"][j,:,:])
+    tr = np.where(tr > root_tank_stock, np.maximum(root_tank_stock - tr, 0), tr)
+    rooted = root_tank_stock > 0
+    surface_share = np.divide(trSurf, root_tank_stock, out=np.ones_like(trSurf), where=rooted)
+    surface_tank_stock = np.where(
+        rooted,
+        np.maximum(surface_tank_stock - (tr * np.minimum(surface_share, 1)), 0),
+        surface_tank_stock,
+    )
+    root_tank_stock = np.maximum(0, root_tank_stock - tr)
+    total_tank_stock = np.maximum(0, total_tank_stock - tr)
+
+    data["trSurf"][j:,:,:] = trSurf
+    data["consoRur"][j:,:,:] = consoRur
+    data["tr"][j:,:,:] = tr
+    data["surface_tank_stock"][j:,:,:] = surface_tank_stock
+    data["root_tank_stock"][j:,:,:] = root_tank_stock
+    data["total_tank_stock"][j:,:,:] = total_tank_stock
+
     return data
\ No newline at end of file
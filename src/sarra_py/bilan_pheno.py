@@ -53,20 +53,20 @@ def testing_for_initialization(j, data, paramITK, paramVariete):
         (data["surface_tank_stock"][j, :, :] >= paramITK["seuilEauSemis"])
         # & (data["startLock"][j,:,:] == 0)
 
-    data["numPhase"][j:, :, :] = xr.where(
+    data["numPhase"][j:, :, :] = np.where(
         condition, 1, data["numPhase"][j, :, :])
 
-    data["changePhase"][j, :, :] = xr.where(
+    data["changePhase"][j, :, :] = np.where(
         condition, 1, data["changePhase"][j, :, :])
 
-    data["seuilTempPhaseSuivante"][j:, :, :] = xr.where(
+    data["seuilTempPhaseSuivante"][j:, :, :] = np.where(
         condition,
         paramVariete["SDJLevee"],
         data["seuilTempPhaseSuivante"][j, :, :],
     )
 
     #flagging phase change has been done
-    data["initPhase"][j, :, :] = xr.where(
+    data["initPhase"][j, :, :] = np.where(
         condition,
         1,
         data["initPhase"][j, :, :]
@@ -96,7 +96,7 @@ def flag_change_phase(j, data, num_phase):
         (data["numPhase"][j,:,:] == num_phase) & \
         (data["sdj"][j,:,:] >= data["seuilTempPhaseSuivante"][j,:,:])
 
-    data["changePhase"][j,:,:] = xr.where(
+    data["changePhase"][j,:,:] = np.where(
         condition,
         1,
         data["changePhase"][j,:,:],
@@ -177,7 +177,7 @@ def increment_phase_number(j, data):
     )
 
     # flagging this day as having been incremented
-    data["initPhase"][j, :, :] = xr.where(
+    data["initPhase"][j, :, :] = np.where(
         condition,
         1,
         data["initPhase"][j, :, :]
@@ -205,7 +205,7 @@ def update_thermal_time_previous_phase(j, data, num_phase):
         (data["numPhase"][j,:,:] == num_phase) & \
         (data["changePhase"][j,:,:] == 1)
 
-    data["seuilTempPhasePrec"][j:,:,:] = xr.where(
+    data["seuilTempPhasePrec"][j:,:,:] = np.where(
         condition,
         data["seuilTempPhaseSuivante"][j,:,:],
         data["seuilTempPhasePrec"][j,:,:]
@@ -337,7 +337,7 @@ def update_pheno_phase_3_to_4(j, data):
         (data["numPhase"][j,:,:] == 3) & \
         (data["phasePhotoper"][j,:,:] == 0)
 
-    data["changePhase"][j,:,:] = xr.where(
+    data["changePhase"][j,:,:] = np.where(
         condition,
         1,
         data["changePhase"][j,:,:],
@@ -557,6 +557,280 @@ def EvalPhenoSarrahV3(j, data, paramITK, paramVariete):
 
 
 
+def _cumulative_thermal_time(ddj, dtype):
+    """
+    Sums the daily thermal time `ddj` along time in `dtype`, rounding the sum
+    of each day as `calculate_sum_of_thermal_time` does when storing sdj.
+    """
+    if np.result_type(dtype, ddj.dtype) == dtype:
+        return np.cumsum(ddj, axis=0, dtype=dtype)
+    sdj = np.empty(ddj.shape, dtype=dtype)
+    total = np.zeros(ddj.shape[1:], dtype=dtype)
+    for i in range(ddj.shape[0]):
+        total = (total + ddj[i]).astype(dtype)
+        sdj[i] = total
+    return sdj
+
+
+def _next_phase_start(condition, start):
+    """
+    Returns the offset of the day following the first day from `start` on
+    which `condition` is met, or -1 if there is none within the days of
+    `condition`, or if `start` is -1.
+    """
+    days = np.arange(condition.shape[0]).reshape((-1,) + (1,) * (condition.ndim - 1))
+    condition = condition & (days >= start)
+    first = condition.argmax(axis=0)
+    return np.where(condition.any(axis=0) & (start >= 0) & (first + 1 < condition.shape[0]), first + 1, -1)
+
+
+def phenology_schedule(ddj, day_length, paramVariete, dtype=np.float32):
+    """
+    Computes the days on which the phenological phases of a crop start, for
+    crops initialized on the first day of `ddj`, from the cumulative sum of
+    thermal time of the following days.
+
+    This gives the same phase changes as applying `EvalPhenoSarrahV3` and
+    `update_photoperiodism` day by day : phases 1, 2, 4, 5 and 6 end the day
+    after the sum of thermal time crosses the threshold of the next phase,
+    the thresholds being built from SDJLevee, SDJBVP, SDJRPR, SDJMatu1 and
+    SDJMatu2 as `update_thermal_time_next_phase` does, and the photoperiodic
+    phase 3 ends the day after sumPP falls below PPsens. Thresholds are
+    rounded to `dtype` at each step, as they are when stored in the
+    simulation data, so that the days found are exactly the ones of the
+    daily procedures.
+
+    Since only the thermal time and the day length of the season are
+    needed, the phase lengths of many variety parameters, given as arrays
+    broadcast against the trailing dimensions of `ddj`, can be computed
+    without running the model.
+
+    Args:
+        ddj (np.ndarray): (days, ...) daily thermal time, from the
+            initialization day, as computed by
+            `calculate_once_daily_thermal_time`
+        day_length (np.ndarray): (days, ...) day length, from the
+            initialization day
+        paramVariete (dict): crop variety parameters
+        dtype (np.dtype, optional): type of the sum of thermal time and of
+            the thresholds. Defaults to np.float32, as in the simulation data.
+
+    Returns:
+        dict: "days", the (7, ...) offsets from the initialization day of
+            the first day of phases 1 to 7, -1 for phases not reached within
+            the days given ; "thresholds", the (7, ...) values of
+            seuilTempPhaseSuivante set on the first day of each phase ;
+            "previous_thresholds", the (7, ...) values of seuilTempPhasePrec
+            set on the first day of each phase, NaN for phase 1 that leaves it
+            unchanged
+    """
+    sdj = _cumulative_thermal_time(np.asarray(ddj), dtype)
+
+    def add(threshold, value):
+        return np.asarray(threshold + value).astype(dtype)
+
+    # thresholds set on the first day of each phase, including the updates
+    # made on the same day by the procedures of the next phase
+    levee = np.asarray(paramVariete["SDJLevee"]).astype(dtype)
+    threshold_1 = add(levee, paramVariete["SDJLevee"])
+    previous_2 = add(threshold_1, paramVariete["SDJLevee"])
+    threshold_2 = add(previous_2, paramVariete["SDJBVP"])
+    threshold_3 = add(threshold_2, paramVariete["SDJBVP"])
+    threshold_4 = add(threshold_3, paramVariete["SDJRPR"])
+    previous_5 = add(threshold_4, paramVariete["SDJRPR"])
+    threshold_5 = add(previous_5, paramVariete["SDJMatu1"])
+    previous_6 = add(threshold_5, paramVariete["SDJMatu1"])
+    threshold_6 = add(previous_6, paramVariete["SDJMatu2"])
+    threshold_7 = add(threshold_6, paramVariete["SDJMatu2"])
+
+    # daily sumPP of the photoperiodic phase, as computed by update_photoperiodism
+    thermal_time_since_previous_phase = np.maximum(0.01, sdj - threshold_2)
+    time_above_critical_day_length = np.maximum(0, day_length - paramVariete["PPCrit"])
+    sumPP = (((1000 / thermal_time_since_previous_phase) ** (paramVariete["PPExp"])) \
+        * time_above_critical_day_length / (paramVariete["SeuilPP"] - paramVariete["PPCrit"])).astype(dtype)
+
+    start_1 = np.zeros(sdj.shape[1:], dtype=np.int64)
+    start_2 = _next_phase_start(sdj >= threshold_1, start_1)
+    start_3 = _next_phase_start(sdj >= threshold_2, start_2)
+    days = np.arange(sdj.shape[0]).reshape((-1,) + (1,) * (sdj.ndim - 1))
+    photoperiod_over = np.where(days == start_3, np.asarray(100, dtype=dtype) < paramVariete["PPsens"], sumPP < paramVariete["PPsens"])
+    start_4 = _next_phase_start(photoperiod_over, start_3)
+    start_5 = _next_phase_start(sdj >= threshold_4, start_4)
+    start_6 = _next_phase_start(sdj >= threshold_5, start_5)
+    start_7 = _next_phase_start(sdj >= threshold_6, start_6)
+
+    starts = np.broadcast_arrays(start_1, start_2, start_3, start_4, start_5, start_6, start_7)
+    thresholds = np.broadcast_arrays(threshold_1, threshold_2, threshold_3, threshold_4, threshold_5, threshold_6,
+                                     threshold_7, start_1)[:7]
+    previous_thresholds = np.broadcast_arrays(np.asarray(np.nan, dtype=dtype), previous_2, threshold_2, threshold_3,
+                                              previous_5, previous_6, threshold_6, start_1)[:7]
+    return {
+        "days": np.stack(starts),
+        "thresholds": np.stack(thresholds).astype(dtype),
+        "previous_thresholds": np.stack(previous_thresholds).astype(dtype),
+    }
+
+
+def _remaining_days(data, name, j):
+    """
+    Returns the (days, ...) values of a variable that is not written by the
+    procedures, from day `j` to the end of the simulation.
+    """
+    variable = data[name]
+    if hasattr(variable, "remaining_days"):
+        return variable.remaining_days(j)
+    return variable.values[j:]
+
+
+def _at_pixels(value, shape, pixels):
+    """
+    Selects the values of a parameter at the given pixels of the day, scalar
+    parameters being kept as they are so that they are promoted the same way
+    as by the daily procedures.
+    """
+    if np.ndim(value) == 0:
+        return value
+    return np.broadcast_to(value, shape)[pixels]
+
+
+class EventPhenology:
+    """
+    Event-driven replacement of `EvalPhenoSarrahV3`.
+
+    Initialization is still tested every day, as it depends on the water of
+    the surface tank. On the day a pixel is initialized, the days of all its
+    following phase changes are computed at once with `phenology_schedule`,
+    from the thermal time of the rest of the season, which must not change
+    during the simulation, as with `calculate_once_daily_thermal_time`. On
+    the other days, the phenology of the day is looked up from these days,
+    and the phenological variables are only written on days where at least
+    one pixel changes phase.
+
+    An instance holds the phase change days of a single simulation, which
+    must start before any crop is initialized.
+    """
+
+    def __init__(self):
+        self.days = None
+        self.thresholds = None
+        self.previous_thresholds = None
+
+    def __call__(self, j, data, paramITK, paramVariete):
+        """
+        Args:
+            j (int): index of the day
+            data (xarray.Dataset or SimulationState): simulation data
+            paramITK (dict): crop management parameters
+            paramVariete (dict): crop variety parameters
+
+        Returns:
+            xarray.Dataset or SimulationState: updated simulation data
+        """
+        num_phase = np.asarray(data["numPhase"][j,:,:])
+        if self.days is None:
+            if (num_phase != 0).any():
+                raise ValueError("event-driven phenology requires a simulation starting before crop initialization")
+            dtype = np.asarray(data["sdj"][j,:,:]).dtype
+            self.days = np.full((7,) + num_phase.shape, np.iinfo(np.int64).max)
+            self.thresholds = np.zeros((7,) + num_phase.shape, dtype=dtype)
+            self.previous_thresholds = np.zeros((7,) + num_phase.shape, dtype=dtype)
+
+        #! replacing stRuSurf by surface_tank_stock
+        condition = np.broadcast_to(
+            (num_phase == 0) & \
+            (j >= np.asarray(data["sowing_date"][j,:,:])) & \
+            (np.asarray(data["surface_tank_stock"][j,:,:]) >= paramITK["seuilEauSemis"]),
+            num_phase.shape,
+        )
+        if condition.any():
+            self._schedule(j, data, condition, paramVariete)
+
+        events = self.days == j
+        change = events.any(axis=0)
+        if not change.any():
+            return data
+
+        phase = events.argmax(axis=0)
+        threshold = np.take_along_axis(self.thresholds, phase[np.newaxis], axis=0)[0]
+        previous_threshold = np.take_along_axis(self.previous_thresholds, phase[np.newaxis], axis=0)[0]
+
+        data["numPhase"][j:,:,:] = np.where(change, phase + 1, data["numPhase"][j,:,:])
+        data["changePhase"][j,:,:] = np.where(change, 1, data["changePhase"][j,:,:])
+        data["initPhase"][j,:,:] = np.where(change, 1, data["initPhase"][j,:,:])
+        data["seuilTempPhaseSuivante"][j:,:,:] = np.where(change, threshold, data["seuilTempPhaseSuivante"][j,:,:])
+        data["seuilTempPhasePrec"][j:,:,:] = np.where(
+            change & (phase >= 1), previous_threshold, data["seuilTempPhasePrec"][j,:,:])
+        # start and end of the photoperiodic phase
+        data["phasePhotoper"][j,:,:] = np.where(
+            change & ((phase == 2) | (phase == 3)), 1, data["phasePhotoper"][j,:,:])
+
+        return data
+
+    def _schedule(self, j, data, condition, paramVariete):
+        """
+        Computes the phase change days of the pixels initialized on day `j`.
+        """
+        shape = condition.shape
+        ddj = _remaining_days(data, "ddj", j)
+        day_length = _remaining_days(data, "dureeDuJour", j)
+        ddj = np.broadcast_to(ddj, ddj.shape[:1] + shape)[:, condition]
+        day_length = np.broadcast_to(day_length, day_length.shape[:1] + shape)[:, condition]
+        parameters = {name: _at_pixels(paramVariete[name], shape, condition) for name in
+                      ("SDJLevee", "SDJBVP", "SDJRPR", "SDJMatu1", "SDJMatu2", "PPCrit", "PPExp", "SeuilPP", "PPsens")}
+
+        schedule = phenology_schedule(ddj, day_length, parameters, dtype=self.thresholds.dtype)
+        self.days[:, condition] = np.where(schedule["days"] >= 0, j + schedule["days"], np.iinfo(np.int64).max)
+        self.thresholds[:, condition] = schedule["thresholds"]
+        self.previous_thresholds[:, condition] = schedule["previous_thresholds"]
+
+
+def phase_occupancy(j, data):
+    """
+    Counts the pixels in each phenological phase on day `j`, so that
+    procedures only needed in some phases can be skipped on days where no
+    pixel is in these phases.
+
+    Args:
+        j (int): index of the day
+        data (xarray.Dataset or SimulationState): simulation data
+
+    Returns:
+        np.ndarray: number of pixels in phases 0 to 7
+    """
+    num_phase = np.asarray(data["numPhase"][j,:,:])
+    return np.bincount(num_phase.astype(np.int64).ravel(), minlength=8)
+
+
+def season_over(j, data, valid=None, sowing_window=None):
+    """
+    Tells whether the crops of all pixels are over at the end of day `j`,
+    that is to say whether every pixel has reached harvest (phase 7) or,
+    when `sowing_window` is given, is still not initialized `sowing_window`
+    days after its sowing date.
+
+    Args:
+        j (int): index of the day
+        data (xarray.Dataset or SimulationState): simulation data
+        valid (np.ndarray, optional): boolean spatial mask of the pixels to
+            consider, as given by `valid_pixel_mask`. Defaults to None, in
+            which case all pixels are considered.
+        sowing_window (int, optional): number of days after the sowing date
+            after which pixels that are not initialized are considered as
+            never sown. Defaults to None, in which case they are considered
+            as still able to be sown.
+
+    Returns:
+        bool: whether the crops of all pixels are over
+    """
+    num_phase = np.asarray(data["numPhase"][j,:,:])
+    over = num_phase == 7
+    if sowing_window is not None:
+        over |= (num_phase == 0) & (j >= np.asarray(data["sowing_date"][j,:,:]) + sowing_window)
+    if valid is not None:
+        over |= ~valid
+    return bool(over.all())
+
+
 def calculate_daily_thermal_time(j, data, paramVariete):
     """calculating daily thermal time
     Translated from the EvalDegresJourSarrahV3 procedure of the phenologie.pas and exmodules.pas files of theSarra-H model, Pascal version.
@@ -579,7 +853,7 @@ def calculate_daily_thermal_time(j, data, paramVariete):
         _type_: _description_
     """
 
-    data["ddj"][j,:,:] = xr.where(
+    data["ddj"][j,:,:] = np.where(
         data["tpMoy"][j,:,:] <= paramVariete["TOpt2"],
         np.maximum(np.minimum(paramVariete["TOpt1"], data["tpMoy"][j,:,:]), paramVariete["TBase"]) - paramVariete["TBase"],
         (paramVariete["TOpt1"] - paramVariete["TBase"]) * (1 - ((np.minimum(paramVariete["TLim"], data["tpMoy"][j,:,:]) - paramVariete["TOpt2"]) / (paramVariete["TLim"] - paramVariete["TOpt2"]))),
@@ -647,7 +921,7 @@ def calculate_sum_of_thermal_time(j, data):
     Returns:
         _type_: _description_
     """
-    data["sdj"][j:,:,:] = xr.where(
+    data["sdj"][j:,:,:] = np.where(
         (j >= data["sowing_date"][j,:,:]) & (data["numPhase"][j,:,:] >= 1),
         data["sdj"][j-1,:,:] + data["ddj"][j,:,:],
         0,
@@ -2,10 +2,14 @@ from os import listdir
 from os.path import isfile, join
 import pandas as pd
 import datetime
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 import rasterio
 import os
 import rioxarray
 from tqdm import tqdm as tqdm
+from .fields import masked_constant_field, promote_fields
+from .regridding import grid_key, regrid
 import numpy as np
 import yaml
 import xarray as xr
@@ -17,25 +21,38 @@ from astral import LocationInfo
 
 
 
-def build_rainfall_files_df(rainfall_path, date_start, duration):
+# correspondance between AgERA5 variables and SARRA variables
+AgERA5_SARRA_correspondance = {
+    '10m_wind_speed_24_hour_mean':None,
+    '2m_temperature_24_hour_maximum':None,
+    '2m_temperature_24_hour_mean':'tpMoy',
+    '2m_temperature_24_hour_minimum':None,
+    'ET0Hargeaves':'ET0',
+    'solar_radiation_flux_daily':'rg',
+    'vapour_pressure_24_hour_mean':None,
+}
+
+
+
+
+def build_files_df(path):
     """
-    This function builds a dataframe containing the list of rainfall files
-    from the provided path, and the given date_start and duration.
-    
-    Helper function used in get_grid_size() and load_TAMSAT_data().
+    This function builds a dataframe containing the list of the daily raster
+    files of the provided path, named with a "_YYYY_MM_DD.tif" suffix, and
+    their dates, sorted by date.
 
     Args:
-        rainfall_path (_type_): _description_
+        path (str): path of the folder of the daily files
 
     Returns:
-        _type_: _description_
+        pandas.DataFrame: dataframe with "filename" and "date" columns
     """
     #rainfall_files = [f for f in listdir(rainfall_path) if isfile(join(rainfall_path, f))]
     # version that should be quicker
-    rainfall_files = [f for f in listdir(rainfall_path)]# if isfile(join(rainfall_path, f))]
-    rainfall_files_df = pd.DataFrame({"filename":rainfall_files}).sort_values("filename").reset_index(drop=True)
+    files = [f for f in listdir(path)]# if isfile(join(rainfall_path, f))]
+    files_df = pd.DataFrame({"filename":files}).sort_values("filename").reset_index(drop=True)
 
-    rainfall_files_df["date"] = rainfall_files_df.apply(
+    files_df["date"] = files_df.apply(
         lambda x: datetime.date(
             int(x["filename"].replace(".tif","").split("_")[-3]),
             int(x["filename"].replace(".tif","").split("_")[-2]),
@@ -44,6 +61,26 @@ def build_rainfall_files_df(rainfall_path, date_start, duration):
         axis=1,
     )
 
+    return files_df.sort_values("date").reset_index(drop=True)
+
+
+
+
+def build_rainfall_files_df(rainfall_path, date_start, duration):
+    """
+    This function builds a dataframe containing the list of rainfall files
+    from the provided path, and the given date_start and duration.
+    
+    Helper function used in get_grid_size() and load_TAMSAT_data().
+
+    Args:
+        rainfall_path (_type_): _description_
+
+    Returns:
+        _type_: _description_
+    """
+    rainfall_files_df = build_files_df(rainfall_path)
+
     rainfall_files_df = rainfall_files_df[(rainfall_files_df["date"]>=date_start) & (rainfall_files_df["date"]<date_start+datetime.timedelta(days=duration))].reset_index(drop=True)
 
     return rainfall_files_df
@@ -85,11 +122,46 @@ def get_grid_size(rainfall_path, date_start, duration):
 
 
 
+def load_raster_stack(file_paths, n_threads=None):
+    """
+    This function loads a list of single-band raster files sharing the same
+    grid, such as daily rainfall files, into a (time, y, x) float32 xarray
+    DataArray.
+
+    The stack is allocated once, and the files are read into it by a pool of
+    threads, as rasterio releases the GIL while reading. Coordinates, CRS and
+    attributes are taken from the first file.
+
+    Args:
+        file_paths (list): paths of the raster files, in time order
+        n_threads (int, optional): number of reading threads. Defaults to
+            None, in which case the default of ThreadPoolExecutor is used.
+
+    Returns:
+        xarray.DataArray: stack of the rasters
+    """
+    template = rioxarray.open_rasterio(file_paths[0]).squeeze("band").drop_vars(["band"])
+    stack = np.empty((len(file_paths),) + template.shape, dtype=np.float32)
+
+    def read(i):
+        with rasterio.open(file_paths[i]) as src:
+            if src.shape != template.shape:
+                raise ValueError("{} does not have the grid of {}".format(file_paths[i], file_paths[0]))
+            src.read(1, out=stack[i])
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        list(executor.map(read, range(len(file_paths))))
+
+    return xr.DataArray(stack, dims=("time",) + template.dims, coords=template.coords, attrs=template.attrs)
+
+
+
+
 def load_TAMSAT_data(data, TAMSAT_path, date_start, duration):
     """
-    This function loops over the rainfall raster files, and loads them into a
-    xarray DataArray, which is then added to the rain data dictionary. It is
-    tailored to the TAMSAT rainfall data files, hence its name.
+    This function loads the rainfall raster files into a xarray DataArray
+    with load_raster_stack, which is then added to the rain data dictionary.
+    It is tailored to the TAMSAT rainfall data files, hence its name.
 
     Args:
         data (_type_): _description_
@@ -103,16 +175,9 @@ def load_TAMSAT_data(data, TAMSAT_path, date_start, duration):
 
     TAMSAT_files_df = build_rainfall_files_df(TAMSAT_path, date_start, duration)
 
-    for i in range(len(TAMSAT_files_df)):
-
-        dataarray = rioxarray.open_rasterio(os.path.join(TAMSAT_path,TAMSAT_files_df.loc[i,"filename"]))
-        dataarray = dataarray.squeeze("band").drop_vars(["band", "spatial_ref"])
-        dataarray.attrs = {}
-
-        try:
-            dataarray_full = xr.concat([dataarray_full, dataarray],"time")
-        except:
-            dataarray_full = dataarray
+    dataarray_full = load_raster_stack([os.path.join(TAMSAT_path, filename) for filename in TAMSAT_files_df["filename"]])
+    dataarray_full = dataarray_full.drop_vars(["spatial_ref"])
+    dataarray_full.attrs = {}
 
     dataarray_full.rio.write_crs(4326,inplace=True)
     data["rain"] = dataarray_full
@@ -151,16 +216,21 @@ def load_TAMSAT_data_fast(data, rainfall_data_path, date_start, duration):
 
 
 
-def load_AgERA5_data(data, AgERA5_data_path, date_start, duration):
+def load_AgERA5_data(data, AgERA5_data_path, date_start, duration, regrid_cache_dir=None):
     """
-    This function loops over the AgERA5 raster files, and loads them into 
-    xarray DataArray, which are then added to the data dictionary.
+    This function loads the AgERA5 raster files of each variable into a
+    xarray DataArray with load_raster_stack, regrids it to the grid of the
+    data, and adds it to the data dictionary.
+
+    The regridding mapping is computed once for all variables, see regrid.
 
     Args:
         data (_type_): _description_
         AgERA5_data_path (_type_): _description_
         date_start (_type_): _description_
         duration (_type_): _description_
+        regrid_cache_dir (str, optional): folder where the regridding mapping
+            is stored, to be reused by later loadings. Defaults to None.
 
     Returns:
         _type_: _description_
@@ -170,56 +240,22 @@ def load_AgERA5_data(data, AgERA5_data_path, date_start, duration):
     # getting list of variables
     AgERA5_variables = [path.split("/")[-1] for path in [x[0] for x in os.walk(AgERA5_data_path)][1:]]
 
-    # building a dictionary of dataframes containing the list of files for each variable
+    # building a dictionary of dataframes containing the list of files of the simulation period for each variable
     AgERA5_files_df_collection = {}
 
     for variable in AgERA5_variables:
-        #AgERA5_files = [f for f in listdir(os.path.join(AgERA5_data_path,variable)) if isfile(join(os.path.join(AgERA5_data_path,variable), f))]
-        # alternate version that should be quicker
-        AgERA5_files = [f for f in listdir(os.path.join(AgERA5_data_path,variable))]
-        AgERA5_files_df_collection[variable] = pd.DataFrame({"filename":AgERA5_files})
-
-        AgERA5_files_df_collection[variable]["date"] = AgERA5_files_df_collection[variable].apply(
-            lambda x: datetime.date(
-                int(x["filename"].replace(".tif","").split("_")[-3]),
-                int(x["filename"].replace(".tif","").split("_")[-2]),
-                int(x["filename"].replace(".tif","").split("_")[-1]),
-            ),
-            axis=1,
-        )
-
-
-    # building a dictionary of correspondance between AgERA5 variables and SARRA variables
-    AgERA5_SARRA_correspondance = {
-        '10m_wind_speed_24_hour_mean':None,
-        '2m_temperature_24_hour_maximum':None,
-        '2m_temperature_24_hour_mean':'tpMoy',
-        '2m_temperature_24_hour_minimum':None,
-        'ET0Hargeaves':'ET0',
-        'solar_radiation_flux_daily':'rg',
-        'vapour_pressure_24_hour_mean':None,
-    }
+        AgERA5_files_df_collection[variable] = build_rainfall_files_df(os.path.join(AgERA5_data_path,variable), date_start, duration)
+
 
     # loading the data
     for variable in tqdm(AgERA5_variables) :
         print(variable)
         if AgERA5_SARRA_correspondance[variable] != None :
 
-            try:
-                del dataarray_full
-            except:
-                pass
-            
-            for i in range(duration) :
-                dataarray = rioxarray.open_rasterio(os.path.join(AgERA5_data_path,variable,AgERA5_files_df_collection[variable].loc[i,"filename"]))
-                dataarray = dataarray.rio.reproject_match(data, nodata=np.nan)
-                dataarray = dataarray.squeeze("band").drop_vars(["band"])
-                # TODO: add dataarray.attrs = {} to precise units and long_name
-
-                try:
-                    dataarray_full = xr.concat([dataarray_full, dataarray],"time")
-                except:
-                    dataarray_full = dataarray
+            # all days share the same grid, so the whole stack is regridded at once
+            dataarray_full = load_raster_stack([os.path.join(AgERA5_data_path,variable,filename) for filename in AgERA5_files_df_collection[variable]["filename"]])
+            dataarray_full = regrid(dataarray_full, data, cache_dir=regrid_cache_dir)
+            # TODO: add dataarray.attrs = {} to precise units and long_name
 
             # storing the variable in the data dictionary
             data[AgERA5_SARRA_correspondance[variable]] = dataarray_full
@@ -233,7 +269,7 @@ def load_AgERA5_data(data, AgERA5_data_path, date_start, duration):
 
 
 
-def load_AgERA5_data_fast_dask(data, AgERA5_data_path, date_start, duration):
+def load_AgERA5_data_fast_dask(data, AgERA5_data_path, date_start, duration, regrid_cache_dir=None):
     """
     This function loops over the AgERA5 raster files, and loads them into 
     xarray DataArray, which are then added to the data dictionary.
@@ -243,6 +279,8 @@ def load_AgERA5_data_fast_dask(data, AgERA5_data_path, date_start, duration):
         AgERA5_data_path (_type_): _description_
         date_start (_type_): _description_
         duration (_type_): _description_
+        regrid_cache_dir (str, optional): folder where the regridding mapping
+            is stored, see regrid. Defaults to None.
 
     Returns:
         _type_: _description_
@@ -256,32 +294,8 @@ def load_AgERA5_data_fast_dask(data, AgERA5_data_path, date_start, duration):
     AgERA5_files_df_collection = {}
 
     for variable in AgERA5_variables:
-        #AgERA5_files = [f for f in listdir(os.path.join(AgERA5_data_path,variable)) if isfile(join(os.path.join(AgERA5_data_path,variable), f))]
-        # alternate version that should be quicker
-        AgERA5_files = [f for f in listdir(os.path.join(AgERA5_data_path,variable))]
-        AgERA5_files_df_collection[variable] = pd.DataFrame({"filename":AgERA5_files})
-
-        AgERA5_files_df_collection[variable]["date"] = AgERA5_files_df_collection[variable].apply(
-            lambda x: datetime.date(
-                int(x["filename"].replace(".tif","").split("_")[-3]),
-                int(x["filename"].replace(".tif","").split("_")[-2]),
-                int(x["filename"].replace(".tif","").split("_")[-1]),
-            ),
-            axis=1,
-        )
-
-        AgERA5_files_df_collection[variable] = AgERA5_files_df_collection[variable][(AgERA5_files_df_collection[variable]["date"]>=date_start) & (AgERA5_files_df_collection[variable]["date"]<date_start+datetime.timedelta(days=duration))].reset_index(drop=True)
-
-    # building a dictionary of correspondance between AgERA5 variables and SARRA variables
-    AgERA5_SARRA_correspondance = {
-        '10m_wind_speed_24_hour_mean':None,
-        '2m_temperature_24_hour_maximum':None,
-        '2m_temperature_24_hour_mean':'tpMoy',
-        '2m_temperature_24_hour_minimum':None,
-        'ET0Hargeaves':'ET0',
-        'solar_radiation_flux_daily':'rg',
-        'vapour_pressure_24_hour_mean':None,
-    }
+        # files are sorted by date, so that days are stacked in order
+        AgERA5_files_df_collection[variable] = build_rainfall_files_df(os.path.join(AgERA5_data_path,variable), date_start, duration)
 
     # loading the data
     for variable in tqdm(AgERA5_variables) :
@@ -306,13 +320,13 @@ def load_AgERA5_data_fast_dask(data, AgERA5_data_path, date_start, duration):
 
             dataarray_full = xr.open_mfdataset([os.path.join(AgERA5_data_path,variable,AgERA5_files_df_collection[variable].loc[i,"filename"]) for i in range(len(AgERA5_files_df_collection[variable]))], concat_dim="time", combine="nested", chunks={"x":1000,"y":1000})
             dataarray_full = dataarray_full.squeeze("band").drop_vars(["band"])
-            dataarray_full = dataarray_full.rio.reproject_match(data, nodata=np.nan)
+            dataarray_full = regrid(dataarray_full["band_data"], data, cache_dir=regrid_cache_dir)
 
             
             dataarray_full.rio.write_crs(4326,inplace=True)
             
             
-            data[AgERA5_SARRA_correspondance[variable]] = dataarray_full["band_data"]
+            data[AgERA5_SARRA_correspondance[variable]] = dataarray_full
 
             
     # unit conversion for solar radiation (kJ/m2 as provided by AgERA5 to MJ/m2/day)
@@ -416,15 +430,212 @@ def load_YAML_parameters(file_paramVariete, file_paramITK, file_paramTypeSol):
 
 
 def initialize_default_irrigation(data):
+    """
+    This function initializes the default irrigation scheme, without
+    irrigation.
+
+    Irrigation is returned as a writable array, so that an irrigation scheme
+    can be written into it, such as `data["irrigation"][j:,:,:] = ...`.
+
+    Args:
+        data (xarray.Dataset): simulation data
+
+    Returns:
+        xarray.Dataset: simulation data
+    """
     # default irrigation scheme 
-    data["irrigation"] = data["rain"] * 0
+    data["irrigation"] = masked_constant_field(data["rain"], 0)
     data["irrigation"].attrs = {"units":"mm", "long_name":"irrigation"}
+    return promote_fields(data)
+
+
+
+
+def build_soil_lut(soil_variables, path_soil_type_correspondance="../data/assets/TypeSol_Moy13_HWSD.csv"):
+    """
+    This function builds lookup tables of soil physical properties indexed by
+    soil class Id, from the correspondance table of soil classes.
+
+    The tables are stored as a dense (property, class Id) float32 array, so
+    that maps of all properties are obtained from a map of soil classes with
+    a single vectorized take, see map_soil_properties. Class 0 and Ids absent
+    from the table are NaN.
+
+    Args:
+        soil_variables (dict): names of the columns of the correspondance
+            table, by name of soil property in the dataset
+        path_soil_type_correspondance (str, optional): path of the
+            correspondance table. Defaults to
+            "../data/assets/TypeSol_Moy13_HWSD.csv".
+
+    Returns:
+        np.ndarray: (property, class Id) lookup table
+    """
+    df_soil_type_correspondance = pd.read_csv(path_soil_type_correspondance, sep=";", skiprows=1, decimal=",")
+    ids = df_soil_type_correspondance["Id"].to_numpy().astype(np.int64)
+
+    lut = np.full((len(soil_variables), ids.max() + 1), np.nan, dtype=np.float32)
+    for i, column in enumerate(soil_variables.values()):
+        lut[i, ids] = df_soil_type_correspondance[column].to_numpy(dtype=np.float64)
+    lut[:, 0] = np.nan
+
+    return lut
+
+
+
+
+def map_soil_properties(data, soil_variables, lut):
+    """
+    This function creates maps of soil properties from the map of soil
+    classes of the dataset, with the lookup table of build_soil_lut, and adds
+    them to the dataset. Pixels with a NaN or unknown soil class get NaN
+    properties.
+
+    Args:
+        data (xarray.Dataset): dataset with a "soil_type" variable
+        soil_variables (dict): names of the columns of the correspondance
+            table, by name of soil property in the dataset, as given to
+            build_soil_lut
+        lut (np.ndarray): lookup table built by build_soil_lut
+
+    Returns:
+        xarray.Dataset: dataset
+    """
+    soil_type = data["soil_type"].to_numpy()
+    classes = np.nan_to_num(soil_type, nan=0).astype(np.int64)
+    classes[(classes < 0) | (classes >= lut.shape[1])] = 0
+
+    # all properties are mapped at once
+    soil_properties = lut.take(classes, axis=1)
+    for i, soil_variable in enumerate(soil_variables):
+        data[soil_variable] = (data["soil_type"].dims, soil_properties[i])
+        # TODO: add dataarray.attrs = {} to precise units and long_name
+
     return data
 
 
 
 
-def load_iSDA_soil_data(data, grid_width, grid_height): 
+# checksums of the files already read in this process, by path, size and modification time
+_file_checksums = {}
+
+
+def file_checksum(path):
+    """
+    This function computes the SHA-1 checksum of a file, computed once per
+    version of the file in a process.
+
+    Args:
+        path (str): path of the file
+
+    Returns:
+        str: checksum of the file
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_checksums:
+        checksum = hashlib.sha1()
+        with open(path, "rb") as file:
+            for block in iter(lambda: file.read(1 << 20), b""):
+                checksum.update(block)
+        _file_checksums[key] = checksum.hexdigest()
+    return _file_checksums[key]
+
+
+
+
+def default_cache_dir():
+    """
+    This function returns the per-user folder where derived data, such as
+    soil layers, is cached : "sarra_py" in the folder given by the
+    XDG_CACHE_HOME environment variable, or in ~/.cache.
+
+    Returns:
+        str: path of the cache folder
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "sarra_py")
+
+
+
+
+def soil_layers_cache_path(data, cache_dir, name, asset_paths):
+    """
+    This function returns the path of the cache file of the soil layers
+    derived from the asset files for the grid of the data, keyed by the grid
+    (CRS, transform and shape) and the checksums of the asset files, so that
+    a cache file is never reused for another grid or other assets.
+
+    Args:
+        data (xarray.Dataset): data on the target grid
+        cache_dir (str): folder of the cache files, None for the
+            "soil_layers" folder of default_cache_dir, or False to disable
+            the cache
+        name (str): name of the soil loading function
+        asset_paths (list): paths of the files the soil layers are derived
+            from
+
+    Returns:
+        str: path of the cache file, or None if cache_dir is False
+    """
+    if cache_dir is False:
+        return None
+    if cache_dir is None:
+        cache_dir = os.path.join(default_cache_dir(), "soil_layers")
+    key = hashlib.sha1(repr([grid_key(data)] + [file_checksum(path) for path in asset_paths]).encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, "{}_{}.nc".format(name, key))
+
+
+
+
+def save_soil_layers(data, soil_layers, cache_path):
+    """
+    This function saves soil layers of the data to a cache file. The file is
+    written under a temporary name and then renamed, so that processes
+    sharing the cache never read a partially written file. Cache folders
+    that can not be written to are skipped, the soil layers being derived
+    again by the next call.
+
+    Args:
+        data (xarray.Dataset): data
+        soil_layers (list): names of the soil layers
+        cache_path (str): path of the cache file
+    """
+    temporary_path = "{}.{}.tmp".format(cache_path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        data[soil_layers].to_netcdf(temporary_path)
+        os.replace(temporary_path, cache_path)
+    except OSError:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+
+
+def load_soil_layers(data, cache_path):
+    """
+    This function adds the soil layers of a cache file to the data.
+
+    Args:
+        data (xarray.Dataset): data
+        cache_path (str): path of the cache file
+
+    Returns:
+        xarray.Dataset: data
+    """
+    with xr.open_dataset(cache_path) as cached:
+        for soil_layer in cached.data_vars:
+            variable = cached[soil_layer].variable.load()
+            # the CRS of the data is kept as a coordinate
+            variable.attrs.pop("grid_mapping", None)
+            data[soil_layer] = variable
+    return data
+
+
+
+
+def load_iSDA_soil_data(data, grid_width, grid_height, cache_dir=None): 
 
     """
     This function loads iSDA soil data and crop to the area of interest remark :
@@ -444,11 +655,31 @@ def load_iSDA_soil_data(data, grid_width, grid_height):
     physical properties is loaded. Maps of soil physical properties are then
     created and added to the xarray dataset.
 
+    As the soil layers only depend on the grid and on the asset files, they
+    are stored in a per-user cache folder and reused by later calls for the
+    same grid, see soil_layers_cache_path.
+
+    Args:
+        data (xarray.Dataset): data on the target grid
+        grid_width (int): width of the grid
+        grid_height (int): height of the grid
+        cache_dir (str, optional): folder of the soil layers cache files,
+            or False to disable the cache. Defaults to None, in which case
+            the "soil_layers" folder of default_cache_dir is used.
+
     Returns:
         _type_: _description_
     """
-    # load soil depth data, using the same code as in the load_iSDA_soil_data_alternate function
     soil_depth_file_path = "../data/assets/gyga_af_erzd__m_1km.tif"
+    soil_type_file_path = "../data/assets/iSDA_at_TAMSAT_resolution_zeroclass_1E6.tif"
+    path_soil_type_correspondance = "../data/assets/TypeSol_Moy13_HWSD.csv"
+
+    # reusing the soil layers already derived for this grid
+    cache_path = soil_layers_cache_path(data, cache_dir, "iSDA_soil_data", [soil_depth_file_path, soil_type_file_path, path_soil_type_correspondance])
+    if cache_path is not None and os.path.exists(cache_path):
+        return load_soil_layers(data, cache_path)
+
+    # load soil depth data, using the same code as in the load_iSDA_soil_data_alternate function
     dataarray = rioxarray.open_rasterio(soil_depth_file_path)
     dataarray = dataarray.astype('float32') # converting to float32 to allow for NaNs
     dataarray = dataarray.rio.reproject_match(data, nodata=np.nan) # reprojecting to match the base data
@@ -460,7 +691,6 @@ def load_iSDA_soil_data(data, grid_width, grid_height):
 
 
     # load raster data
-    soil_type_file_path = "../data/assets/iSDA_at_TAMSAT_resolution_zeroclass_1E6.tif"
     dataarray = rioxarray.open_rasterio(soil_type_file_path)
 
     # # determine the boundaries of the data xarray before cropping
@@ -483,10 +713,6 @@ def load_iSDA_soil_data(data, grid_width, grid_height):
     data["soil_type"] = data["soil_type"] / 1000000 # conversion from 1E6 to 1E0
     data["soil_type"] = data["soil_type"].astype("float32")
 
-    # load correspondance table
-    path_soil_type_correspondance = "../data/assets/TypeSol_Moy13_HWSD.csv"
-    df_soil_type_correspondance = pd.read_csv(path_soil_type_correspondance, sep=";", skiprows=1)
-
     # correspondance between soil properties naming in the csv file and in the dataset
     soil_variables = {
         "epaisseurProf" : "EpaisseurProf",
@@ -499,23 +725,21 @@ def load_iSDA_soil_data(data, grid_width, grid_height):
     }
 
     # create maps of soil properties and add them to the dataset
-    for soil_variable in soil_variables :
-        dict_values = dict(zip(df_soil_type_correspondance["Id"], df_soil_type_correspondance[soil_variables[soil_variable]]))
-        dict_values[0] = np.nan
-        soil_types_converted = np.reshape([dict_values[x.astype(int)] for x in data["soil_type"].to_numpy().flatten()], (grid_width, grid_height))
-        data[soil_variable] = (data["soil_type"].dims,soil_types_converted)
-        data[soil_variable] = data[soil_variable].astype("float32")
-        # TODO: add dataarray.attrs = {} to precise units and long_name
+    lut = build_soil_lut(soil_variables, path_soil_type_correspondance)
+    data = map_soil_properties(data, soil_variables, lut)
 
     # converting pourcRuiss to decimal %
     data["runoff_rate"] = data["runoff_rate"] / 100
 
+    if cache_path is not None:
+        save_soil_layers(data, ["profRu", "soil_type"] + list(soil_variables), cache_path)
+
     return data
 
 
 
 
-def load_iSDA_soil_data_alternate(data, grid_width, grid_height): 
+def load_iSDA_soil_data_alternate(data, grid_width, grid_height, cache_dir=None): 
 
     """
     This function loads iSDA soil data and crop to the area of interest remark :
@@ -535,14 +759,35 @@ def load_iSDA_soil_data_alternate(data, grid_width, grid_height):
     physical properties is loaded. Maps of soil physical properties are then
     created and added to the xarray dataset.
 
+    As the soil layers only depend on the grid and on the asset files, they
+    are stored in a per-user cache folder and reused by later calls for the
+    same grid, see soil_layers_cache_path.
+
+    Args:
+        data (xarray.Dataset): data on the target grid
+        grid_width (int): width of the grid
+        grid_height (int): height of the grid
+        cache_dir (str, optional): folder of the soil layers cache files,
+            or False to disable the cache. Defaults to None, in which case
+            the "soil_layers" folder of default_cache_dir is used.
+
     Returns:
         _type_: _description_
     """
+    soil_depth_file_path = "../data/assets/gyga_af_erzd__m_1km.tif"
+    soil_texture_class_file_path = "../data/assets/iSDA_at_TAMSAT_resolution_zeroclass_1E6.tif"
+    path_soil_type_correspondance = "../data/assets/TypeSol_Moy13_HWSD.csv"
+    soil_RZPAWC_file_path = "../data/assets/gyga_af_agg_erzd_tawcpf23mm__m_1km.tif"
+
+    # reusing the soil layers already derived for this grid
+    cache_path = soil_layers_cache_path(data, cache_dir, "iSDA_soil_data_alternate", [soil_depth_file_path, soil_texture_class_file_path, path_soil_type_correspondance, soil_RZPAWC_file_path])
+    if cache_path is not None and os.path.exists(cache_path):
+        return load_soil_layers(data, cache_path)
+
     # loading soil depth data
     # soil data is Africa SoilGrids - Root zone depth (cm) 
     # reference of the dataset is https://data.isric.org/geonetwork/srv/fre/catalog.search#/metadata/c77d1209-56e9-4cac-b76e-bbf6c7e3a617
     # reference publication : https://doi.org/10.1016/j.geoderma.2018.02.046
-    soil_depth_file_path = "../data/assets/gyga_af_erzd__m_1km.tif"
     dataarray = rioxarray.open_rasterio(soil_depth_file_path)
     dataarray = dataarray.astype('float32') # converting to float32 to allow for NaNs
     dataarray = dataarray.rio.reproject_match(data, nodata=np.nan) # reprojecting to match the base data
@@ -567,7 +812,6 @@ def load_iSDA_soil_data_alternate(data, grid_width, grid_height):
     # soil data is adapted from iSDA Africa - USDA Soil Texture Class
     # reference of the original dataset is https://zenodo.org/record/4094616
     # reference of the adapted dataset is https://doi.org/10.18167/DVN1/YSVTS2 
-    soil_texture_class_file_path = "../data/assets/iSDA_at_TAMSAT_resolution_zeroclass_1E6.tif"
     dataarray = rioxarray.open_rasterio(soil_texture_class_file_path)
     dataarray = dataarray.rio.reproject_match(data, nodata=np.nan) # reprojecting to match the base data
     dataarray = dataarray.squeeze("band").drop_vars(["band"]) # removing the band dimension and variable
@@ -577,10 +821,6 @@ def load_iSDA_soil_data_alternate(data, grid_width, grid_height):
     data["soil_type"] = data["soil_type"] / 1000000 # conversion from 1E6 to 1E0
     data["soil_type"] = data["soil_type"].astype("float32")
 
-    # load correspondance table
-    path_soil_type_correspondance = "../data/assets/TypeSol_Moy13_HWSD.csv"
-    df_soil_type_correspondance = pd.read_csv(path_soil_type_correspondance, sep=";", skiprows=1)
-
     # correspondance between soil properties naming in the csv file and in the dataset
     soil_variables = {
         "runoff_threshold" : "SeuilRuiss", # utilisé dans bilan_hydro.estimate_runoff pour le calcul de lr
@@ -588,13 +828,8 @@ def load_iSDA_soil_data_alternate(data, grid_width, grid_height):
     }
 
     # create maps of soil properties and add them to the dataset
-    for soil_variable in soil_variables :
-        dict_values = dict(zip(df_soil_type_correspondance["Id"], df_soil_type_correspondance[soil_variables[soil_variable]]))
-        dict_values[0] = np.nan
-        soil_types_converted = np.reshape([dict_values[x.astype(int)] for x in data["soil_type"].to_numpy().flatten()], (grid_width, grid_height))
-        data[soil_variable] = (data["soil_type"].dims,soil_types_converted)
-        data[soil_variable] = data[soil_variable].astype("float32")
-        # TODO: add dataarray.attrs = {} to precise units and long_name
+    lut = build_soil_lut(soil_variables, path_soil_type_correspondance)
+    data = map_soil_properties(data, soil_variables, lut)
 
     # converting pourcRuiss to decimal %
     data["runoff_rate"] = data["runoff_rate"] / 100
@@ -602,7 +837,6 @@ def load_iSDA_soil_data_alternate(data, grid_width, grid_height):
 
 
     # loading RU
-    soil_RZPAWC_file_path = "../data/assets/gyga_af_agg_erzd_tawcpf23mm__m_1km.tif"
     dataarray = rioxarray.open_rasterio(soil_RZPAWC_file_path)
     dataarray = dataarray.astype('float32')
     dataarray = dataarray.rio.reproject_match(data, nodata=np.nan) # reprojecting to match the base data
@@ -614,6 +848,9 @@ def load_iSDA_soil_data_alternate(data, grid_width, grid_height):
     #calculating RU (mm/m)
     data["ru"] = data["RZPAWC"] / (data["profRu"]/1000)
 
+    if cache_path is not None:
+        save_soil_layers(data, ["profRu", "epaisseurSurf", "stockIniProf", "soil_type", "runoff_threshold", "runoff_rate", "RZPAWC", "ru"], cache_path)
+
     return data
 
 
@@ -641,18 +878,118 @@ def calc_day_length(day, lat):
 
 
 
-def calc_day_length_raster_fast(data, date_start, duration):
+def _sun_declination_and_eq_of_time(juliancentury):
+    """
+    This function computes the declination of the sun (degrees) and the
+    equation of time (minutes) for arrays of julian centuries, with the
+    NOAA formulas used by astral.
+    """
+    l0 = (280.46646 + juliancentury * (36000.76983 + 0.0003032 * juliancentury)) % 360.0
+    m = np.radians(357.52911 + juliancentury * (35999.05029 - 0.0001537 * juliancentury))
+    c = (
+        np.sin(m) * (1.914602 - juliancentury * (0.004817 + 0.000014 * juliancentury))
+        + np.sin(m + m) * (0.019993 - 0.000101 * juliancentury)
+        + np.sin(m + m + m) * 0.000289
+    )
+    omega = np.radians(125.04 - 1934.136 * juliancentury)
+    apparent_long = l0 + c - 0.00569 - 0.00478 * np.sin(omega)
+    seconds = 21.448 - juliancentury * (46.815 + juliancentury * (0.00059 - juliancentury * 0.001813))
+    obliquity = 23.0 + (26.0 + seconds / 60.0) / 60.0 + 0.00256 * np.cos(omega)
+    declination = np.degrees(np.arcsin(np.sin(np.radians(obliquity)) * np.sin(np.radians(apparent_long))))
+
+    e = 0.016708634 - juliancentury * (0.000042037 + 0.0000001267 * juliancentury)
+    y = np.tan(np.radians(obliquity) / 2.0) ** 2
+    l0 = np.radians(l0)
+    eq_of_time = np.degrees(
+        y * np.sin(2.0 * l0)
+        - 2.0 * e * np.sin(m)
+        + 4.0 * e * y * np.sin(m) * np.cos(2.0 * l0)
+        - 0.5 * y * y * np.sin(4.0 * l0)
+        - 1.25 * e * e * np.sin(2.0 * m)
+    ) * 4.0
+
+    return declination, eq_of_time
+
 
-    vectorized_func = np.vectorize(calc_day_length)
 
-    days = np.array([date_start + datetime.timedelta(days=i) for i in range(duration)])[...,np.newaxis]
-    latitudes = np.array(data["y"])[np.newaxis,...]
 
-    result = vectorized_func(days, latitudes)
+def day_length(dates, latitudes):
+    """
+    This function computes the day length, from sunrise to sunset, for
+    arrays of dates and latitudes broadcast against each other.
+
+    It is a vectorized version of calc_day_length, using the same closed-form
+    astronomical formulas as astral (NOAA solar equations, apparent radius of
+    the sun and atmospheric refraction at the horizon, times truncated to the
+    second), at longitude 0. Where the sun does not rise or does not set, the
+    day length is 0 or 24 hours, where astral raises an error.
+
+    Args:
+        dates (np.ndarray): dates, as datetime.date or np.datetime64 values
+        latitudes (np.ndarray): latitudes, in degrees
+
+    Returns:
+        np.ndarray: day length, in hours
+    """
+    # julian day of the start of each day
+    julianday = np.asarray(dates, dtype="datetime64[D]").astype(np.int64) + 2440587.5
+    latitude = np.radians(np.clip(np.asarray(latitudes, dtype=np.float64), -89.8, 89.8))
+
+    # zenith of the sun at sunrise and sunset, corrected for refraction
+    zenith = 90.0 + 0.26666666666666666
+    elevation = 90.0 - zenith
+    refraction = (1735.0 + elevation * (-518.2 + elevation * (103.4 + elevation * (-12.79 + elevation * 0.711)))) / 3600.0
+    cos_zenith = np.cos(np.radians(zenith + refraction))
+
+    def time_of_transit(direction):
+        adjustment = 0.0
+        for _ in range(2):
+            declination, eq_of_time = _sun_declination_and_eq_of_time((julianday + adjustment - 2451545.0) / 36525.0)
+            declination = np.radians(declination)
+            h = (cos_zenith - np.sin(latitude) * np.sin(declination)) / (np.cos(latitude) * np.cos(declination))
+            hour_angle = direction * np.arccos(np.clip(h, -1.0, 1.0))
+            offset = -np.degrees(hour_angle) * 4.0 - eq_of_time
+            offset = np.where(offset < -720.0, offset + 1440, offset)
+            minutes = 720.0 + offset
+            adjustment = minutes / 1440.0
+        # truncation to the microsecond, as done by astral
+        seconds = minutes * 60
+        return np.floor(seconds) * 1_000_000 + np.floor((seconds - np.floor(seconds)) * 1_000_000)
 
-    # we will first define an empty array of the same shape as the rain array
-    data["dureeDuJour"] = (data["rain"].dims, np.zeros(data["rain"].shape))
-    data["dureeDuJour"].values = np.repeat(result[...,np.newaxis], data["dureeDuJour"].shape[2], axis=2)
+    microseconds = time_of_transit(-1.0) - time_of_transit(1.0)
+    return np.floor(microseconds / 1_000_000) / 3600
+
+
+
+
+def calc_day_length_raster_fast(data, date_start, duration):
+    """
+    This function computes the day length of each day of the simulation and
+    each latitude of the grid with day_length, and adds it to the dataset.
+
+    As the day length only depends on the day and on the latitude, the
+    (time, y) values are broadcast along x without being copied. On a
+    dataset of sites, see `sites_dataset`, "y" holds the latitude of each
+    site and the values are given along the "site" dimension.
+
+    Args:
+        data (xarray.Dataset): dataset
+        date_start (datetime.date): first day of the simulation
+        duration (int): number of days of the simulation
+
+    Returns:
+        xarray.Dataset: dataset
+    """
+    days = np.datetime64(date_start, "D") + np.arange(duration)
+    result = day_length(days[:, np.newaxis], np.asarray(data["y"])[np.newaxis, :])
+
+    # broadcasting the (time, y) values to the dimensions of the rain array
+    dims = data["rain"].dims
+    if "x" not in dims:
+        data["dureeDuJour"] = (dims, result)
+        return data
+    values = result[:, :, np.newaxis] if dims.index("y") < dims.index("x") else result[:, np.newaxis, :]
+    data["dureeDuJour"] = (dims, np.broadcast_to(values, data["rain"].shape))
 
     return data
 
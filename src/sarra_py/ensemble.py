@@ -0,0 +1,247 @@
+import datetime
+
+import numpy as np
+import xarray as xr
+
+from .bilan_carbo import initialize_simulation
+from .bilan_pheno import calculate_once_daily_thermal_time
+from .data_preparation import initialize_default_irrigation
+
+
+# parameters used to prepare the simulation dataset, members differing by
+# these parameters are initialized separately
+INITIALIZATION_PARAMETERS = [
+    "DateSemis", "irrigAuto", "biomIniMc", "profRacIni", "densite", "densOpti", "densiteA", "densiteP",
+    "TBase", "TLim", "TOpt1", "TOpt2",
+]
+
+# parameters tested in the control flow of the procedures, which must be the
+# same for all members
+FIXED_PARAMETERS = ["densOpti", "NI", "irrigAuto"]
+
+
+def _is_member_values(value):
+    return isinstance(value, (list, tuple, np.ndarray)) and np.ndim(value) == 1
+
+
+def ensemble_size(*parameter_sets):
+    """
+    Returns the number of members of an ensemble simulation, given by the
+    length of the parameters given as 1D arrays (or lists).
+
+    Args:
+        *parameter_sets (dict): parameter dictionaries, such as paramVariete
+            and paramITK
+
+    Returns:
+        int: number of members, or None if all parameters are scalars
+    """
+    sizes = {len(value) for parameters in parameter_sets for value in parameters.values() if _is_member_values(value)}
+    if len(sizes) > 1:
+        raise ValueError("all member parameters must have the same length, got {}".format(sorted(sizes)))
+    return sizes.pop() if sizes else None
+
+
+def member_parameters(parameters, member):
+    """
+    Returns the parameters of one member of an ensemble.
+
+    Args:
+        parameters (dict): parameter dictionary, with 1D arrays for the
+            parameters varying between members
+        member (int): index of the member
+
+    Returns:
+        dict: parameter dictionary with scalar values
+    """
+    values = {}
+    for name, value in parameters.items():
+        if _is_member_values(value):
+            value = value[member]
+            # numpy scalars would change the type promotion of the procedures
+            value = value.item() if isinstance(value, np.generic) else value
+        values[name] = value
+    return values
+
+
+def broadcast_parameters(parameters, n_dims):
+    """
+    Reshapes the parameters varying between members so that they broadcast
+    against the (member, ...) values of a day of the simulation.
+
+    Member values are stored as float32, the type of the variables of the
+    simulation, so that they are combined with the variables as scalar
+    parameters are.
+
+    Args:
+        parameters (dict): parameter dictionary, with 1D arrays for the
+            parameters varying between members
+        n_dims (int): number of spatial dimensions of the values of a day
+
+    Returns:
+        dict: parameter dictionary
+    """
+    values = {}
+    for name, value in parameters.items():
+        if _is_member_values(value):
+            if name in FIXED_PARAMETERS:
+                raise ValueError("{} must be the same for all members".format(name))
+            dtype = np.float32 if np.issubdtype(np.asarray(value).dtype, np.number) else None
+            value = np.asarray(value, dtype=dtype).reshape((-1,) + (1,) * n_dims)
+        values[name] = value
+    return values
+
+
+def initialize_ensemble(data, grid_width, grid_height, duration, paramVariete, paramITK, date_start):
+    """
+    Prepares the simulation dataset of an ensemble simulation, in which
+    paramVariete and paramITK entries may be 1D arrays over the members.
+
+    The dataset is prepared with `initialize_simulation`,
+    `initialize_default_irrigation` and `calculate_once_daily_thermal_time`,
+    once for each distinct set of initialization parameters. Variables that
+    differ between members get a "member" dimension, the other variables are
+    shared by all members.
+
+    Args:
+        data (xarray.Dataset): base data
+        grid_width (int): width of the grid
+        grid_height (int): height of the grid
+        duration (int): number of days of the simulation
+        paramVariete (dict): crop variety parameters
+        paramITK (dict): crop management parameters
+        date_start (datetime.date): first day of the simulation
+
+    Returns:
+        xarray.Dataset: simulation dataset
+    """
+    members = ensemble_size(paramVariete, paramITK) or 1
+
+    def initialize(member):
+        variete = member_parameters(paramVariete, member)
+        itk = member_parameters(paramITK, member)
+        initialized = initialize_simulation(data.copy(), grid_width, grid_height, duration, variete, itk, date_start)
+        initialized = initialize_default_irrigation(initialized)
+        return calculate_once_daily_thermal_time(initialized, variete)
+
+    keys = [
+        tuple(repr(parameters.get(name)) for parameters in (member_parameters(paramVariete, member),
+                                                              member_parameters(paramITK, member))
+              for name in INITIALIZATION_PARAMETERS)
+        for member in range(members)
+    ]
+    groups = list(dict.fromkeys(keys))
+    initialized = initialize(keys.index(groups[0]))
+    if len(groups) == 1:
+        return initialized
+
+    # only the variables differing from the first group are kept for the others
+    differing = {groups[0]: {}}
+    for key in groups[1:]:
+        group_data = initialize(keys.index(key))
+        differing[key] = {
+            name: group_data[name] for name in group_data.data_vars
+            if not group_data[name].equals(initialized[name])
+        }
+    names = set().union(*differing.values())
+
+    stacked = {}
+    for name in sorted(names):
+        variable = initialized[name]
+        # variables sharing the same memory keep sharing it
+        pointer = variable.values.__array_interface__["data"][0]
+        if pointer not in stacked:
+            values = xr.concat([differing[key].get(name, variable) for key in keys], dim="member")
+            dims = tuple(d for d in ("time",) if d in variable.dims) + ("member",)
+            stacked[pointer] = values.transpose(*dims, ...).variable
+        initialized[name] = stacked[pointer].copy(deep=False)
+    return initialized
+
+
+def sowing_date_scenarios(start_sowing_date, sowing_period_duration, interval=5):
+    """
+    Returns candidate sowing dates, every `interval` days over a sowing
+    period, as searched for the best sowing date.
+
+    Args:
+        start_sowing_date (datetime.date): first candidate sowing date
+        sowing_period_duration (int): duration of the sowing period, in days
+        interval (int, optional): number of days between candidates.
+            Defaults to 5.
+
+    Returns:
+        list: candidate sowing dates
+    """
+    return [start_sowing_date + datetime.timedelta(days=int(delta))
+            for delta in range(0, sowing_period_duration, interval)]
+
+
+def _sowing_day(sowing_dates, date_start, duration):
+    """
+    Converts sowing dates to indices of days of the simulation. Missing dates
+    (NaN or NaT) are converted to `duration`, so that these pixels are never
+    sown.
+    """
+    values = np.asarray(sowing_dates)
+    if np.issubdtype(values.dtype, np.datetime64):
+        days = (values - np.datetime64(date_start, "D")) / np.timedelta64(1, "D")
+    elif values.dtype == object:
+        days = np.vectorize(
+            lambda date: np.nan if date is None or date != date else (date - date_start).days,
+            otypes=[np.float64],
+        )(values)
+    else:
+        days = values.astype(np.float64)
+    return np.where(np.isnan(days), duration, days).astype(np.int64)
+
+
+def set_sowing_dates(data, sowing_dates, date_start):
+    """
+    Replaces the sowing date of an initialized simulation dataset, with a
+    list of candidate sowing dates simulated together as members of an
+    ensemble, or with a map of sowing dates by pixel.
+
+    As only the `sowing_date` variable depends on the sowing date, the other
+    variables are shared by all candidate sowing dates, and all candidates
+    are simulated in a single run of `run_model` with the "rolling" engine.
+    The best candidate of each pixel can then be found with a `BestMember`
+    reducer.
+
+    Args:
+        data (xarray.Dataset): simulation dataset, as prepared by
+            `initialize_simulation`
+        sowing_dates (datetime.date, list, xarray.DataArray or np.ndarray):
+            sowing dates given as datetime.date or np.datetime64 values, or
+            as indices of days of the simulation. A list or 1D array gives
+            one member for each sowing date; an array over the spatial dimensions gives the sowing date
+            of each pixel, and may have a leading "member" dimension to give
+            one map for each member. Pixels with a missing date are never
+            sown.
+        date_start (datetime.date): first day of the simulation
+
+    Returns:
+        xarray.Dataset: simulation dataset
+    """
+    duration = data.sizes["time"]
+    spatial_dims = data["rain"].dims[1:]
+    spatial_shape = tuple(data.sizes[dim] for dim in spatial_dims)
+
+    if isinstance(sowing_dates, xr.DataArray):
+        dims = tuple(dim for dim in ("member",) if dim in sowing_dates.dims) + spatial_dims
+        days = _sowing_day(sowing_dates.transpose(*dims).values, date_start, duration)
+    elif np.ndim(sowing_dates) == 1:
+        dims = ("member",) + spatial_dims
+        days = _sowing_day(sowing_dates, date_start, duration).reshape((-1,) + (1,) * len(spatial_dims))
+    else:
+        days = _sowing_day(sowing_dates, date_start, duration)
+        dims = (("member",) if days.ndim > len(spatial_dims) else ()) + spatial_dims
+
+    if "member" in dims and "member" in data.dims and data.sizes["member"] != days.shape[0]:
+        raise ValueError("{} sowing dates given for {} members".format(days.shape[0], data.sizes["member"]))
+    shape = (duration,) + days.shape[:len(dims) - len(spatial_dims)] + spatial_shape
+    sowing_day = np.empty(shape, dtype=np.int64)
+    sowing_day[...] = days
+
+    attrs = data["sowing_date"].attrs if "sowing_date" in data else {}
+    data["sowing_date"] = (("time",) + dims, sowing_day, attrs)
+    return data
@@ -0,0 +1,115 @@
+import numpy as np
+import xarray as xr
+
+
+def constant_field(value, shape, dtype=None):
+    """
+    Returns a time-varying field whose initial value does not change over
+    time, as a read-only view of a scalar or of a spatial array broadcast
+    over the (time, ...) shape, so that the field only takes the memory of
+    a single day.
+
+    The field gets its own copy of the value, so that fields built from the
+    same value are distinct arrays and are not taken for aliases of each
+    other. Fields are given a full (time, ...) storage with `promote_fields`,
+    or by the "rolling" engine when they are first written, see
+    `RollingVariable`.
+
+    Args:
+        value (scalar or np.ndarray): value of the field, broadcast against
+            `shape`
+        shape (tuple): shape of the field, time first
+        dtype (np.dtype, optional): type of the field. Defaults to None, in
+            which case the type of `value` is used.
+
+    Returns:
+        np.ndarray: read-only view of the field
+    """
+    return np.broadcast_to(np.array(value, dtype=dtype), shape)
+
+
+def masked_constant_field(reference, value):
+    """
+    Returns the field `reference * 0 + value`, which is `value` where the
+    reference is defined and NaN elsewhere, as a `constant_field` when the
+    missing values of the reference are the same every day.
+
+    Args:
+        reference (xarray.DataArray): time-varying reference, such as rainfall
+        value (scalar): value of the field
+
+    Returns:
+        xarray.DataArray: field
+    """
+    if not isinstance(reference.data, np.ndarray):
+        return reference * 0 + value
+    missing = ~np.isfinite(reference.values)
+    if not (missing == missing[:1]).all():
+        return reference * 0 + value
+    dtype = np.result_type(reference.dtype, value)
+    day = np.where(missing[0], np.nan, value).astype(dtype)
+    return xr.DataArray(constant_field(day, reference.shape), dims=reference.dims, coords=reference.coords)
+
+
+def is_constant_field(values):
+    """
+    Tells whether a (time, ...) array is a `constant_field`, that is to say
+    a view repeating the same values for each day.
+
+    Args:
+        values (np.ndarray): time-varying array
+
+    Returns:
+        bool: whether the array is a constant field
+    """
+    return values.ndim > 0 and values.strides[0] == 0 and not values.flags.writeable
+
+
+def has_constant_days(values):
+    """
+    Tells whether all the days of a (time, ...) array hold the same values,
+    as the variables that are constant at initialization do. The "rolling"
+    engine stores such variables as a `constant_field` until they are
+    written.
+
+    Args:
+        values (np.ndarray): time-varying array
+
+    Returns:
+        bool: whether all days hold the same values
+    """
+    if is_constant_field(values):
+        return True
+    equal_nan = np.issubdtype(values.dtype, np.inexact)
+    # time-varying arrays mostly differ from the second day on
+    return all(np.array_equal(day, values[0], equal_nan=equal_nan) for day in values[1:])
+
+
+def promote_fields(data):
+    """
+    Replaces the constant fields of a simulation dataset by writable
+    (time, ...) arrays, as needed when the procedures of the model write
+    into the dataset. Variables sharing the same field keep sharing the same
+    array.
+
+    Args:
+        data (xarray.Dataset): simulation dataset, modified in place
+
+    Returns:
+        xarray.Dataset: simulation dataset
+    """
+    promoted = {}
+    for name in list(data.data_vars):
+        variable = data[name].variable
+        if "time" not in variable.dims or not isinstance(variable.data, np.ndarray):
+            continue
+        values = variable.data
+        if variable.dims[0] != "time" or not is_constant_field(values):
+            continue
+        key = (values.__array_interface__["data"][0], values.shape, values.strides)
+        if key not in promoted:
+            # zero fields are allocated lazily by the system, and only take
+            # memory once written
+            promoted[key] = np.zeros(values.shape, values.dtype) if not np.any(values[0]) else np.array(values)
+        data[name] = (variable.dims, promoted[key], variable.attrs)
+    return data
@@ -0,0 +1,142 @@
+import datetime
+import os
+
+import pandas as pd
+import xarray as xr
+from tqdm import tqdm as tqdm
+
+from .data_preparation import AgERA5_SARRA_correspondance, build_files_df, load_raster_stack
+from .regridding import regrid
+from .writers import OutputWriter
+
+
+def ingest_forcing(path, rainfall_path=None, AgERA5_data_path=None, date_start=None, date_end=None,
+                   target=None, block_days=365, chunks=None, format=None, regrid_cache_dir=None):
+    """
+    Converts folders of daily GeoTIFF files, such as TAMSAT or CHIRPS
+    rainfall and AgERA5 climate data, into a single chunked and compressed
+    Zarr or NetCDF store indexed by date, so that later simulations load a
+    date window of the store instead of decoding the GeoTIFF files again.
+
+    All the variables are stored on the same grid: the grid of `target`, or
+    by default the grid of the rainfall files. AgERA5 variables are regridded
+    with `regrid`, and converted to the units of the model as done by
+    `load_AgERA5_data`. Files are read and written by blocks of `block_days`
+    days, so that decades of data can be ingested with a bounded memory use.
+    Stores are written with `OutputWriter`, see its requirements.
+
+    Args:
+        path (str): path of the store, overwritten if it exists
+        rainfall_path (str, optional): folder of the daily rainfall files,
+            named with a "_YYYY_MM_DD.tif" suffix. Defaults to None.
+        AgERA5_data_path (str, optional): folder with one subfolder of daily
+            files for each AgERA5 variable. Defaults to None.
+        date_start (datetime.date, optional): first day to ingest. Defaults
+            to None, in which case the first day of the rainfall files (or
+            of the first AgERA5 variable) is used.
+        date_end (datetime.date, optional): last day to ingest, included.
+            Defaults to None, in which case the last available day is used.
+        target (xarray.DataArray or xarray.Dataset, optional): data on the
+            grid of the store. Defaults to None, in which case the rainfall
+            grid is used.
+        block_days (int, optional): number of days read and written at once,
+            which is also the time chunk of the store. Defaults to 365.
+        chunks (dict, optional): chunk size along the spatial dimensions, see
+            `OutputWriter`. Defaults to None.
+        format (str, optional): "zarr" or "netcdf", see `OutputWriter`.
+            Defaults to None.
+        regrid_cache_dir (str, optional): folder where regridding mappings are
+            stored, see `regrid`. Defaults to None.
+
+    Returns:
+        pandas.DatetimeIndex: days written to the store
+    """
+    sources = {}
+    if rainfall_path is not None:
+        sources["rain"] = rainfall_path
+    if AgERA5_data_path is not None:
+        for variable in sorted(os.listdir(AgERA5_data_path)):
+            if AgERA5_SARRA_correspondance.get(variable) is not None:
+                sources[AgERA5_SARRA_correspondance[variable]] = os.path.join(AgERA5_data_path, variable)
+    if not sources:
+        raise ValueError("rainfall_path or AgERA5_data_path must be given")
+    if target is None and rainfall_path is None:
+        raise ValueError("a target grid must be given when no rainfall data is ingested")
+
+    files = {name: build_files_df(folder).set_index("date")["filename"] for name, folder in sources.items()}
+    dates = next(iter(files.values())).index
+    date_start = dates[0] if date_start is None else date_start
+    date_end = dates[-1] if date_end is None else date_end
+    dates = [date_start + datetime.timedelta(days=i) for i in range((date_end - date_start).days + 1)]
+    for name, filenames in files.items():
+        missing = [date for date in dates if date not in filenames.index]
+        if missing:
+            raise ValueError("{} daily files of {} are missing, first missing day is {}".format(
+                len(missing), name, missing[0]))
+
+    # without target, the rainfall grid is the grid of the store
+    regridded = [name for name in sources if name != "rain" or target is not None]
+
+    writer = OutputWriter(path, list(sources), block_days=block_days, chunks=chunks, format=format)
+    for start in tqdm(range(0, len(dates), block_days)):
+        block_dates = dates[start:start + block_days]
+        block = xr.Dataset()
+        for name, folder in sources.items():
+            stack = load_raster_stack([os.path.join(folder, files[name][date]) for date in block_dates])
+            if stack.rio.crs is None:
+                stack = stack.rio.write_crs(4326)
+            if name in regridded:
+                stack = regrid(stack, target, cache_dir=regrid_cache_dir)
+            elif target is None:
+                target = stack
+            # the GeoTIFF encoding attributes do not apply to the decoded values
+            stack.attrs = {key: value for key, value in stack.attrs.items()
+                           if key not in ("_FillValue", "missing_value", "scale_factor", "add_offset")}
+            if name == "rain":
+                stack.attrs = {"units": "mm", "long_name": "rainfall"}
+            if name == "rg":
+                # unit conversion for solar radiation (kJ/m2 as provided by AgERA5 to MJ/m2/day)
+                stack = stack / 1000
+            block[name] = stack
+        block = block.assign_coords(time=pd.to_datetime(block_dates))
+        writer.write_block(block)
+
+    return pd.to_datetime(dates)
+
+
+def load_forcing_store(data, path, date_start, duration, variables=None):
+    """
+    Loads the days of a simulation from a store written by `ingest_forcing`,
+    and adds its variables to the data. Variables are loaded lazily as dask
+    arrays, and are laid out as with `load_TAMSAT_data` and
+    `load_AgERA5_data`, without a time coordinate. The grid size is given by
+    `data["rain"].shape[1:]`. Loading requires dask, installed with the
+    "zarr" and "netcdf" extras of sarra_py.
+
+    Args:
+        data (xarray.Dataset): data to which the variables are added
+        path (str): path of the store
+        date_start (datetime.date): first day of the simulation
+        duration (int): number of days of the simulation
+        variables (list, optional): names of the variables to load. Defaults
+            to None, in which case all variables of the store are loaded.
+
+    Returns:
+        xarray.Dataset: data
+    """
+    if os.path.splitext(str(path))[1] in (".nc", ".nc4"):
+        store = xr.open_dataset(path, chunks={}, decode_coords="all")
+    else:
+        store = xr.open_zarr(path, decode_coords="all")
+    store = store.set_coords([name for name in store.data_vars if "time" not in store[name].dims])
+
+    dates = pd.date_range(date_start, periods=duration, freq="D")
+    window = store.sel(time=slice(dates[0], dates[-1]))
+    if window.sizes["time"] != duration:
+        raise ValueError("The date range may not be covered by the store ; {} days available out of {}.".format(
+            window.sizes["time"], duration))
+
+    for name in (variables if variables is not None else list(store.data_vars)):
+        data[name] = window[name].drop_vars("time")
+
+    return data
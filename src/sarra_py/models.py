@@ -1,67 +1,124 @@
+import functools
+
+import numpy as np
+
 from .bilan_pheno import *
 from .bilan_carbo import *
 from .bilan_hydro import *
 from .data_preparation import *
 
+from .fields import promote_fields
+from .state import SimulationState, select_outputs, valid_pixel_mask
+from .numba_engine import WATERBALANCE_OUTPUTS, run_model_numba, run_waterbalance_numba
+from .reducers import summary_dataset, update_reducers
+from .ensemble import broadcast_parameters, ensemble_size
+
 from tqdm import tqdm as tqdm
 
 
-def run_model(paramVariete, paramITK, paramTypeSol, data, duration):
+ENGINES = ["xarray", "rolling", "numba"]
+
+# procedures computing the water consumption from the soil tanks
+WATER_CONSUMPTION = {"separate": ConsoResSep, "fused": ConsoResSep_fused}
+
+# variables whose missing values are spread by the carbon balance on pixels without crop
+CARBON_BALANCE_INPUTS = ["par", "tpMoy", "tr", "trPot", "rapDensite", "lai", "biomasseTotale"]
+
+
+def carbon_balance_needed(j, data, occupancy):
     """
-    This is the functions list adapted from the procedures of the SARRA-H v42 model.
+    Tells whether the procedures of the carbon balance may change the
+    simulation data on day `j`. They have no effect on pixels without crop,
+    unless some of their inputs or of the carbon variables are missing, in
+    which case they spread NaN over the carbon variables of these pixels.
 
     Args:
-        paramVariete (_type_): _description_
-        paramITK (_type_): _description_
-        paramTypeSol (_type_): _description_
-        data (_type_): _description_
-        duration (_type_): _description_
+        j (int): index of the day
+        data (xarray.Dataset or SimulationState): simulation data
+        occupancy (np.ndarray): number of pixels in each phase, as given by
+            `phase_occupancy`
 
     Returns:
-        _type_: _description_
+        bool: whether the carbon balance is applied on day `j`
     """
-    
-    for j in tqdm(range(duration)):
+    if occupancy[1:].any():
+        return True
+    return not all(np.isfinite(data[name][j,:,:]).all() for name in CARBON_BALANCE_INPUTS)
 
-        # updating phenological stages
-        data = EvalPhenoSarrahV3(j, data, paramITK, paramVariete)
 
-        # sum of thermal sime is being computed from the day the crop is sown, including the day of sowing
-        data = calculate_sum_of_thermal_time(j, data)
+def run_model_day(j, data, paramVariete, paramITK, paramTypeSol, phenology=None, water_consumption=None):
+    """
+    This is the functions list adapted from the procedures of the SARRA-H v42
+    model, applied for the day `j`.
 
-        ### water balance
-        data = compute_irrigation_state(j, data, paramITK)
+    Args:
+        j (int): index of the day
+        data (xarray.Dataset or SimulationState): simulation data
+        paramVariete (dict): crop variety parameters
+        paramITK (dict): crop management parameters
+        paramTypeSol (dict): soil parameters
+        phenology (function, optional): procedure updating the phenological
+            phases, such as an `EventPhenology`. Defaults to None, in which
+            case `EvalPhenoSarrahV3` is used.
+        water_consumption (function, optional): procedure computing the
+            water consumption from the soil tanks, such as
+            `ConsoResSep_fused`. Defaults to None, in which case
+            `ConsoResSep` is used.
+
+    Returns:
+        xarray.Dataset or SimulationState: updated simulation data
+    """
+
+    # updating phenological stages
+    if phenology is None:
+        phenology = EvalPhenoSarrahV3
+    data = phenology(j, data, paramITK, paramVariete)
 
-        # sums rainfall and irrigation history
-        data = compute_total_available_water(j, data)
+    # sum of thermal sime is being computed from the day the crop is sown, including the day of sowing
+    data = calculate_sum_of_thermal_time(j, data)
 
-        # can be conditioned to the presence of mulch
-        data = fill_mulch(j, data, paramITK)
-        
+    ### water balance
+    data = compute_irrigation_state(j, data, paramITK)
 
-        data = compute_runoff(j, data)
-        data = EvolRurCstr2(j, data, paramITK) 
-        
-        # computation of filling of the tanks is done after other computations related to water,
-        # as we consider filling is taken into consideration at the end of the day
-        data = fill_tanks(j, data) 
+    # sums rainfall and irrigation history
+    data = compute_total_available_water(j, data)
 
-        # transpiration
-        # estimation of the fraction of evaporable soil water (fesw)
-        data = compute_soil_evaporation(j, data, paramITK)
+    # can be conditioned to the presence of mulch
+    data = fill_mulch(j, data, paramITK)
+    
+
+    data = compute_runoff(j, data)
+    data = EvolRurCstr2(j, data, paramITK) 
+    
+    # computation of filling of the tanks is done after other computations related to water,
+    # as we consider filling is taken into consideration at the end of the day
+    data = fill_tanks(j, data) 
 
+    # transpiration
+    # estimation of the fraction of evaporable soil water (fesw)
+    data = compute_soil_evaporation(j, data, paramITK)
 
-        data = estimate_FEMcW_and_update_mulch_water_stock(j, data, paramITK)
-        
-        
-        data = compute_transpiration(j, data, paramVariete)
-        
-        # water consumption
-        data = ConsoResSep(j, data) # ***bileau***; exmodules 1 & 2 # trad O
-        
-        # # phenologie
-        data = update_root_growth_speed(j, data, paramVariete) 
 
+    data = estimate_FEMcW_and_update_mulch_water_stock(j, data, paramITK)
+    
+    
+    data = compute_transpiration(j, data, paramVariete)
+    
+    # water consumption
+    if water_consumption is None:
+        water_consumption = ConsoResSep # ***bileau***; exmodules 1 & 2 # trad O
+    data = water_consumption(j, data)
+    
+    # # phenologie
+    data = update_root_growth_speed(j, data, paramVariete) 
+
+    # the procedures of the carbon balance and of mortality have no effect on
+    # pixels without crop, and photoperiodism only updates pixels in phase 3
+    # or changing phase, so they are skipped on days where no pixel needs them
+    occupancy = phase_occupancy(j, data)
+    crop = carbon_balance_needed(j, data, occupancy)
+
+    if crop:
         # # bilan carbone
         data = estimate_ltr(j, data, paramVariete)
         data = estimate_KAssim(j, data, paramVariete)
@@ -69,7 +126,7 @@ def run_model(paramVariete, paramITK, paramTypeSol, data, duration):
 
         # adjusting for sowing densité, in
         data = adjust_for_sowing_density(j, data, paramVariete, direction = "in") # ***bilancarbonsarra*** # trad OK
-        
+
         data = update_assimPot(j, data, paramVariete, paramITK)
         data = update_assim(j, data)
 
@@ -92,94 +149,455 @@ def run_model(paramVariete, paramITK, paramTypeSol, data, duration):
 
         data = calculate_canopy_specific_leaf_area(j, data, paramVariete)
         data = calculate_leaf_area_index(j, data)
-        
-        data = update_yield_during_filling_phase(j, data) 
-        
-        #phenologie
+
+        data = update_yield_during_filling_phase(j, data)
+
+    #phenologie
+    if occupancy[3] or np.any(data["changePhase"][j,:,:] == 1):
         data = update_photoperiodism(j, data, paramVariete)
-        
-        # # bilan carbone
+
+    # # bilan carbone
+    if occupancy[2:].any():
         data = MortaliteSarraV3(j, data, paramITK, paramVariete)
-        
-        
+
+
+    if crop:
         data = adjust_for_sowing_density(j, data, paramVariete, direction="out")
-        
-        
-        # data = BiomMcUBTSV3(j, data, paramITK) # ***bilancarbonsarra***, exmodules 2
-        # data = MAJBiomMcSV3(data) # ***bilancarbonsarra***, exmodules 2
+    
+    
+    # data = BiomMcUBTSV3(j, data, paramITK) # ***bilancarbonsarra***, exmodules 2
+    # data = MAJBiomMcSV3(data) # ***bilancarbonsarra***, exmodules 2
+
+    data = estimate_critical_nitrogen_concentration(j, data)
+
+    return data
 
-        data = estimate_critical_nitrogen_concentration(j, data)
 
+def run_waterbalance_model_day(j, data, paramVariete, paramITK, paramTypeSol, water_consumption=None):
+    """
+    This is the functions list of the water balance part of the SARRA-H v42
+    model, applied for the day `j`.
+
+    Args:
+        j (int): index of the day
+        data (xarray.Dataset or SimulationState): simulation data
+        paramVariete (dict): crop variety parameters
+        paramITK (dict): crop management parameters
+        paramTypeSol (dict): soil parameters
+        water_consumption (function, optional): procedure computing the
+            water consumption from the soil tanks, see `run_model_day`.
+            Defaults to None, in which case `ConsoResSep` is used.
+
+    Returns:
+        xarray.Dataset or SimulationState: updated simulation data
+    """
+
+    # calculating daily thermal time, independently of sowing date
+    data = calculate_daily_thermal_time(j, data, paramVariete)
+
+    # updating phenological stages
+    data = EvalPhenoSarrahV3(j, data, paramITK, paramVariete)
+
+    # sum of thermal sime is being computed from the day the crop is sown, including the day of sowing
+    data = calculate_sum_of_thermal_time(j, data)
+
+    ### water balance
+    # computing irrigation state
+    data = compute_irrigation_state(j, data, paramITK)
+
+    # sums rainfall and irrigation history
+    data = compute_total_available_water(j, data)
+
+    # filling the mulch
+    data = fill_mulch(j, data, paramITK)
+
+    # computing runoff
+    data = compute_runoff(j, data)
+
+    # computing evolution of tanks related to root growth
+    data = EvolRurCstr2(j, data, paramITK) 
+    
+    # computation of filling of the tanks is done after other computations related to water,
+    # as we consider filling is taken into consideration at the end of the day
+    data = fill_tanks(j, data) 
+
+    # evaporation
+    data = compute_soil_evaporation(j, data, paramITK)
+
+    #estimate water evaporated from the mulch and update mulch water stock
+    data = estimate_FEMcW_and_update_mulch_water_stock(j, data, paramITK)
+
+    # transpiration
+    data = compute_transpiration(j, data, paramVariete)
+    
+    # water consumption
+    if water_consumption is None:
+        water_consumption = ConsoResSep # ***bileau***; exmodules 1 & 2 # trad O
+    data = water_consumption(j, data)
+    
+    # # phenologie
+    data = update_root_growth_speed(j, data, paramVariete) 
+
+    # # bilan carbone
+    data = estimate_ltr(j, data, paramVariete)
+    data = estimate_KAssim(j, data, paramVariete)
+    data = estimate_conv(j,data,paramVariete)
 
     return data
 
 
+def _day_values(j, data):
+    # copies of the values of day `j` of the time-varying variables, telling
+    # which ones the procedures write
+    return {name: data[name].values[j].copy() for name in data.data_vars if data[name].dims[:1] == ("time",)}
+
+
+def _same_values(a, b):
+    return np.array_equal(a, b, equal_nan=np.issubdtype(a.dtype, np.inexact))
+
 
-def run_waterbalance_model(paramVariete, paramITK, paramTypeSol, data, duration):
+def run_days(day_function, paramVariete, paramITK, paramTypeSol, data, duration, engine="xarray",
+             compact=False, mask=None, outputs=None, reducers=None, writer=None,
+             prefetch_days=30, early_stop=False, sowing_window=None):
     """
-    This is the functions list adapted from the procedures of the SARRA-H v42 model.
+    Runs `day_function` for each day of the simulation.
+
+    With the "xarray" engine, procedures are applied directly to the dataset,
+    and each update of a variable is broadcast over all the remaining days of
+    the simulation, which makes the cost of a simulation grow with the square
+    of its duration. With the "rolling" engine, procedures are applied to a
+    `SimulationState`, which only holds the values of the current day as numpy
+    arrays, and each day is written once into its outputs. Both engines give
+    the same results. A `SimulationState` given as `data` is always run with
+    the "rolling" engine. The "numba" engine is only available for
+    `run_model` and `run_waterbalance_model`, see `run_model_numba` and
+    `run_waterbalance_numba`.
+
+    Entries of paramVariete and paramITK given as 1D arrays define an
+    ensemble of members, simulated together along a "member" dimension with
+    the "rolling" engine. The dataset of an ensemble is prepared with
+    `initialize_ensemble`, or with `set_sowing_dates` for sowing date
+    scenarios; a dataset having a "member" dimension is also run as an
+    ensemble.
+
+    With `compact`, or when a `mask` is given, only the valid pixels of the
+    grid, as given by `valid_pixel_mask`, are gathered and simulated, and the
+    other pixels are NaN in the results. This is not available with the
+    "xarray" engine.
+
+    When `outputs` is given, only the listed time-varying variables are kept
+    in the results, along with the static variables. With the "rolling"
+    engine, the other variables are not copied, and only their values of the
+    current and previous days are held during the simulation.
+
+    Variables whose days all have the same values, such as the ones set at
+    initialization by `initialize_simulation`, are held as a single day by
+    the "rolling" engine, and only expanded over time when they are first
+    written, see `has_constant_days`. The "xarray" engine expands the
+    `constant_field` views of the dataset, if any, before the simulation.
+
+    When `reducers` are given, such as the ones of `seasonal_reducers`, they
+    are updated at the end of each day, and their results are returned as a
+    2D summary dataset, merged with the static variables and the variables
+    listed in `outputs`. No time-varying variable is recorded unless listed
+    in `outputs`.
+
+    When a `writer` is given, the daily values of its variables are written
+    to its store by blocks of days while the simulation runs, see
+    `OutputWriter`. As with reducers, no time-varying variable is then
+    recorded in memory unless listed in `outputs`.
+
+    Lazy forcing data, such as the dask arrays returned by
+    `load_TAMSAT_data_fast`, `load_AgERA5_data_fast_dask` or
+    `load_forcing_store`, is computed by blocks of `prefetch_days` days with
+    the "rolling" engine, the next block being computed in a background
+    thread while the current one is simulated, see `ForcingPrefetcher`. The
+    "xarray" engine, which holds all the days of every variable anyway,
+    loads lazy data before the simulation.
+
+    With `early_stop`, the procedures of the model are no longer applied
+    once the crops of all valid pixels are over, as told by `season_over`,
+    which saves the end of long simulations padded after the harvest. The
+    final state is then carried over the remaining days : every variable
+    written by the procedures holds its value of the last simulated day,
+    while forcing data keeps its own values. Values after the last simulated
+    day differ from the ones of a full simulation, where the water balance
+    goes on after the harvest. Reducers and writers are still updated with
+    them for each day.
 
     Args:
-        paramVariete (_type_): _description_
-        paramITK (_type_): _description_
-        paramTypeSol (_type_): _description_
-        data (_type_): _description_
-        duration (_type_): _description_
+        day_function (function): function applying the procedures of the model
+            for one day, such as `run_model_day`
+        paramVariete (dict): crop variety parameters
+        paramITK (dict): crop management parameters
+        paramTypeSol (dict): soil parameters
+        data (xarray.Dataset or SimulationState): simulation data, as
+            prepared by `initialize_simulation`
+        duration (int): number of days of the simulation
+        engine (str, optional): "xarray" or "rolling". Defaults to "xarray".
+        compact (bool, optional): simulates only the valid pixels of the
+            grid. Defaults to False.
+        mask (xarray.DataArray or np.ndarray, optional): spatial mask, such
+            as a cropland mask, restricting the simulated pixels. Pixels where
+            it is zero or NaN are not simulated. Defaults to None.
+        outputs (list, optional): names of the time-varying variables to
+            record, such as ["rdt", "lai"]. Defaults to None, in which case all
+            variables are recorded.
+        reducers (list, optional): reducers computing seasonal summaries
+            during the simulation, see `Reducer`. Defaults to None.
+        writer (OutputWriter, optional): writer streaming daily values to a
+            Zarr or NetCDF store. Defaults to None.
+        prefetch_days (int, optional): number of days of lazy forcing data
+            computed at once with the "rolling" engine. Defaults to 30.
+        early_stop (bool, optional): stops applying the procedures once the
+            crops of all valid pixels are over. Defaults to False.
+        sowing_window (int, optional): number of days after the sowing date
+            after which pixels that are not initialized are considered as
+            never sown by `early_stop`, see `season_over`. Defaults to None.
 
     Returns:
-        _type_: _description_
+        xarray.Dataset: simulation data, or seasonal summary if reducers are
+            given
     """
-    
+
+    if engine not in ENGINES:
+        raise ValueError("engine must be one of {}, got {}".format(ENGINES, engine))
+
+    if engine == "numba":
+        raise ValueError("the numba engine is only available for run_model and run_waterbalance_model")
+
+    if sowing_window is not None and not early_stop:
+        raise ValueError("sowing_window is only used with early_stop")
+
+    compact = compact or mask is not None
+    if compact and (engine == "xarray" or isinstance(data, SimulationState)):
+        raise ValueError("pixel compaction requires a dataset run with the rolling or numba engine")
+
+    if engine == "xarray" and not isinstance(data, SimulationState) and data["rain"].ndim != 3:
+        raise ValueError("the xarray engine requires (time, y, x) data, use the rolling engine for data of sites")
+
+    if isinstance(data, SimulationState) and outputs is not None:
+        raise ValueError("outputs can not be selected for an existing SimulationState")
+
+    if reducers is not None:
+        for reducer in reducers:
+            reducer.reset()
+    if (reducers is not None or writer is not None) and outputs is None and not isinstance(data, SimulationState):
+        outputs = []
+
+    members = ensemble_size(paramVariete, paramITK)
+    if members is None and not isinstance(data, SimulationState) and "member" in data.dims:
+        members = data.sizes["member"]
+    if members is not None and engine != "rolling" and not isinstance(data, SimulationState):
+        raise ValueError("ensemble simulations are only available with the rolling engine")
+
+    if isinstance(data, SimulationState) or engine == "rolling":
+        if isinstance(data, SimulationState):
+            state = data
+        else:
+            pixel_mask = valid_pixel_mask(data, mask) if compact else None
+            state = SimulationState.from_dataset(data, duration, mask=pixel_mask, outputs=outputs, members=members,
+                                                 prefetch_days=prefetch_days)
+        if state.members is not None:
+            # member parameters broadcast against the (member, ...) values of the day
+            n_dims = len(state.day_dims) - 1
+            paramVariete = broadcast_parameters(paramVariete, n_dims)
+            paramITK = broadcast_parameters(paramITK, n_dims)
+        valid = None
+        if early_stop and not isinstance(data, SimulationState) and not compact:
+            valid = valid_pixel_mask(data)
+        if writer is not None:
+            writer.open(state)
+        over = False
+        for j in tqdm(range(duration)):
+            state.start_day(j)
+            if not over:
+                day_function(j, state, paramVariete, paramITK, paramTypeSol)
+            state.commit_day()
+            if reducers is not None:
+                update_reducers(reducers, j, state)
+            if writer is not None:
+                writer.update(j, state)
+            if early_stop and not over:
+                over = season_over(j, state, valid, sowing_window)
+                if over:
+                    state.fill_remaining_days()
+                    if reducers is None and writer is None:
+                        break
+        if writer is not None:
+            writer.close()
+        if reducers is not None:
+            # pixels of a compact state are all valid
+            valid = None if compact or isinstance(data, SimulationState) else valid_pixel_mask(data)
+            return state.to_dataset().merge(summary_dataset(reducers, state, valid))
+        return state.to_dataset()
+
+    # procedures write into the arrays of the dataset, and lazy forcing data
+    # is loaded at once rather than computed day by day
+    data = promote_fields(data.load())
+    valid = valid_pixel_mask(data) if early_stop else None
+    if writer is not None:
+        writer.open(data)
+    over = False
+    written = set()
     for j in tqdm(range(duration)):
+        if not over:
+            before = _day_values(j, data) if early_stop else None
+            data = day_function(j, data, paramVariete, paramITK, paramTypeSol)
+            if early_stop:
+                written.update(name for name, values in before.items()
+                               if not _same_values(data[name].values[j], values))
+        if reducers is not None:
+            update_reducers(reducers, j, data)
+        if writer is not None:
+            writer.update(j, data)
+        if early_stop and not over:
+            over = season_over(j, data, valid, sowing_window)
+            if over:
+                # variables written by the procedures keep their final state
+                for name in written:
+                    data[name].values[j + 1:] = data[name].values[j]
+    if writer is not None:
+        writer.close()
+
+    summary = summary_dataset(reducers, data, valid_pixel_mask(data)) if reducers is not None else None
+    if outputs is not None:
+        data = select_outputs(data, outputs)
+    if summary is not None:
+        data = data.merge(summary)
+
+    return data
 
-        # calculating daily thermal time, independently of sowing date
-        data = calculate_daily_thermal_time(j, data, paramVariete)
 
-        # updating phenological stages
-        data = EvalPhenoSarrahV3(j, data, paramITK, paramVariete)
+def run_model(paramVariete, paramITK, paramTypeSol, data, duration, engine="xarray",
+              compact=False, mask=None, outputs=None, reducers=None, writer=None, prefetch_days=30,
+              phenology="daily", early_stop=False, sowing_window=None, water_consumption="separate"):
+    """
+    This is the functions list adapted from the procedures of the SARRA-H v42 model.
+
+    Args:
+        paramVariete (dict): crop variety parameters
+        paramITK (dict): crop management parameters
+        paramTypeSol (dict): soil parameters
+        data (xarray.Dataset or SimulationState): simulation data, as
+            prepared by `initialize_simulation`
+        duration (int): number of days of the simulation
+        engine (str, optional): "xarray", "rolling" or "numba", see
+            `run_days` and `run_model_numba`. Defaults to "xarray".
+        compact (bool, optional): simulates only the valid pixels of the
+            grid, see `run_days`. Defaults to False.
+        mask (xarray.DataArray or np.ndarray, optional): spatial mask, such
+            as a cropland mask, restricting the simulated pixels, see
+            `run_days`. Defaults to None.
+        outputs (list, optional): names of the time-varying variables to
+            record, see `run_days`. Defaults to None, in which case all
+            variables are recorded.
+        reducers (list, optional): reducers computing seasonal summaries
+            during the simulation, see `run_days`. Defaults to None.
+        writer (OutputWriter, optional): writer streaming daily values to a
+            Zarr or NetCDF store, see `run_days`. Defaults to None.
+        prefetch_days (int, optional): number of days of lazy forcing data
+            computed at once with the "rolling" engine, see `run_days`.
+            Defaults to 30.
+        phenology (str, optional): "daily", in which case phase changes are
+            tested every day by `EvalPhenoSarrahV3`, or "event", in which case
+            the phase change days of each pixel are computed on the day it is
+            initialized, see `EventPhenology`. Both give the same results.
+            Only "daily" is available with the "numba" engine. Defaults to
+            "daily".
+        early_stop (bool, optional): stops applying the procedures once the
+            crops of all valid pixels are over, see `run_days`. Not available
+            with the "numba" engine. Defaults to False.
+        sowing_window (int, optional): number of days after the sowing date
+            after which pixels that are not initialized are considered as
+            never sown by `early_stop`, see `season_over`. Defaults to None.
+        water_consumption (str, optional): "separate", in which case the
+            water consumption from the soil tanks is computed by the
+            successive procedures of `ConsoResSep`, or "fused", in which case
+            it is computed in a single pass by `ConsoResSep_fused`. Both give
+            the same results, and the "numba" engine always uses a single
+            pass. Defaults to "separate".
+
+    Returns:
+        xarray.Dataset: simulation data, or seasonal summary if reducers are
+            given
+    """
 
-        # sum of thermal sime is being computed from the day the crop is sown, including the day of sowing
-        data = calculate_sum_of_thermal_time(j, data)
+    if phenology not in ("daily", "event"):
+        raise ValueError("phenology must be daily or event, got {}".format(phenology))
+    if water_consumption not in WATER_CONSUMPTION:
+        raise ValueError("water_consumption must be separate or fused, got {}".format(water_consumption))
 
-        ### water balance
-        # computing irrigation state
-        data = compute_irrigation_state(j, data, paramITK)
+    if engine == "numba":
+        if phenology != "daily":
+            raise ValueError("event-driven phenology is not available with the numba engine")
+        if early_stop:
+            raise ValueError("early stop is not available with the numba engine")
+        pixel_mask = valid_pixel_mask(data, mask) if compact or mask is not None else None
+        return run_model_numba(paramVariete, paramITK, paramTypeSol, data, duration, mask=pixel_mask,
+                               outputs=outputs, reducers=reducers, writer=writer)
 
-        # sums rainfall and irrigation history
-        data = compute_total_available_water(j, data)
+    day_function = functools.partial(run_model_day, water_consumption=WATER_CONSUMPTION[water_consumption])
+    if phenology == "event":
+        day_function = functools.partial(day_function, phenology=EventPhenology())
 
-        # filling the mulch
-        data = fill_mulch(j, data, paramITK)
+    return run_days(day_function, paramVariete, paramITK, paramTypeSol, data, duration, engine=engine,
+                    compact=compact, mask=mask, outputs=outputs, reducers=reducers, writer=writer,
+                    prefetch_days=prefetch_days, early_stop=early_stop, sowing_window=sowing_window)
 
-        # computing runoff
-        data = compute_runoff(j, data)
 
-        # computing evolution of tanks related to root growth
-        data = EvolRurCstr2(j, data, paramITK) 
-        
-        # computation of filling of the tanks is done after other computations related to water,
-        # as we consider filling is taken into consideration at the end of the day
-        data = fill_tanks(j, data) 
+def run_waterbalance_model(paramVariete, paramITK, paramTypeSol, data, duration, engine="xarray",
+                           compact=False, mask=None, outputs=None, reducers=None, writer=None, prefetch_days=30,
+                           water_consumption="separate"):
+    """
+    This is the functions list of the water balance part of the SARRA-H v42
+    model.
 
-        # evaporation
-        data = compute_soil_evaporation(j, data, paramITK)
+    Args:
+        paramVariete (dict): crop variety parameters
+        paramITK (dict): crop management parameters
+        paramTypeSol (dict): soil parameters
+        data (xarray.Dataset or SimulationState): simulation data, as
+            prepared by `initialize_simulation`
+        duration (int): number of days of the simulation
+        engine (str, optional): "xarray", "rolling" or "numba", see
+            `run_days` and `run_waterbalance_numba`. Defaults to "xarray".
+        compact (bool, optional): simulates only the valid pixels of the
+            grid, see `run_days`. Defaults to False.
+        mask (xarray.DataArray or np.ndarray, optional): spatial mask, such
+            as a cropland mask, restricting the simulated pixels, see
+            `run_days`. Defaults to None.
+        outputs (list, optional): names of the time-varying variables to
+            record, see `run_days`. Defaults to None, in which case all
+            variables are recorded, or only `WATERBALANCE_OUTPUTS` with the
+            "numba" engine.
+        reducers (list, optional): reducers computing seasonal summaries
+            during the simulation, see `run_days`. Defaults to None.
+        writer (OutputWriter, optional): writer streaming daily values to a
+            Zarr or NetCDF store, see `run_days`. Defaults to None.
+        prefetch_days (int, optional): number of days of lazy forcing data
+            computed at once with the "rolling" engine, see `run_days`.
+            Defaults to 30.
+        water_consumption (str, optional): "separate" or "fused", see
+            `run_model`. Defaults to "separate".
 
-        #estimate water evaporated from the mulch and update mulch water stock
-        data = estimate_FEMcW_and_update_mulch_water_stock(j, data, paramITK)
+    Returns:
+        xarray.Dataset: simulation data, or seasonal summary if reducers are
+            given
+    """
 
-        # transpiration
-        data = compute_transpiration(j, data, paramVariete)
-        
-        # water consumption
-        data = ConsoResSep(j, data) # ***bileau***; exmodules 1 & 2 # trad O
-        
-        # # phenologie
-        data = update_root_growth_speed(j, data, paramVariete) 
+    if water_consumption not in WATER_CONSUMPTION:
+        raise ValueError("water_consumption must be separate or fused, got {}".format(water_consumption))
 
-        # # bilan carbone
-        data = estimate_ltr(j, data, paramVariete)
-        data = estimate_KAssim(j, data, paramVariete)
-        data = estimate_conv(j,data,paramVariete)
+    if engine == "numba":
+        pixel_mask = valid_pixel_mask(data, mask) if compact or mask is not None else None
+        return run_waterbalance_numba(paramVariete, paramITK, paramTypeSol, data, duration, mask=pixel_mask,
+                                      outputs=WATERBALANCE_OUTPUTS if outputs is None else outputs,
+                                      reducers=reducers, writer=writer)
 
+    day_function = functools.partial(run_waterbalance_model_day,
+                                     water_consumption=WATER_CONSUMPTION[water_consumption])
 
-    return data
\ No newline at end of file
+    return run_days(day_function, paramVariete, paramITK, paramTypeSol, data, duration, engine=engine,
+                    compact=compact, mask=mask, outputs=outputs, reducers=reducers, writer=writer,
+                    prefetch_days=prefetch_days)
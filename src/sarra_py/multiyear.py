@@ -0,0 +1,98 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import xarray as xr
+
+from .data_preparation import (
+    calc_day_length_raster_fast,
+    get_grid_size,
+    load_AgERA5_data,
+    load_iSDA_soil_data,
+    load_iSDA_soil_data_alternate,
+    load_TAMSAT_data,
+)
+
+
+def load_base_data(rainfall_data_path, climate_data_path, date_start, duration, alternate_soil=False,
+                   soil_cache_dir=None, regrid_cache_dir=None):
+    """
+    Loads the base data of a simulation as done in the notebooks : rainfall,
+    AgERA5 climate data, soil parameters and day length.
+
+    Args:
+        rainfall_data_path (str): folder of the daily rainfall files
+        climate_data_path (str): folder of the AgERA5 data
+        date_start (datetime.date): first day of the simulation
+        duration (int): number of days of the simulation
+        alternate_soil (bool, optional): whether soil parameters are loaded
+            with `load_iSDA_soil_data_alternate` rather than
+            `load_iSDA_soil_data`. Defaults to False.
+        soil_cache_dir (str, optional): folder where soil layers are cached,
+            or False to disable the cache, see `load_iSDA_soil_data`.
+            Defaults to None, in which case the per-user cache folder is
+            used.
+        regrid_cache_dir (str, optional): folder where regridding mappings are
+            cached, see `regrid`. Defaults to None.
+
+    Returns:
+        xarray.Dataset: base data
+    """
+    grid_width, grid_height = get_grid_size(rainfall_data_path, date_start, duration)
+    base_data = xr.Dataset()
+    base_data = load_TAMSAT_data(base_data, rainfall_data_path, date_start, duration)
+    base_data = load_AgERA5_data(base_data, climate_data_path, date_start, duration, regrid_cache_dir=regrid_cache_dir)
+    if alternate_soil:
+        base_data = load_iSDA_soil_data_alternate(base_data, grid_width, grid_height, cache_dir=soil_cache_dir)
+    else:
+        base_data = load_iSDA_soil_data(base_data, grid_width, grid_height, cache_dir=soil_cache_dir)
+    base_data = calc_day_length_raster_fast(base_data, date_start, duration)
+    return base_data
+
+
+def run_years(years, load_year, run_year, prefetch=1, processes=False):
+    """
+    Runs one simulation per year, loading the data of the next years in the
+    background while the current year is simulated, so that the time spent
+    reading and regridding the files of a year is hidden behind the
+    simulation of the previous one.
+
+    Years are loaded in order by a single worker, and at most `prefetch`
+    years are loaded ahead of the simulated year, which bounds the memory
+    used by the data waiting to be simulated. With the default `prefetch`
+    of 1, the data of a year is loaded while the previous year is simulated.
+
+    Args:
+        years (iterable): years to simulate, in order
+        load_year (function): function returning the base data of a year,
+            such as a call to `load_base_data` with the dates of the season of
+            the year
+        run_year (function): function simulating a year, called with the
+            year and its base data, and returning the result of the year
+        prefetch (int, optional): number of years loaded ahead. Defaults to 1.
+        processes (bool, optional): whether years are loaded in a worker
+            process rather than in a thread, in which case `load_year` must
+            be picklable, such as a module-level function or a
+            `functools.partial` of one. Defaults to False.
+
+    Yields:
+        tuple: year and result of `run_year`, in the order of `years`
+    """
+    if prefetch < 1:
+        raise ValueError("prefetch must be at least 1, got {}".format(prefetch))
+
+    executor = (ProcessPoolExecutor if processes else ThreadPoolExecutor)(max_workers=1)
+    pending = deque()
+    try:
+        for year in years:
+            pending.append((year, executor.submit(load_year, year)))
+            if len(pending) > prefetch:
+                year, future = pending.popleft()
+                yield year, run_year(year, future.result())
+        while pending:
+            year, future = pending.popleft()
+            yield year, run_year(year, future.result())
+    finally:
+        # years not simulated yet, when the caller stops early
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
@@ -0,0 +1,1437 @@
+import numpy as np
+import xarray as xr
+
+from .bilan_carbo import variable_dict
+from .ensemble import ensemble_size
+from .fields import constant_field, promote_fields
+from .reducers import summary_dataset, update_reducers
+from .state import select_outputs, valid_pixel_mask
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba is an optional dependency
+    njit = None
+    prange = range
+
+
+def _jit(**kwargs):
+    def decorator(function):
+        return function if njit is None else njit(**kwargs)(function)
+    return decorator
+
+
+# time-varying variables computed by the kernel, in the order of the `init`
+# and `out` arrays. Variables are float32, as prepared by initialize_simulation.
+KERNEL_VARIABLES = [
+    "numPhase", "changePhase", "initPhase", "seuilTempPhaseSuivante",
+    "seuilTempPhasePrec", "phasePhotoper", "sdj", "irrigation_tank_stock",
+    "irrigation_tank_capacity", "irrigTotDay", "available_water",
+    "water_captured_by_mulch", "mulch_water_stock", "runoff",
+    "root_tank_capacity", "delta_root_tank_capacity", "root_tank_stock",
+    "total_tank_capacity", "surface_tank_stock", "eauTranspi",
+    "total_tank_stock", "humectation_front", "drainage", "fesw", "kce",
+    "evapPot", "evap", "FEMcW", "ftsw", "kcp", "trPot", "pFact", "cstr", "tr",
+    "trSurf", "consoRur", "vRac", "ltr", "KAssim", "conv", "rdt", "rdtPot",
+    "biomasseRacinaire", "biomasseTige", "biomasseFeuille", "biomasseAerienne",
+    "lai", "biomasseTotale", "assimPot", "assim", "respMaint",
+    "deltaBiomasseTotale", "biomTotStadeIp", "biomTotStadeFloraison",
+    "dRdtPot", "deltaBiomasseAerienne", "manqueAssim", "reallocation", "bM",
+    "cM", "deltaBiomasseFeuilles", "biomasseVegetative", "sla", "sumPP",
+    "nbJourCompte", "nbjStress", "Ncrit", "delta_total_tank_stock",
+]
+
+# variables sharing their memory with a kernel variable in the simulation dataset
+KERNEL_ALIASES = {
+    "previous_humectation_front": "humectation_front",
+    "previous_total_tank_stock": "total_tank_stock",
+}
+
+(V_NUMPHASE, V_CHANGEPHASE, V_INITPHASE, V_SEUILTEMPPHASESUIVANTE,
+ V_SEUILTEMPPHASEPREC, V_PHASEPHOTOPER, V_SDJ, V_IRRIGATION_TANK_STOCK,
+ V_IRRIGATION_TANK_CAPACITY, V_IRRIGTOTDAY, V_AVAILABLE_WATER,
+ V_WATER_CAPTURED_BY_MULCH, V_MULCH_WATER_STOCK, V_RUNOFF,
+ V_ROOT_TANK_CAPACITY, V_DELTA_ROOT_TANK_CAPACITY, V_ROOT_TANK_STOCK,
+ V_TOTAL_TANK_CAPACITY, V_SURFACE_TANK_STOCK, V_EAUTRANSPI,
+ V_TOTAL_TANK_STOCK, V_HUMECTATION_FRONT, V_DRAINAGE, V_FESW, V_KCE,
+ V_EVAPPOT, V_EVAP, V_FEMCW, V_FTSW, V_KCP, V_TRPOT, V_PFACT, V_CSTR, V_TR,
+ V_TRSURF, V_CONSORUR, V_VRAC, V_LTR, V_KASSIM, V_CONV, V_RDT, V_RDTPOT,
+ V_BIOMASSERACINAIRE, V_BIOMASSETIGE, V_BIOMASSEFEUILLE, V_BIOMASSEAERIENNE,
+ V_LAI, V_BIOMASSETOTALE, V_ASSIMPOT, V_ASSIM, V_RESPMAINT,
+ V_DELTABIOMASSETOTALE, V_BIOMTOTSTADEIP, V_BIOMTOTSTADEFLORAISON,
+ V_DRDTPOT, V_DELTABIOMASSEAERIENNE, V_MANQUEASSIM, V_REALLOCATION, V_BM,
+ V_CM, V_DELTABIOMASSEFEUILLES, V_BIOMASSEVEGETATIVE, V_SLA, V_SUMPP,
+ V_NBJOURCOMPTE, V_NBJSTRESS, V_NCRIT, V_DELTA_TOTAL_TANK_STOCK) = range(len(KERNEL_VARIABLES))
+
+# float32 parameters, as they are seen by the numpy procedures
+(P_SEUILEAUSEMIS, P_SDJLEVEE, P_SDJBVP, P_SDJRPR, P_SDJMATU1, P_SDJMATU2,
+ P_IRRIGAUTOTARGET, P_MAXIRRIG, P_SURFMC, P_HUMSATMC, P_PROFRACINI, P_MULCH,
+ P_COEFMC_SURFMC, P_KCMAX, P_PFACTOR, P_VRACLEVEE, P_VRACBVP, P_VRACPSP,
+ P_VRACRPR, P_VRACMATU1, P_KDF, P_TXASSIMBVP, P_TXASSIMMATU1,
+ P_DELTA_TXASSIMMATU1, P_DELTA_TXASSIMMATU2, P_TXCONVERSION, P_TEMPMAINT,
+ P_KRESPMAINT, P_KRDTPOTA, P_KRDTPOTB, P_KRDTBIOM, P_AEROTOTPENTE,
+ P_AEROTOTBASE, P_TXREALLOC, P_PCREALLOCFEUILLE, P_PCREALLOCTIGE, P_BM,
+ P_FEUILAEROPENTE, P_PHASEDEVVEG, P_SLAMAX, P_SLAMIN, P_SLAPENTE, P_PPEXP,
+ P_PPSENS, P_NBJTESTSEMIS, P_SEUILCSTRMORTALITY) = range(46)
+
+# float64 parameters
+(D_BIOMASSE_INI, D_PPCRIT, D_PP_RANGE, D_TXCONVERSION) = range(4)
+
+F0 = np.float32(0)
+F1 = np.float32(1)
+F2 = np.float32(2)
+F5 = np.float32(5)
+F10 = np.float32(10)
+F30 = np.float32(30)
+F100 = np.float32(100)
+F1000 = np.float32(1000)
+F10000 = np.float32(10000)
+F_0_01 = np.float32(0.01)
+F_0_04 = np.float32(0.04)
+F_0_1 = np.float32(0.1)
+F_0_15 = np.float32(0.15)
+F_0_3 = np.float32(0.3)
+F_0_75 = np.float32(0.75)
+F_0_78 = np.float32(0.78)
+F_0_8 = np.float32(0.8)
+F_0_9 = np.float32(0.9)
+F_1E_8 = np.float32(0.00000001)
+F_5_35 = np.float32(5.35)
+F_M0_44 = np.float32(-0.44)
+
+
+@_jit(cache=True)
+def _maximum(a, b):
+    # np.maximum, propagating NaNs
+    if a >= b or a != a:
+        return a
+    return b
+
+
+@_jit(cache=True)
+def _minimum(a, b):
+    # np.minimum, propagating NaNs
+    if a <= b or a != a:
+        return a
+    return b
+
+
+@_jit(cache=True)
+def _record(out, slots, v, p, j, value):
+    # writes the value of the day of variable v, if it is recorded
+    slot = slots[v]
+    if slot >= 0:
+        out[slot, p, j] = value
+
+
+@_jit(parallel=True, cache=True, error_model="numpy")
+def _model_kernel(duration, init, out, slots, pf, pd, rain, et0, par, tpmoy, dureedujour, ddj, irrigation,
+                  sowing_date, irrig_auto, biommc, rapdensite, ru, surface_tank_capacity, profru,
+                  runoff_threshold, runoff_rate, irrig_auto_mode, density_mode, ni_mode,
+                  strong_txconversion, phase_dev_veg_below_6):
+    """
+    Applies the procedures of `run_model_day` to each pixel, for all the days
+    of the simulation. Each procedure is reproduced with the float32
+    arithmetic of its numpy counterpart, and with the same semantics for the
+    values written for the day only (`[j,:,:]`) and for the remaining days
+    (`[j:,:,:]`). The values of each day are written into `out` for the
+    variables given a slot in `slots`.
+    """
+
+    n_pixels = init.shape[1]
+
+    for p in prange(n_pixels):
+
+        numPhase = init[V_NUMPHASE, p]
+        seuilTempPhaseSuivante = init[V_SEUILTEMPPHASESUIVANTE, p]
+        seuilTempPhasePrec = init[V_SEUILTEMPPHASEPREC, p]
+        phasePhotoper = init[V_PHASEPHOTOPER, p]
+        sdj = init[V_SDJ, p]
+        available_water = init[V_AVAILABLE_WATER, p]
+        mulch_water_stock = init[V_MULCH_WATER_STOCK, p]
+        root_tank_capacity = init[V_ROOT_TANK_CAPACITY, p]
+        delta_root_tank_capacity = init[V_DELTA_ROOT_TANK_CAPACITY, p]
+        root_tank_stock = init[V_ROOT_TANK_STOCK, p]
+        total_tank_capacity = init[V_TOTAL_TANK_CAPACITY, p]
+        surface_tank_stock = init[V_SURFACE_TANK_STOCK, p]
+        total_tank_stock = init[V_TOTAL_TANK_STOCK, p]
+        humectation_front = init[V_HUMECTATION_FRONT, p]
+        evap = init[V_EVAP, p]
+        ftsw = init[V_FTSW, p]
+        kcp = init[V_KCP, p]
+        pFact = init[V_PFACT, p]
+        cstr = init[V_CSTR, p]
+        tr = init[V_TR, p]
+        trSurf = init[V_TRSURF, p]
+        consoRur = init[V_CONSORUR, p]
+        vRac = init[V_VRAC, p]
+        ltr = init[V_LTR, p]
+        KAssim = init[V_KASSIM, p]
+        conv = init[V_CONV, p]
+        rdt = init[V_RDT, p]
+        rdtPot = init[V_RDTPOT, p]
+        biomasseRacinaire = init[V_BIOMASSERACINAIRE, p]
+        biomasseTige = init[V_BIOMASSETIGE, p]
+        biomasseFeuille = init[V_BIOMASSEFEUILLE, p]
+        biomasseAerienne = init[V_BIOMASSEAERIENNE, p]
+        lai = init[V_LAI, p]
+        biomasseTotale = init[V_BIOMASSETOTALE, p]
+        respMaint = init[V_RESPMAINT, p]
+        deltaBiomasseTotale = init[V_DELTABIOMASSETOTALE, p]
+        biomTotStadeIp = init[V_BIOMTOTSTADEIP, p]
+        biomTotStadeFloraison = init[V_BIOMTOTSTADEFLORAISON, p]
+        dRdtPot = init[V_DRDTPOT, p]
+        deltaBiomasseAerienne = init[V_DELTABIOMASSEAERIENNE, p]
+        manqueAssim = init[V_MANQUEASSIM, p]
+        reallocation = init[V_REALLOCATION, p]
+        deltaBiomasseFeuilles = init[V_DELTABIOMASSEFEUILLES, p]
+        biomasseVegetative = init[V_BIOMASSEVEGETATIVE, p]
+        sla = init[V_SLA, p]
+        nbJourCompte = init[V_NBJOURCOMPTE, p]
+        nbjStress = init[V_NBJSTRESS, p]
+
+        # numPhase and root_tank_capacity can be written for the day only
+        # after having been written for the remaining days
+        numPhase_carry = numPhase
+        root_tank_capacity_carry = root_tank_capacity
+
+        # values of the previous day
+        sdj_previous = sdj
+        biomasseAerienne_previous = biomasseAerienne
+        biomasseFeuille_previous = biomasseFeuille
+
+        txConversion = pf[P_TXCONVERSION, p]
+        txConversion_64 = pd[D_TXCONVERSION, p]
+        strong_tx = strong_txconversion
+
+        for j in range(duration):
+
+            numPhase = numPhase_carry
+            root_tank_capacity = root_tank_capacity_carry
+
+            # variables only written for the day start from their initial value
+            changePhase = init[V_CHANGEPHASE, p]
+            initPhase = init[V_INITPHASE, p]
+            irrigation_tank_stock = init[V_IRRIGATION_TANK_STOCK, p]
+            irrigation_tank_capacity = init[V_IRRIGATION_TANK_CAPACITY, p]
+            irrigTotDay = init[V_IRRIGTOTDAY, p]
+            water_captured_by_mulch = init[V_WATER_CAPTURED_BY_MULCH, p]
+            runoff = init[V_RUNOFF, p]
+            eauTranspi = init[V_EAUTRANSPI, p]
+            drainage = init[V_DRAINAGE, p]
+            fesw = init[V_FESW, p]
+            kce = init[V_KCE, p]
+            evapPot = init[V_EVAPPOT, p]
+            FEMcW = init[V_FEMCW, p]
+            trPot = init[V_TRPOT, p]
+            assimPot = init[V_ASSIMPOT, p]
+            assim = init[V_ASSIM, p]
+            bM = init[V_BM, p]
+            cM = init[V_CM, p]
+            sumPP = init[V_SUMPP, p]
+            Ncrit = init[V_NCRIT, p]
+            delta_total_tank_stock = init[V_DELTA_TOTAL_TANK_STOCK, p]
+            if not density_mode:
+                biomasseRacinaire = init[V_BIOMASSERACINAIRE, p]
+
+            # EvalPhenoSarrahV3
+            # testing_for_initialization
+            if numPhase == 0 and j >= sowing_date[p, j] and surface_tank_stock >= pf[P_SEUILEAUSEMIS, p]:
+                numPhase = F1
+                changePhase = F1
+                seuilTempPhaseSuivante = pf[P_SDJLEVEE, p]
+                initPhase = F1
+
+            # update_pheno_phase_1_to_2
+            if numPhase == 1 and sdj >= seuilTempPhaseSuivante:
+                changePhase = F1
+            if numPhase == 1 and changePhase == 1:
+                seuilTempPhaseSuivante = seuilTempPhaseSuivante + pf[P_SDJLEVEE, p]
+            if numPhase != 0 and changePhase == 1 and initPhase != 1:
+                numPhase = numPhase + F1
+                initPhase = F1
+
+            # update_pheno_phase_2_to_3
+            if numPhase == 2 and sdj >= seuilTempPhaseSuivante:
+                changePhase = F1
+            if numPhase == 2 and changePhase == 1:
+                seuilTempPhasePrec = seuilTempPhaseSuivante
+                seuilTempPhaseSuivante = seuilTempPhaseSuivante + pf[P_SDJBVP, p]
+            if numPhase != 0 and changePhase == 1 and initPhase != 1:
+                numPhase = numPhase + F1
+                initPhase = F1
+
+            # update_pheno_phase_3_to_4
+            if numPhase == 3 and phasePhotoper == 0:
+                changePhase = F1
+            if numPhase == 3 and changePhase == 1:
+                phasePhotoper = F1
+            if numPhase != 0 and changePhase == 1 and initPhase != 1:
+                numPhase = numPhase + F1
+                initPhase = F1
+
+            # update_pheno_phase_4_to_5
+            if numPhase == 4 and sdj >= seuilTempPhaseSuivante:
+                changePhase = F1
+            if numPhase == 4 and changePhase == 1:
+                seuilTempPhasePrec = seuilTempPhaseSuivante
+                seuilTempPhaseSuivante = seuilTempPhaseSuivante + pf[P_SDJRPR, p]
+            if numPhase != 0 and changePhase == 1 and initPhase != 1:
+                numPhase = numPhase + F1
+                initPhase = F1
+
+            # update_pheno_phase_5_to_6
+            if numPhase == 5 and sdj >= seuilTempPhaseSuivante:
+                changePhase = F1
+            if numPhase == 5 and changePhase == 1:
+                seuilTempPhasePrec = seuilTempPhaseSuivante
+                seuilTempPhaseSuivante = seuilTempPhaseSuivante + pf[P_SDJMATU1, p]
+            if numPhase != 0 and changePhase == 1 and initPhase != 1:
+                numPhase = numPhase + F1
+                initPhase = F1
+
+            # update_pheno_phase_6_to_7
+            if numPhase == 6 and sdj >= seuilTempPhaseSuivante:
+                changePhase = F1
+            if numPhase == 6 and changePhase == 1:
+                seuilTempPhasePrec = seuilTempPhaseSuivante
+                seuilTempPhaseSuivante = seuilTempPhaseSuivante + pf[P_SDJMATU2, p]
+            if numPhase != 0 and changePhase == 1 and initPhase != 1:
+                numPhase = numPhase + F1
+                initPhase = F1
+            numPhase_carry = numPhase
+
+            # calculate_sum_of_thermal_time
+            if j >= sowing_date[p, j] and numPhase >= 1:
+                sdj = sdj_previous + ddj[p, j]
+            else:
+                sdj = F0
+
+            # compute_irrigation_state
+            if irrig_auto_mode:
+                if irrig_auto[p, j] and numPhase > 0 and numPhase < 6:
+                    if root_tank_capacity < surface_tank_capacity[p]:
+                        irrigation_tank_stock = surface_tank_stock
+                        irrigation_tank_capacity = surface_tank_capacity[p]
+                    else:
+                        irrigation_tank_stock = root_tank_stock
+                        irrigation_tank_capacity = root_tank_capacity
+                    if irrigation_tank_stock / irrigation_tank_capacity < pf[P_IRRIGAUTOTARGET, p]:
+                        irrigTotDay = _minimum(
+                            _maximum(F0, ((irrigation_tank_capacity - irrigation_tank_stock) * F_0_9) - irrigation[p, j]),
+                            pf[P_MAXIRRIG, p],
+                        )
+                    else:
+                        irrigTotDay = F0
+                else:
+                    irrigTotDay = F0
+                irrigTotDay = irrigation[p, j] + irrigTotDay
+
+            # compute_total_available_water
+            available_water = rain[p, j] + irrigTotDay
+
+            # fill_mulch
+            water_captured_by_mulch = _minimum(
+                available_water * (F1 - np.exp(pf[P_SURFMC, p] * biommc[p, j])),
+                (pf[P_HUMSATMC, p] * biommc[p, j] / F10000) - mulch_water_stock,
+            )
+            available_water = _maximum(available_water - water_captured_by_mulch, F0)
+            mulch_water_stock = mulch_water_stock + water_captured_by_mulch
+
+            # compute_runoff
+            if rain[p, j] > runoff_threshold[p]:
+                runoff = (available_water - runoff_threshold[p]) * runoff_rate[p]
+            else:
+                runoff = F0
+            available_water = available_water - runoff
+
+            # EvolRurCstr2
+            growing = numPhase > 0 and not (numPhase == 1 and changePhase == 1)
+            if changePhase == 1 and numPhase == 1:
+                root_tank_capacity = pf[P_PROFRACINI, p] * ru[p]
+            if growing:
+                if root_tank_capacity > surface_tank_capacity[p]:
+                    delta_root_tank_capacity = (vRac * _minimum(cstr + F_0_3, F1)) / F1000 * ru[p]
+                else:
+                    delta_root_tank_capacity = vRac / F1000 * ru[p]
+                if (humectation_front - root_tank_capacity) < delta_root_tank_capacity:
+                    delta_root_tank_capacity = humectation_front - root_tank_capacity
+                root_tank_capacity = root_tank_capacity + delta_root_tank_capacity
+                if root_tank_capacity > surface_tank_capacity[p]:
+                    root_tank_stock = root_tank_stock + delta_root_tank_capacity
+                else:
+                    root_tank_stock = _maximum(
+                        ((surface_tank_stock - surface_tank_capacity[p] * F1 / F10)
+                         * (root_tank_capacity / surface_tank_capacity[p])),
+                        F0,
+                    )
+
+            # fill_tanks
+            if j == 0:
+                total_tank_capacity = (ru[p] * profru[p] / F1000)
+            surface_tank_stock = _minimum(surface_tank_stock + available_water, surface_tank_capacity[p])
+            eauTranspi = available_water
+            total_tank_stock = total_tank_stock + eauTranspi
+            humectation_front = _maximum(delta_total_tank_stock, humectation_front)
+            humectation_front = _minimum(total_tank_capacity, humectation_front)
+            if total_tank_stock > total_tank_capacity:
+                drainage = total_tank_stock - total_tank_capacity
+                total_tank_stock = total_tank_capacity
+            else:
+                drainage = F0
+            humectation_front = _maximum(humectation_front, total_tank_stock)
+            root_tank_stock = _minimum(root_tank_stock + eauTranspi, root_tank_capacity)
+            root_tank_stock = _minimum(root_tank_stock, total_tank_stock)
+
+            # compute_soil_evaporation
+            fesw = surface_tank_stock / surface_tank_capacity[p]
+            kce = ltr * pf[P_MULCH, p] * np.exp(pf[P_COEFMC_SURFMC, p] * biommc[p, j] / F1000)
+            evapPot = et0[p, j] * kce
+            evap = _minimum(evapPot * (fesw * fesw), surface_tank_stock)
+
+            # estimate_FEMcW_and_update_mulch_water_stock
+            if mulch_water_stock > 0:
+                FEMcW = mulch_water_stock / (pf[P_HUMSATMC, p] * biommc[p, j] / F1000)
+            mulch_water_stock = _maximum(F0, mulch_water_stock - (ltr * et0[p, j] * (FEMcW * FEMcW)))
+
+            # compute_transpiration
+            if root_tank_capacity > 0:
+                ftsw = root_tank_stock / root_tank_capacity
+            else:
+                ftsw = F0
+            if numPhase >= 1:
+                kcp = _maximum(F_0_3, pf[P_KCMAX, p] * (F1 - ltr))
+            trPot = kcp * et0[p, j]
+            pFact = pf[P_PFACTOR, p] + F_0_04 * (F5 - kcp * et0[p, j])
+            pFact = _minimum(_maximum(F_0_1, pFact), F_0_8)
+            cstr = _minimum((ftsw / (F1 - pFact)), F1)
+            cstr = _maximum(F0, cstr)
+            tr = trPot * cstr
+
+            # ConsoResSep
+            trSurf = _maximum(F0, surface_tank_stock)
+            surface_tank_stock = _maximum(F0, surface_tank_stock - evap)
+            if evap > trSurf:
+                consoRur = trSurf
+            else:
+                consoRur = evap
+            total_tank_stock = _maximum(F0, total_tank_stock - consoRur)
+            if root_tank_capacity < surface_tank_capacity[p]:
+                consoRur = evap * root_tank_stock / surface_tank_capacity[p]
+            root_tank_stock = _maximum(F0, root_tank_stock - consoRur)
+            if tr > root_tank_stock:
+                tr = _maximum(root_tank_stock - tr, F0)
+            if root_tank_stock > 0:
+                surface_tank_stock = _maximum(
+                    surface_tank_stock - (tr * _minimum(trSurf / root_tank_stock, F1)),
+                    F0,
+                )
+            root_tank_stock = _maximum(F0, root_tank_stock - tr)
+            total_tank_stock = _maximum(F0, total_tank_stock - tr)
+
+            # update_root_growth_speed
+            if numPhase == 1:
+                vRac = pf[P_VRACLEVEE, p]
+            elif numPhase == 2:
+                vRac = pf[P_VRACBVP, p]
+            elif numPhase == 3:
+                vRac = pf[P_VRACPSP, p]
+            elif numPhase == 4:
+                vRac = pf[P_VRACRPR, p]
+            elif numPhase == 5:
+                vRac = pf[P_VRACMATU1, p]
+            if numPhase == 0 or numPhase == 7:
+                vRac = F0
+
+            # estimate_ltr
+            ltr = np.exp(pf[P_KDF, p] * lai)
+
+            # estimate_KAssim
+            if numPhase == 2:
+                KAssim = F1
+            elif numPhase == 3 or numPhase == 4:
+                KAssim = pf[P_TXASSIMBVP, p]
+            elif numPhase == 5:
+                KAssim = pf[P_TXASSIMBVP, p] + (sdj - seuilTempPhasePrec) * pf[P_DELTA_TXASSIMMATU1, p] \
+                    / (seuilTempPhaseSuivante - seuilTempPhasePrec)
+            elif numPhase == 6:
+                KAssim = pf[P_TXASSIMMATU1, p] + (sdj - seuilTempPhasePrec) * pf[P_DELTA_TXASSIMMATU2, p] \
+                    / (seuilTempPhaseSuivante - seuilTempPhasePrec)
+
+            # estimate_conv
+            if strong_tx:
+                conv = np.float32(np.float64(KAssim) * txConversion_64)
+            else:
+                conv = KAssim * txConversion
+
+            # adjust_for_sowing_density, in
+            if density_mode:
+                rdt = np.float32(rdt * rapdensite[p, j])
+                rdtPot = np.float32(rdtPot * rapdensite[p, j])
+                biomasseRacinaire = np.float32(biomasseRacinaire * rapdensite[p, j])
+                biomasseTige = np.float32(biomasseTige * rapdensite[p, j])
+                biomasseFeuille = np.float32(biomasseFeuille * rapdensite[p, j])
+                biomasseAerienne = biomasseTige + biomasseFeuille + rdt
+                lai = biomasseFeuille * sla
+                biomasseTotale = biomasseAerienne + biomasseRacinaire
+
+            # update_assimPot
+            if ni_mode:
+                txConversion_64 = pd[D_TXCONVERSION, p]
+                strong_tx = True
+                assimPot = np.float32(
+                    np.float64(par[p, j] * (F1 - np.exp(pf[P_KDF, p] * lai))) * txConversion_64 * 10.0
+                )
+            else:
+                assimPot = par[p, j] * (F1 - np.exp(pf[P_KDF, p] * lai)) * conv * F10
+
+            # update_assim
+            if trPot > 0:
+                assim = assimPot * tr / trPot
+            else:
+                assim = F0
+
+            # calculate_maintainance_respiration
+            coefficient_temp = F2 ** ((tpmoy[p, j] - pf[P_TEMPMAINT, p]) / F10)
+            resp_totale = pf[P_KRESPMAINT, p] * biomasseTotale * coefficient_temp
+            resp_feuille = pf[P_KRESPMAINT, p] * biomasseFeuille * coefficient_temp
+            if numPhase > 4 and biomasseFeuille == 0:
+                respMaint = F0
+            else:
+                respMaint = resp_totale + resp_feuille
+
+            # update_total_biomass
+            if numPhase == 2 and changePhase == 1:
+                biomasseTotale = np.float32(pd[D_BIOMASSE_INI, p])
+            else:
+                biomasseTotale = biomasseTotale + (assim - respMaint)
+            deltaBiomasseTotale = assim - respMaint
+
+            # update_total_biomass_stade_ip, update_total_biomass_at_flowering_stage
+            if numPhase == 4 and changePhase == 1:
+                biomTotStadeIp = biomasseTotale
+            if numPhase == 5 and changePhase == 1:
+                biomTotStadeFloraison = biomasseTotale
+
+            # update_potential_yield
+            if numPhase == 5 and changePhase == 1:
+                rdtPot = (pf[P_KRDTPOTA, p] * (biomTotStadeFloraison - biomTotStadeIp) + pf[P_KRDTPOTB, p]) \
+                    + pf[P_KRDTBIOM, p] * biomTotStadeFloraison
+                if rdtPot > biomasseTige * F2 and phase_dev_veg_below_6:
+                    rdtPot = biomasseTige * F2
+
+            # update_potential_yield_delta
+            if numPhase == 5:
+                if trPot > 0:
+                    dRdtPot = _maximum(
+                        rdtPot * (ddj[p, j] / pf[P_SDJMATU1, p]) * (tr / trPot),
+                        respMaint * F_0_15,
+                    )
+                else:
+                    dRdtPot = F0
+
+            # update_aboveground_biomass
+            if numPhase >= 2 and numPhase <= 4:
+                biomasseAerienne = _minimum(
+                    F_0_9, pf[P_AEROTOTPENTE, p] * biomasseTotale + pf[P_AEROTOTBASE, p]
+                ) * biomasseTotale
+            else:
+                biomasseAerienne = biomasseAerienne + deltaBiomasseTotale
+            if j == 0:
+                biomasseAerienne_previous = biomasseAerienne
+            deltaBiomasseAerienne = biomasseAerienne - biomasseAerienne_previous
+
+            # estimate_reallocation
+            if numPhase == 5:
+                manqueAssim = _maximum(F0, (dRdtPot - _maximum(F0, deltaBiomasseAerienne)))
+                reallocation = _minimum(
+                    manqueAssim * pf[P_TXREALLOC, p],
+                    _maximum(F0, biomasseFeuille - F30),
+                )
+            else:
+                manqueAssim = F0
+                reallocation = F0
+
+            # update_root_biomass
+            biomasseRacinaire = biomasseTotale - biomasseAerienne
+
+            # EvalFeuilleTigeSarrahV4
+            if numPhase > 1 and deltaBiomasseAerienne < 0:
+                biomasseFeuille = _maximum(
+                    F_1E_8,
+                    biomasseFeuille - (reallocation - deltaBiomasseAerienne) * pf[P_PCREALLOCFEUILLE, p],
+                )
+                biomasseTige = _maximum(
+                    F_1E_8,
+                    biomasseTige - (reallocation - deltaBiomasseAerienne) * pf[P_PCREALLOCTIGE, p],
+                )
+            if numPhase > 1 and deltaBiomasseAerienne >= 0 and (numPhase <= 4 or numPhase <= pf[P_PHASEDEVVEG, p]):
+                bM = pf[P_BM, p]
+                cM = ((pf[P_FEUILAEROPENTE, p] / bM + F_0_78) / F_0_75)
+                biomasseFeuille = (F_0_1 + bM * cM ** ((biomasseAerienne - rdt) / F1000)) \
+                    * (biomasseAerienne - rdt)
+                biomasseTige = biomasseAerienne - biomasseFeuille - rdt
+            if numPhase > 1 and deltaBiomasseAerienne > 0:
+                biomasseFeuille = biomasseFeuille - reallocation * pf[P_PCREALLOCFEUILLE, p]
+                biomasseTige = biomasseTige - (reallocation * pf[P_PCREALLOCTIGE, p])
+            if j == 0:
+                biomasseFeuille_previous = biomasseFeuille
+            deltaBiomasseFeuilles = biomasseFeuille - biomasseFeuille_previous
+            if numPhase > 1:
+                biomasseAerienne = biomasseTige + biomasseFeuille + rdt
+
+            # update_vegetative_biomass
+            biomasseVegetative = (biomasseTige + biomasseFeuille)
+
+            # calculate_canopy_specific_leaf_area
+            if biomasseFeuille > 0 and numPhase == 2 and changePhase == 1:
+                sla = pf[P_SLAMAX, p]
+            if biomasseFeuille > 0:
+                ratio_old_leaf_biomass = biomasseFeuille_previous / biomasseFeuille
+                ratio_new_leaf_biomass = deltaBiomasseFeuilles / biomasseFeuille
+                sla_decrease_step = pf[P_SLAPENTE, p] * (sla - pf[P_SLAMIN, p])
+                if deltaBiomasseFeuilles > 0:
+                    sla = (sla - sla_decrease_step) * ratio_old_leaf_biomass \
+                        + (pf[P_SLAMAX, p] + sla) / F2 * ratio_new_leaf_biomass
+                else:
+                    sla = (sla - sla_decrease_step) * ratio_old_leaf_biomass
+                sla = _minimum(pf[P_SLAMAX, p], _maximum(pf[P_SLAMIN, p], sla))
+
+            # calculate_leaf_area_index
+            if numPhase <= 1:
+                lai = F0
+            elif numPhase <= 6:
+                lai = biomasseFeuille * sla
+            else:
+                lai = F0
+
+            # update_yield_during_filling_phase
+            if numPhase == 5:
+                rdt = rdt + _minimum(dRdtPot, _maximum(F0, deltaBiomasseAerienne) + reallocation)
+
+            # update_photoperiodism
+            if numPhase == 3:
+                if changePhase == 1:
+                    sumPP = F100
+                else:
+                    thermal_time_since_previous_phase = _maximum(F_0_01, sdj - seuilTempPhasePrec)
+                    time_above_critical_day_length = _maximum(0.0, dureedujour[p, j] - pd[D_PPCRIT, p])
+                    sumPP = np.float32(
+                        np.float64((F1000 / thermal_time_since_previous_phase) ** pf[P_PPEXP, p])
+                        * time_above_critical_day_length / pd[D_PP_RANGE, p]
+                    )
+                if sumPP < pf[P_PPSENS, p]:
+                    phasePhotoper = F0
+
+            # MortaliteSarraV3
+            if numPhase == 2 and changePhase == 1:
+                nbJourCompte = F0
+                nbjStress = F0
+            if numPhase >= 2:
+                nbJourCompte = nbJourCompte + F1
+            if numPhase >= 2 and nbJourCompte < pf[P_NBJTESTSEMIS, p] and deltaBiomasseAerienne < 0:
+                nbjStress = nbjStress + F1
+            root_tank_capacity_carry = root_tank_capacity
+            if numPhase >= 2 and nbjStress == pf[P_SEUILCSTRMORTALITY, p]:
+                numPhase = F0
+                root_tank_capacity = F0
+                nbjStress = F0
+
+            # adjust_for_sowing_density, out
+            if density_mode:
+                rdt = np.float32(rdt / rapdensite[p, j])
+                rdtPot = np.float32(rdtPot / rapdensite[p, j])
+                biomasseRacinaire = np.float32(biomasseRacinaire / rapdensite[p, j])
+                biomasseTige = np.float32(biomasseTige / rapdensite[p, j])
+                biomasseFeuille = np.float32(biomasseFeuille / rapdensite[p, j])
+                biomasseAerienne = biomasseTige + biomasseFeuille + rdt
+                lai = np.float32(lai / rapdensite[p, j])
+                biomasseTotale = biomasseAerienne + biomasseRacinaire
+
+            # estimate_critical_nitrogen_concentration
+            Ncrit = F_5_35 * (biomasseTotale / F1000) ** F_M0_44
+
+            sdj_previous = sdj
+            biomasseAerienne_previous = biomasseAerienne
+            biomasseFeuille_previous = biomasseFeuille
+
+            _record(out, slots, V_NUMPHASE, p, j, numPhase)
+            _record(out, slots, V_CHANGEPHASE, p, j, changePhase)
+            _record(out, slots, V_INITPHASE, p, j, initPhase)
+            _record(out, slots, V_SEUILTEMPPHASESUIVANTE, p, j, seuilTempPhaseSuivante)
+            _record(out, slots, V_SEUILTEMPPHASEPREC, p, j, seuilTempPhasePrec)
+            _record(out, slots, V_PHASEPHOTOPER, p, j, phasePhotoper)
+            _record(out, slots, V_SDJ, p, j, sdj)
+            _record(out, slots, V_IRRIGATION_TANK_STOCK, p, j, irrigation_tank_stock)
+            _record(out, slots, V_IRRIGATION_TANK_CAPACITY, p, j, irrigation_tank_capacity)
+            _record(out, slots, V_IRRIGTOTDAY, p, j, irrigTotDay)
+            _record(out, slots, V_AVAILABLE_WATER, p, j, available_water)
+            _record(out, slots, V_WATER_CAPTURED_BY_MULCH, p, j, water_captured_by_mulch)
+            _record(out, slots, V_MULCH_WATER_STOCK, p, j, mulch_water_stock)
+            _record(out, slots, V_RUNOFF, p, j, runoff)
+            _record(out, slots, V_ROOT_TANK_CAPACITY, p, j, root_tank_capacity)
+            _record(out, slots, V_DELTA_ROOT_TANK_CAPACITY, p, j, delta_root_tank_capacity)
+            _record(out, slots, V_ROOT_TANK_STOCK, p, j, root_tank_stock)
+            _record(out, slots, V_TOTAL_TANK_CAPACITY, p, j, total_tank_capacity)
+            _record(out, slots, V_SURFACE_TANK_STOCK, p, j, surface_tank_stock)
+            _record(out, slots, V_EAUTRANSPI, p, j, eauTranspi)
+            _record(out, slots, V_TOTAL_TANK_STOCK, p, j, total_tank_stock)
+            _record(out, slots, V_HUMECTATION_FRONT, p, j, humectation_front)
+            _record(out, slots, V_DRAINAGE, p, j, drainage)
+            _record(out, slots, V_FESW, p, j, fesw)
+            _record(out, slots, V_KCE, p, j, kce)
+            _record(out, slots, V_EVAPPOT, p, j, evapPot)
+            _record(out, slots, V_EVAP, p, j, evap)
+            _record(out, slots, V_FEMCW, p, j, FEMcW)
+            _record(out, slots, V_FTSW, p, j, ftsw)
+            _record(out, slots, V_KCP, p, j, kcp)
+            _record(out, slots, V_TRPOT, p, j, trPot)
+            _record(out, slots, V_PFACT, p, j, pFact)
+            _record(out, slots, V_CSTR, p, j, cstr)
+            _record(out, slots, V_TR, p, j, tr)
+            _record(out, slots, V_TRSURF, p, j, trSurf)
+            _record(out, slots, V_CONSORUR, p, j, consoRur)
+            _record(out, slots, V_VRAC, p, j, vRac)
+            _record(out, slots, V_LTR, p, j, ltr)
+            _record(out, slots, V_KASSIM, p, j, KAssim)
+            _record(out, slots, V_CONV, p, j, conv)
+            _record(out, slots, V_RDT, p, j, rdt)
+            _record(out, slots, V_RDTPOT, p, j, rdtPot)
+            _record(out, slots, V_BIOMASSERACINAIRE, p, j, biomasseRacinaire)
+            _record(out, slots, V_BIOMASSETIGE, p, j, biomasseTige)
+            _record(out, slots, V_BIOMASSEFEUILLE, p, j, biomasseFeuille)
+            _record(out, slots, V_BIOMASSEAERIENNE, p, j, biomasseAerienne)
+            _record(out, slots, V_LAI, p, j, lai)
+            _record(out, slots, V_BIOMASSETOTALE, p, j, biomasseTotale)
+            _record(out, slots, V_ASSIMPOT, p, j, assimPot)
+            _record(out, slots, V_ASSIM, p, j, assim)
+            _record(out, slots, V_RESPMAINT, p, j, respMaint)
+            _record(out, slots, V_DELTABIOMASSETOTALE, p, j, deltaBiomasseTotale)
+            _record(out, slots, V_BIOMTOTSTADEIP, p, j, biomTotStadeIp)
+            _record(out, slots, V_BIOMTOTSTADEFLORAISON, p, j, biomTotStadeFloraison)
+            _record(out, slots, V_DRDTPOT, p, j, dRdtPot)
+            _record(out, slots, V_DELTABIOMASSEAERIENNE, p, j, deltaBiomasseAerienne)
+            _record(out, slots, V_MANQUEASSIM, p, j, manqueAssim)
+            _record(out, slots, V_REALLOCATION, p, j, reallocation)
+            _record(out, slots, V_BM, p, j, bM)
+            _record(out, slots, V_CM, p, j, cM)
+            _record(out, slots, V_DELTABIOMASSEFEUILLES, p, j, deltaBiomasseFeuilles)
+            _record(out, slots, V_BIOMASSEVEGETATIVE, p, j, biomasseVegetative)
+            _record(out, slots, V_SLA, p, j, sla)
+            _record(out, slots, V_SUMPP, p, j, sumPP)
+            _record(out, slots, V_NBJOURCOMPTE, p, j, nbJourCompte)
+            _record(out, slots, V_NBJSTRESS, p, j, nbjStress)
+            _record(out, slots, V_NCRIT, p, j, Ncrit)
+            _record(out, slots, V_DELTA_TOTAL_TANK_STOCK, p, j, delta_total_tank_stock)
+
+
+# time-varying variables computed by the water balance kernel, which can be
+# recorded by `run_waterbalance_numba`
+WATERBALANCE_VARIABLES = [
+    "numPhase", "changePhase", "initPhase", "seuilTempPhaseSuivante",
+    "seuilTempPhasePrec", "phasePhotoper", "sdj", "irrigation_tank_stock",
+    "irrigation_tank_capacity", "irrigTotDay", "available_water",
+    "water_captured_by_mulch", "mulch_water_stock", "runoff",
+    "root_tank_capacity", "delta_root_tank_capacity", "root_tank_stock",
+    "total_tank_capacity", "surface_tank_stock", "eauTranspi",
+    "total_tank_stock", "humectation_front", "drainage", "fesw", "kce",
+    "evapPot", "evap", "FEMcW", "ftsw", "kcp", "trPot", "pFact", "cstr", "tr",
+    "trSurf", "consoRur", "vRac", "ltr",
+]
+
+# attributes given by `initialize_simulation` to the water balance variables
+# that are not listed by `variable_dict`
+WATERBALANCE_ATTRS = {
+    "root_tank_capacity": {"units": "mm", "long_name": "Soil maximum water storage capacity"},
+    "total_tank_stock": {"units": "mm", "long_name": "?"},
+    "humectation_front": {"units": "mm", "long_name": "Maximum water capacity to humectation front"},
+    "ltr": {},
+}
+
+# variables recorded by default by `run_waterbalance_numba`
+WATERBALANCE_OUTPUTS = ["surface_tank_stock", "root_tank_stock", "total_tank_stock", "cstr", "drainage", "runoff"]
+
+# float32 parameters of the daily thermal time
+(T_TOPT1, T_TOPT2, T_TBASE, T_TLIM, T_TOPT1_TBASE, T_TLIM_TOPT2) = range(6)
+
+
+@_jit(parallel=True, cache=True, error_model="numpy")
+def _waterbalance_kernel(duration, init, out, slots, pf, tf, rain, et0, tpmoy, irrigation, sowing_date, irrig_auto,
+                         biommc, ru, surface_tank_capacity, profru, runoff_threshold, runoff_rate, irrig_auto_mode):
+    """
+    Applies the procedures of `run_waterbalance_model_day` to each pixel, for
+    all the days of the simulation, as `_model_kernel` does for
+    `run_model_day`. The procedures of the day are fused into a single pass
+    over the scalar state of the pixel, and only the values of the variables
+    given a slot in `slots` are written for each day.
+
+    As the leaf area index is not updated by the water balance, the light
+    transmitted by the canopy keeps the value given by the initial leaf area
+    index, and the procedures of the carbon balance that do not act on the
+    water balance (estimate_KAssim, estimate_conv) are left out.
+    """
+
+    n_pixels = init.shape[1]
+
+    for p in prange(n_pixels):
+
+        numPhase = init[V_NUMPHASE, p]
+        seuilTempPhaseSuivante = init[V_SEUILTEMPPHASESUIVANTE, p]
+        seuilTempPhasePrec = init[V_SEUILTEMPPHASEPREC, p]
+        sdj = init[V_SDJ, p]
+        available_water = init[V_AVAILABLE_WATER, p]
+        mulch_water_stock = init[V_MULCH_WATER_STOCK, p]
+        root_tank_capacity = init[V_ROOT_TANK_CAPACITY, p]
+        delta_root_tank_capacity = init[V_DELTA_ROOT_TANK_CAPACITY, p]
+        root_tank_stock = init[V_ROOT_TANK_STOCK, p]
+        total_tank_capacity = init[V_TOTAL_TANK_CAPACITY, p]
+        surface_tank_stock = init[V_SURFACE_TANK_STOCK, p]
+        total_tank_stock = init[V_TOTAL_TANK_STOCK, p]
+        humectation_front = init[V_HUMECTATION_FRONT, p]
+        evap = init[V_EVAP, p]
+        ftsw = init[V_FTSW, p]
+        kcp = init[V_KCP, p]
+        pFact = init[V_PFACT, p]
+        cstr = init[V_CSTR, p]
+        tr = init[V_TR, p]
+        trSurf = init[V_TRSURF, p]
+        consoRur = init[V_CONSORUR, p]
+        vRac = init[V_VRAC, p]
+        ltr = init[V_LTR, p]
+        lai = init[V_LAI, p]
+
+        sdj_previous = sdj
+
+        for j in range(duration):
+
+            # variables only written for the day start from their initial value
+            changePhase = init[V_CHANGEPHASE, p]
+            initPhase = init[V_INITPHASE, p]
+            phasePhotoper = init[V_PHASEPHOTOPER, p]
+            irrigation_tank_stock = init[V_IRRIGATION_TANK_STOCK, p]
+            irrigation_tank_capacity = init[V_IRRIGATION_TANK_CAPACITY, p]
+            irrigTotDay = init[V_IRRIGTOTDAY, p]
+            water_captured_by_mulch = init[V_WATER_CAPTURED_BY_MULCH, p]
+            runoff = init[V_RUNOFF, p]
+            eauTranspi = init[V_EAUTRANSPI, p]
+            drainage = init[V_DRAINAGE, p]
+            fesw = init[V_FESW, p]
+            kce = init[V_KCE, p]
+            evapPot = init[V_EVAPPOT, p]
+            FEMcW = init[V_FEMCW, p]
+            trPot = init[V_TRPOT, p]
+            delta_total_tank_stock = init[V_DELTA_TOTAL_TANK_STOCK, p]
+
+            # calculate_daily_thermal_time
+            if tpmoy[p, j] <= tf[T_TOPT2]:
+                ddj = _maximum(_minimum(tf[T_TOPT1], tpmoy[p, j]), tf[T_TBASE]) - tf[T_TBASE]
+            else:
+                ddj = tf[T_TOPT1_TBASE] * (F1 - ((_minimum(tf[T_TLIM], tpmoy[p, j]) - tf[T_TOPT2]) / tf[T_TLIM_TOPT2]))
+
+            # EvalPhenoSarrahV3
+            # testing_for_initialization
+            if numPhase == 0 and j >= sowing_date[p, j] and surface_tank_stock >= pf[P_SEUILEAUSEMIS, p]:
+                numPhase = F1
+                changePhase = F1
+                seuilTempPhaseSuivante = pf[P_SDJLEVEE, p]
+                initPhase = F1
+
+            # update_pheno_phase_1_to_2
+            if numPhase == 1 and sdj >= seuilTempPhaseSuivante:
+                changePhase = F1
+            if numPhase == 1 and changePhase == 1:
+                seuilTempPhaseSuivante = seuilTempPhaseSuivante + pf[P_SDJLEVEE, p]
+            if numPhase != 0 and changePhase == 1 and initPhase != 1:
+                numPhase = numPhase + F1
+                initPhase = F1
+
+            # update_pheno_phase_2_to_3
+            if numPhase == 2 and sdj >= seuilTempPhaseSuivante:
+                changePhase = F1
+            if numPhase == 2 and changePhase == 1:
+                seuilTempPhasePrec = seuilTempPhaseSuivante
+                seuilTempPhaseSuivante = seuilTempPhaseSuivante + pf[P_SDJBVP, p]
+            if numPhase != 0 and changePhase == 1 and initPhase != 1:
+                numPhase = numPhase + F1
+                initPhase = F1
+
+            # update_pheno_phase_3_to_4, phasePhotoper being only written for
+            # the day as update_photoperiodism is not applied
+            if numPhase == 3 and phasePhotoper == 0:
+                changePhase = F1
+            if numPhase == 3 and changePhase == 1:
+                phasePhotoper = F1
+            if numPhase != 0 and changePhase == 1 and initPhase != 1:
+                numPhase = numPhase + F1
+                initPhase = F1
+
+            # update_pheno_phase_4_to_5
+            if numPhase == 4 and sdj >= seuilTempPhaseSuivante:
+                changePhase = F1
+            if numPhase == 4 and changePhase == 1:
+                seuilTempPhasePrec = seuilTempPhaseSuivante
+                seuilTempPhaseSuivante = seuilTempPhaseSuivante + pf[P_SDJRPR, p]
+            if numPhase != 0 and changePhase == 1 and initPhase != 1:
+                numPhase = numPhase + F1
+                initPhase = F1
+
+            # update_pheno_phase_5_to_6
+            if numPhase == 5 and sdj >= seuilTempPhaseSuivante:
+                changePhase = F1
+            if numPhase == 5 and changePhase == 1:
+                seuilTempPhasePrec = seuilTempPhaseSuivante
+                seuilTempPhaseSuivante = seuilTempPhaseSuivante + pf[P_SDJMATU1, p]
+            if numPhase != 0 and changePhase == 1 and initPhase != 1:
+                numPhase = numPhase + F1
+                initPhase = F1
+
+            # update_pheno_phase_6_to_7
+            if numPhase == 6 and sdj >= seuilTempPhaseSuivante:
+                changePhase = F1
+            if numPhase == 6 and changePhase == 1:
+                seuilTempPhasePrec = seuilTempPhaseSuivante
+                seuilTempPhaseSuivante = seuilTempPhaseSuivante + pf[P_SDJMATU2, p]
+            if numPhase != 0 and changePhase == 1 and initPhase != 1:
+                numPhase = numPhase + F1
+                initPhase = F1
+
+            # calculate_sum_of_thermal_time
+            if j >= sowing_date[p, j] and numPhase >= 1:
+                sdj = sdj_previous + ddj
+            else:
+                sdj = F0
+
+            # compute_irrigation_state
+            if irrig_auto_mode:
+                if irrig_auto[p, j] and numPhase > 0 and numPhase < 6:
+                    if root_tank_capacity < surface_tank_capacity[p]:
+                        irrigation_tank_stock = surface_tank_stock
+                        irrigation_tank_capacity = surface_tank_capacity[p]
+                    else:
+                        irrigation_tank_stock = root_tank_stock
+                        irrigation_tank_capacity = root_tank_capacity
+                    if irrigation_tank_stock / irrigation_tank_capacity < pf[P_IRRIGAUTOTARGET, p]:
+                        irrigTotDay = _minimum(
+                            _maximum(F0, ((irrigation_tank_capacity - irrigation_tank_stock) * F_0_9) - irrigation[p, j]),
+                            pf[P_MAXIRRIG, p],
+                        )
+                    else:
+                        irrigTotDay = F0
+                else:
+                    irrigTotDay = F0
+                irrigTotDay = irrigation[p, j] + irrigTotDay
+
+            # compute_total_available_water
+            available_water = rain[p, j] + irrigTotDay
+
+            # fill_mulch
+            water_captured_by_mulch = _minimum(
+                available_water * (F1 - np.exp(pf[P_SURFMC, p] * biommc[p, j])),
+                (pf[P_HUMSATMC, p] * biommc[p, j] / F10000) - mulch_water_stock,
+            )
+            available_water = _maximum(available_water - water_captured_by_mulch, F0)
+            mulch_water_stock = mulch_water_stock + water_captured_by_mulch
+
+            # compute_runoff
+            if rain[p, j] > runoff_threshold[p]:
+                runoff = (available_water - runoff_threshold[p]) * runoff_rate[p]
+            else:
+                runoff = F0
+            available_water = available_water - runoff
+
+            # EvolRurCstr2
+            growing = numPhase > 0 and not (numPhase == 1 and changePhase == 1)
+            if changePhase == 1 and numPhase == 1:
+                root_tank_capacity = pf[P_PROFRACINI, p] * ru[p]
+            if growing:
+                if root_tank_capacity > surface_tank_capacity[p]:
+                    delta_root_tank_capacity = (vRac * _minimum(cstr + F_0_3, F1)) / F1000 * ru[p]
+                else:
+                    delta_root_tank_capacity = vRac / F1000 * ru[p]
+                if (humectation_front - root_tank_capacity) < delta_root_tank_capacity:
+                    delta_root_tank_capacity = humectation_front - root_tank_capacity
+                root_tank_capacity = root_tank_capacity + delta_root_tank_capacity
+                if root_tank_capacity > surface_tank_capacity[p]:
+                    root_tank_stock = root_tank_stock + delta_root_tank_capacity
+                else:
+                    root_tank_stock = _maximum(
+                        ((surface_tank_stock - surface_tank_capacity[p] * F1 / F10)
+                         * (root_tank_capacity / surface_tank_capacity[p])),
+                        F0,
+                    )
+
+            # fill_tanks
+            if j == 0:
+                total_tank_capacity = (ru[p] * profru[p] / F1000)
+            surface_tank_stock = _minimum(surface_tank_stock + available_water, surface_tank_capacity[p])
+            eauTranspi = available_water
+            total_tank_stock = total_tank_stock + eauTranspi
+            humectation_front = _maximum(delta_total_tank_stock, humectation_front)
+            humectation_front = _minimum(total_tank_capacity, humectation_front)
+            if total_tank_stock > total_tank_capacity:
+                drainage = total_tank_stock - total_tank_capacity
+                total_tank_stock = total_tank_capacity
+            else:
+                drainage = F0
+            humectation_front = _maximum(humectation_front, total_tank_stock)
+            root_tank_stock = _minimum(root_tank_stock + eauTranspi, root_tank_capacity)
+            root_tank_stock = _minimum(root_tank_stock, total_tank_stock)
+
+            # compute_soil_evaporation
+            fesw = surface_tank_stock / surface_tank_capacity[p]
+            kce = ltr * pf[P_MULCH, p] * np.exp(pf[P_COEFMC_SURFMC, p] * biommc[p, j] / F1000)
+            evapPot = et0[p, j] * kce
+            evap = _minimum(evapPot * (fesw * fesw), surface_tank_stock)
+
+            # estimate_FEMcW_and_update_mulch_water_stock
+            if mulch_water_stock > 0:
+                FEMcW = mulch_water_stock / (pf[P_HUMSATMC, p] * biommc[p, j] / F1000)
+            mulch_water_stock = _maximum(F0, mulch_water_stock - (ltr * et0[p, j] * (FEMcW * FEMcW)))
+
+            # compute_transpiration
+            if root_tank_capacity > 0:
+                ftsw = root_tank_stock / root_tank_capacity
+            else:
+                ftsw = F0
+            if numPhase >= 1:
+                kcp = _maximum(F_0_3, pf[P_KCMAX, p] * (F1 - ltr))
+            trPot = kcp * et0[p, j]
+            pFact = pf[P_PFACTOR, p] + F_0_04 * (F5 - kcp * et0[p, j])
+            pFact = _minimum(_maximum(F_0_1, pFact), F_0_8)
+            cstr = _minimum((ftsw / (F1 - pFact)), F1)
+            cstr = _maximum(F0, cstr)
+            tr = trPot * cstr
+
+            # ConsoResSep
+            trSurf = _maximum(F0, surface_tank_stock)
+            surface_tank_stock = _maximum(F0, surface_tank_stock - evap)
+            if evap > trSurf:
+                consoRur = trSurf
+            else:
+                consoRur = evap
+            total_tank_stock = _maximum(F0, total_tank_stock - consoRur)
+            if root_tank_capacity < surface_tank_capacity[p]:
+                consoRur = evap * root_tank_stock / surface_tank_capacity[p]
+            root_tank_stock = _maximum(F0, root_tank_stock - consoRur)
+            if tr > root_tank_stock:
+                tr = _maximum(root_tank_stock - tr, F0)
+            if root_tank_stock > 0:
+                surface_tank_stock = _maximum(
+                    surface_tank_stock - (tr * _minimum(trSurf / root_tank_stock, F1)),
+                    F0,
+                )
+            root_tank_stock = _maximum(F0, root_tank_stock - tr)
+            total_tank_stock = _maximum(F0, total_tank_stock - tr)
+
+            # update_root_growth_speed
+            if numPhase == 1:
+                vRac = pf[P_VRACLEVEE, p]
+            elif numPhase == 2:
+                vRac = pf[P_VRACBVP, p]
+            elif numPhase == 3:
+                vRac = pf[P_VRACPSP, p]
+            elif numPhase == 4:
+                vRac = pf[P_VRACRPR, p]
+            elif numPhase == 5:
+                vRac = pf[P_VRACMATU1, p]
+            if numPhase == 0 or numPhase == 7:
+                vRac = F0
+
+            # estimate_ltr
+            ltr = np.exp(pf[P_KDF, p] * lai)
+
+            sdj_previous = sdj
+
+            _record(out, slots, V_NUMPHASE, p, j, numPhase)
+            _record(out, slots, V_CHANGEPHASE, p, j, changePhase)
+            _record(out, slots, V_INITPHASE, p, j, initPhase)
+            _record(out, slots, V_SEUILTEMPPHASESUIVANTE, p, j, seuilTempPhaseSuivante)
+            _record(out, slots, V_SEUILTEMPPHASEPREC, p, j, seuilTempPhasePrec)
+            _record(out, slots, V_PHASEPHOTOPER, p, j, phasePhotoper)
+            _record(out, slots, V_SDJ, p, j, sdj)
+            _record(out, slots, V_IRRIGATION_TANK_STOCK, p, j, irrigation_tank_stock)
+            _record(out, slots, V_IRRIGATION_TANK_CAPACITY, p, j, irrigation_tank_capacity)
+            _record(out, slots, V_IRRIGTOTDAY, p, j, irrigTotDay)
+            _record(out, slots, V_AVAILABLE_WATER, p, j, available_water)
+            _record(out, slots, V_WATER_CAPTURED_BY_MULCH, p, j, water_captured_by_mulch)
+            _record(out, slots, V_MULCH_WATER_STOCK, p, j, mulch_water_stock)
+            _record(out, slots, V_RUNOFF, p, j, runoff)
+            _record(out, slots, V_ROOT_TANK_CAPACITY, p, j, root_tank_capacity)
+            _record(out, slots, V_DELTA_ROOT_TANK_CAPACITY, p, j, delta_root_tank_capacity)
+            _record(out, slots, V_ROOT_TANK_STOCK, p, j, root_tank_stock)
+            _record(out, slots, V_TOTAL_TANK_CAPACITY, p, j, total_tank_capacity)
+            _record(out, slots, V_SURFACE_TANK_STOCK, p, j, surface_tank_stock)
+            _record(out, slots, V_EAUTRANSPI, p, j, eauTranspi)
+            _record(out, slots, V_TOTAL_TANK_STOCK, p, j, total_tank_stock)
+            _record(out, slots, V_HUMECTATION_FRONT, p, j, humectation_front)
+            _record(out, slots, V_DRAINAGE, p, j, drainage)
+            _record(out, slots, V_FESW, p, j, fesw)
+            _record(out, slots, V_KCE, p, j, kce)
+            _record(out, slots, V_EVAPPOT, p, j, evapPot)
+            _record(out, slots, V_EVAP, p, j, evap)
+            _record(out, slots, V_FEMCW, p, j, FEMcW)
+            _record(out, slots, V_FTSW, p, j, ftsw)
+            _record(out, slots, V_KCP, p, j, kcp)
+            _record(out, slots, V_TRPOT, p, j, trPot)
+            _record(out, slots, V_PFACT, p, j, pFact)
+            _record(out, slots, V_CSTR, p, j, cstr)
+            _record(out, slots, V_TR, p, j, tr)
+            _record(out, slots, V_TRSURF, p, j, trSurf)
+            _record(out, slots, V_CONSORUR, p, j, consoRur)
+            _record(out, slots, V_VRAC, p, j, vRac)
+            _record(out, slots, V_LTR, p, j, ltr)
+
+
+def kernel_parameters(paramVariete, paramITK):
+    """
+    Prepares the parameters of the numba kernel. Parameters are combined and
+    converted to float32 exactly as they are by the numpy procedures.
+
+    Args:
+        paramVariete (dict): crop variety parameters
+        paramITK (dict): crop management parameters
+
+    Returns:
+        tuple: float32 and float64 parameter vectors
+    """
+
+    pv, pi = paramVariete, paramITK
+
+    pf = np.array([
+        pi["seuilEauSemis"], pv["SDJLevee"], pv["SDJBVP"], pv["SDJRPR"], pv["SDJMatu1"], pv["SDJMatu2"],
+        pi["irrigAutoTarget"], pi["maxIrrig"], -pi["surfMc"] / 1000, pi["humSatMc"], pi["profRacIni"] / 1000,
+        pi["mulch"], -pi["coefMc"] * pi["surfMc"], pv["kcMax"], pv["PFactor"], pv["VRacLevee"], pv["VRacBVP"],
+        pv["VRacPSP"], pv["VRacRPR"], pv["VRacMatu1"], -pv["kdf"], pv["txAssimBVP"], pv["txAssimMatu1"],
+        pv["txAssimMatu1"] - pv["txAssimBVP"], pv["txAssimMatu2"] - pv["txAssimMatu1"], pv["txConversion"],
+        pv["tempMaint"], pv["kRespMaint"], pv["KRdtPotA"], pv["KRdtPotB"], pv["KRdtBiom"], pv["aeroTotPente"],
+        pv["aeroTotBase"], pv["txRealloc"], pv["pcReallocFeuille"], 1 - pv["pcReallocFeuille"],
+        pv["feuilAeroBase"] - 0.1, pv["feuilAeroPente"] * 1000, pv["phaseDevVeg"], pv["slaMax"], pv["slaMin"],
+        pv["slaPente"], pv["PPExp"], pv["PPsens"], pi["nbjTestSemis"], pv["seuilCstrMortality"],
+    ], dtype=np.float32)
+
+    if np.isnan(pi["NI"]):
+        txConversion = pv["txConversion"]
+    else:
+        txConversion = pv["NIYo"] + pv["NIp"] * (1-np.exp(-pv["NIp"] * pi["NI"])) - (np.exp(-0.5*((pi["NI"] - pv["LGauss"])/pv["AGauss"])* (pi["NI"]- pv["LGauss"])/pv["AGauss"]))/(pv["AGauss"]*2.506628274631)
+
+    pd = np.array([
+        pi["densite"] * np.maximum(1, pv['densOpti']/pi['densite']) * pv["txResGrain"] * pv["poidsSecGrain"] / 1000,
+        pv["PPCrit"], pv["SeuilPP"] - pv["PPCrit"], txConversion,
+    ], dtype=np.float64)
+
+    return pf, pd
+
+
+def run_model_numba(paramVariete, paramITK, paramTypeSol, data, duration, mask=None, outputs=None,
+                    reducers=None, writer=None):
+    """
+    Runs the SARRA-H model with a numba-compiled kernel, in which the daily
+    procedures of `run_model_day` are applied pixel by pixel, pixels being
+    processed in parallel.
+
+    The kernel gives the same results as the numpy procedures, up to the
+    rounding of the float32 exponential and power functions. Time-varying
+    variables of `data` are expected to be constant in time before the
+    simulation, as prepared by `initialize_simulation`. The input dataset is
+    left unchanged.
+
+    Args:
+        paramVariete (dict): crop variety parameters
+        paramITK (dict): crop management parameters
+        paramTypeSol (dict): soil parameters
+        data (xarray.Dataset): simulation data, as prepared by
+            `initialize_simulation`
+        duration (int): number of days of the simulation
+        mask (np.ndarray, optional): boolean spatial mask of the pixels to
+            simulate, as given by `valid_pixel_mask`. Other pixels are set to
+            NaN in the results. Defaults to None, in which case all pixels are
+            simulated.
+        outputs (list, optional): names of the time-varying variables to
+            record, see `run_days`. Defaults to None, in which case all
+            variables are recorded.
+        reducers (list, optional): reducers computing seasonal summaries,
+            see `run_days`. They are applied to the recorded values of their
+            variables once the kernel has run. Defaults to None.
+        writer (OutputWriter, optional): writer of daily values to a Zarr or
+            NetCDF store. As the kernel runs all the days at once, the
+            values of its variables are recorded and written once the kernel
+            has run. Defaults to None.
+
+    Returns:
+        xarray.Dataset: simulation data, or seasonal summary if reducers are
+            given
+    """
+
+    if njit is None:
+        raise ImportError("the numba engine requires numba to be installed")
+
+    if ensemble_size(paramVariete, paramITK) is not None or "member" in data.dims:
+        raise ValueError("ensemble simulations are only available with the rolling engine")
+
+    selected_outputs = outputs
+    if reducers is not None or writer is not None:
+        selected_outputs = [] if outputs is None else list(outputs)
+        outputs = list(selected_outputs)
+        outputs += [variable for reducer in reducers or [] for variable in reducer.variables]
+        outputs += writer.variables if writer is not None else []
+
+    spatial_shape = data["rain"].shape[1:]
+    if mask is None:
+        pixels = slice(None)
+        n_pixels = int(np.prod(spatial_shape))
+    else:
+        pixels = np.flatnonzero(mask)
+        n_pixels = pixels.size
+
+    rain = data["rain"].values[:duration]
+
+    def forcing(name, dtype, default=None):
+        # variables set by `initialize_simulation` are derived from the
+        # parameters when missing, only for the simulated pixels
+        values = data[name].values[:duration] if name in data or default is None else default
+        values = np.broadcast_to(np.asarray(values, dtype=dtype), rain.shape).reshape(duration, -1)
+        # pixel-major layout, so that each pixel reads its days contiguously
+        return np.ascontiguousarray(values[:, pixels].T)
+
+    def static(name):
+        return np.ascontiguousarray(np.asarray(data[name].values, dtype=np.float32).reshape(-1)[pixels])
+
+    # initial state of the water balance, as set by `initialize_simulation`,
+    # the other variables starting at 0
+    ru = static("ru")
+    surface_tank_capacity = static("epaisseurSurf") / 1000 * ru
+    init = np.zeros((len(KERNEL_VARIABLES), n_pixels), dtype=np.float32)
+    init[V_ROOT_TANK_CAPACITY] = ru * paramITK["profRacIni"] / 1000
+    init[V_TOTAL_TANK_STOCK] = static("stockIniProf")
+    init[V_HUMECTATION_FRONT] = np.maximum(np.maximum(surface_tank_capacity, init[V_ROOT_TANK_CAPACITY]),
+                                           init[V_TOTAL_TANK_STOCK])
+    init[V_LTR] = 1.0
+
+    # only the values of the recorded variables are written for each day
+    if outputs is None:
+        recorded = KERNEL_VARIABLES
+    else:
+        recorded = [name for name in KERNEL_VARIABLES
+                    if name in outputs or any(KERNEL_ALIASES.get(alias) == name for alias in outputs)]
+    slots = np.full(len(KERNEL_VARIABLES), -1, dtype=np.int64)
+    for slot, name in enumerate(recorded):
+        slots[KERNEL_VARIABLES.index(name)] = slot
+    out = np.empty((len(recorded), n_pixels, duration), dtype=np.float32)
+
+    density_mode = bool(~np.isnan(paramVariete["densOpti"]))
+    ni_mode = bool(~np.isnan(paramITK["NI"]))
+    if density_mode:
+        rapdensite = forcing("rapDensite", np.float64)
+    else:
+        rapdensite = np.ones((n_pixels, duration))
+
+    pf, pd = kernel_parameters(paramVariete, paramITK)
+
+    _model_kernel(
+        duration, init, out, slots,
+        np.broadcast_to(pf[:, np.newaxis], (pf.shape[0], n_pixels)),
+        np.broadcast_to(pd[:, np.newaxis], (pd.shape[0], n_pixels)),
+        forcing("rain", np.float32), forcing("ET0", np.float32), forcing("par", np.float32),
+        forcing("tpMoy", np.float32), forcing("dureeDuJour", np.float64), forcing("ddj", np.float32),
+        forcing("irrigation", np.float32), forcing("sowing_date", np.int64), forcing("irrigAuto", np.bool_),
+        forcing("biomMc", np.float32), rapdensite,
+        static("ru"), static("surface_tank_capacity"), static("profRu"),
+        static("runoff_threshold"), static("runoff_rate"),
+        bool(paramITK["irrigAuto"] == True), density_mode, ni_mode,
+        isinstance(paramVariete["txConversion"], np.floating), bool(paramVariete["phaseDevVeg"] < 6),
+    )
+
+    if ni_mode:
+        # update_assimPot updates the conversion rate of the variety
+        paramVariete["txConversion"] = pd[-1]
+
+    return _kernel_results(data, out, slots, duration, mask, outputs, selected_outputs, reducers, writer)
+
+
+def _kernel_results(data, out, slots, duration, mask, outputs, selected_outputs, reducers, writer):
+    """
+    Builds the results of a numba kernel from the values it recorded, as
+    done by `run_days` : recorded variables replace their values in the
+    simulation data, daily values are written by the writer and seasonal
+    summaries are computed by the reducers.
+    """
+
+    spatial_dims = data["rain"].dims[1:]
+    spatial_shape = data["rain"].shape[1:]
+
+    data = data.copy() if outputs is None else select_outputs(data, outputs)
+    if mask is not None:
+        # pixels outside of the mask are not simulated, as with `SimulationState`
+        mask = np.asarray(mask, dtype=bool).ravel()
+        grid_mask = xr.DataArray(mask.reshape(spatial_shape), dims=spatial_dims)
+        for name in data.data_vars:
+            if name not in KERNEL_VARIABLES and name not in KERNEL_ALIASES \
+                    and set(grid_mask.dims) <= set(data[name].dims):
+                floating = np.issubdtype(data[name].dtype, np.floating)
+                data[name] = data[name].where(grid_mask, np.nan if floating else data[name].dtype.type(0))
+    for i, name in enumerate(KERNEL_VARIABLES):
+        if slots[i] < 0:
+            continue
+        if mask is None:
+            values = np.ascontiguousarray(out[slots[i]].T).reshape((duration,) + spatial_shape)
+        else:
+            values = np.full((duration, mask.size), np.nan, dtype=np.float32)
+            values[:, mask] = out[slots[i]].T
+            values = values.reshape((duration,) + spatial_shape)
+        # aliased variables share the same values
+        for target in [name] + [alias for alias in KERNEL_ALIASES if KERNEL_ALIASES[alias] == name]:
+            if target in data:
+                data[target] = (data[target].dims, values, data[target].attrs)
+
+    if writer is not None:
+        writer.open(data)
+        for j in range(duration):
+            writer.update(j, data)
+        writer.close()
+    if reducers is not None:
+        for reducer in reducers:
+            reducer.reset()
+        for j in range(duration):
+            update_reducers(reducers, j, data)
+        data = select_outputs(data, selected_outputs).merge(summary_dataset(reducers, data, valid_pixel_mask(data)))
+    elif writer is not None:
+        data = select_outputs(data, selected_outputs)
+
+    return promote_fields(data)
+
+
+def run_waterbalance_numba(paramVariete, paramITK, paramTypeSol, data, duration, mask=None,
+                           outputs=WATERBALANCE_OUTPUTS, reducers=None, writer=None, date_start=None):
+    """
+    Runs the water balance part of the SARRA-H model with a numba-compiled
+    kernel, in which the daily procedures of `run_waterbalance_model_day` are
+    applied pixel by pixel, pixels being processed in parallel.
+
+    This is a lean engine for water balance products, such as drought
+    monitoring : the state of each pixel is held in scalars during the
+    simulation, and only the daily values of the variables in `outputs` are
+    allocated, by default the stocks of the tanks, the water stress index,
+    drainage and runoff. The daily procedures from filling the mulch to the
+    water consumption are fused into a single pass over the days of each
+    pixel, and the carbon balance procedures that do not act on the water
+    balance are left out. As with `run_model_numba`, results are the same as
+    the numpy procedures up to the rounding of the float32 exponential
+    function, and the input dataset is left unchanged.
+
+    The initial state of the water balance is built from the soil
+    parameters, as done by `initialize_simulation`, so that the base data
+    (forcing and soil parameters) is enough to run the engine. The sowing
+    date, irrigation and mulch biomass of the data are used when given, for
+    instance after `initialize_simulation` or `initialize_default_irrigation`,
+    and derived from `paramITK` otherwise.
+
+    Args:
+        paramVariete (dict): crop variety parameters
+        paramITK (dict): crop management parameters
+        paramTypeSol (dict): soil parameters
+        data (xarray.Dataset): base data, with rain, ET0, tpMoy and the soil
+            parameters, or simulation data as prepared by
+            `initialize_simulation`
+        duration (int): number of days of the simulation
+        mask (np.ndarray, optional): boolean spatial mask of the pixels to
+            simulate, see `run_model_numba`. Defaults to None.
+        outputs (list, optional): names of the time-varying variables to
+            record, among `WATERBALANCE_VARIABLES`. Defaults to
+            `WATERBALANCE_OUTPUTS`.
+        reducers (list, optional): reducers computing seasonal summaries,
+            see `run_model_numba`. Defaults to None.
+        writer (OutputWriter, optional): writer of daily values to a Zarr or
+            NetCDF store, see `run_model_numba`. Defaults to None.
+        date_start (datetime.date, optional): first day of the simulation,
+            from which the sowing date of `paramITK` is counted when the data
+            has no sowing_date. Defaults to None.
+
+    Returns:
+        xarray.Dataset: recorded variables and static variables of the
+            simulation data, or seasonal summary if reducers are given
+    """
+
+    if njit is None:
+        raise ImportError("the numba engine requires numba to be installed")
+
+    if ensemble_size(paramVariete, paramITK) is not None or "member" in data.dims:
+        raise ValueError("ensemble simulations are only available with the rolling engine")
+
+    if "sowing_date" not in data and date_start is None:
+        raise ValueError("date_start is required to compute the sowing date of data without sowing_date")
+
+    selected_outputs = list(outputs)
+    outputs = list(selected_outputs)
+    outputs += [variable for reducer in reducers or [] for variable in reducer.variables]
+    outputs += writer.variables if writer is not None else []
+    unknown = [name for name in outputs if KERNEL_ALIASES.get(name, name) not in WATERBALANCE_VARIABLES]
+    if unknown:
+        raise ValueError("variables {} are not computed by the water balance".format(unknown))
+
+    spatial_shape = data["rain"].shape[1:]
+    if mask is None:
+        pixels = slice(None)
+        n_pixels = int(np.prod(spatial_shape))
+    else:
+        pixels = np.flatnonzero(mask)
+        n_pixels = pixels.size
+
+    rain = data["rain"].values[:duration]
+
+    def forcing(name, dtype, default=None):
+        # variables set by `initialize_simulation` are derived from the
+        # parameters when missing, only for the simulated pixels
+        values = data[name].values[:duration] if name in data or default is None else default
+        values = np.broadcast_to(np.asarray(values, dtype=dtype), rain.shape).reshape(duration, -1)
+        # pixel-major layout, so that each pixel reads its days contiguously
+        return np.ascontiguousarray(values[:, pixels].T)
+
+    def static(name):
+        return np.ascontiguousarray(np.asarray(data[name].values, dtype=np.float32).reshape(-1)[pixels])
+
+    # initial state of the water balance, as set by `initialize_simulation`,
+    # the other variables starting at 0
+    ru = static("ru")
+    surface_tank_capacity = static("epaisseurSurf") / 1000 * ru
+    init = np.zeros((len(KERNEL_VARIABLES), n_pixels), dtype=np.float32)
+    init[V_ROOT_TANK_CAPACITY] = ru * paramITK["profRacIni"] / 1000
+    init[V_TOTAL_TANK_STOCK] = static("stockIniProf")
+    init[V_HUMECTATION_FRONT] = np.maximum(np.maximum(surface_tank_capacity, init[V_ROOT_TANK_CAPACITY]),
+                                           init[V_TOTAL_TANK_STOCK])
+    init[V_LTR] = 1.0
+
+    recorded = [name for name in WATERBALANCE_VARIABLES
+                if name in outputs or any(KERNEL_ALIASES.get(alias) == name for alias in outputs)]
+    slots = np.full(len(KERNEL_VARIABLES), -1, dtype=np.int64)
+    for slot, name in enumerate(recorded):
+        slots[KERNEL_VARIABLES.index(name)] = slot
+    out = np.empty((len(recorded), n_pixels, duration), dtype=np.float32)
+
+    pf, _ = kernel_parameters(paramVariete, paramITK)
+    pv = paramVariete
+    tf = np.array([
+        pv["TOpt1"], pv["TOpt2"], pv["TBase"], pv["TLim"], pv["TOpt1"] - pv["TBase"], pv["TLim"] - pv["TOpt2"],
+    ], dtype=np.float32)
+
+    _waterbalance_kernel(
+        duration, init, out, slots,
+        np.broadcast_to(pf[:, np.newaxis], (pf.shape[0], n_pixels)), tf,
+        forcing("rain", np.float32), forcing("ET0", np.float32), forcing("tpMoy", np.float32),
+        forcing("irrigation", np.float32, np.where(np.isfinite(rain), 0, np.nan)),
+        forcing("sowing_date", np.int64, None if date_start is None else (paramITK["DateSemis"] - date_start).days),
+        forcing("irrigAuto", np.bool_, paramITK["irrigAuto"]),
+        forcing("biomMc", np.float32, paramITK["biomIniMc"]),
+        ru, surface_tank_capacity, static("profRu"),
+        static("runoff_threshold"), static("runoff_rate"),
+        bool(paramITK["irrigAuto"] == True),
+    )
+
+    # recorded variables missing from base data are added to the results
+    attrs = {name: {"units": units, "long_name": long_name} for name, (long_name, units) in variable_dict().items()}
+    attrs.update(WATERBALANCE_ATTRS)
+    data = data.assign({
+        name: (data["rain"].dims, constant_field(0, data["rain"].shape, np.float32),
+               attrs[KERNEL_ALIASES.get(name, name)])
+        for name in outputs if name not in data
+    })
+
+    return _kernel_results(data, out, slots, duration, mask, outputs, selected_outputs, reducers, writer)
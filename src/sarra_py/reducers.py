@@ -0,0 +1,297 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+import xarray as xr
+
+from .state import SimulationState
+
+
+class Reducer(ABC):
+    """
+    Accumulator computing a seasonal summary of a time-varying variable while
+    the simulation runs, so that the daily values of the variable do not have
+    to be kept.
+
+    Reducers are given to `run_model` and `run_waterbalance_model` through
+    the `reducers` argument. At the end of each day, `update_day` reads the
+    `variables` of the reducer and calls `update` with the values of the day
+    of `variable`, and the summary is given by `result` at the end of the
+    simulation.
+    """
+
+    def __init__(self, variable, name=None):
+        """
+        Args:
+            variable (str): name of the reduced variable
+            name (str, optional): name of the summary variable. Defaults to
+                None, in which case a name is derived from the variable.
+        """
+        self.variable = variable
+        self.variables = [variable]
+        self.name = name
+        self.value = None
+        # boolean spatial mask of the valid pixels, set before `result`
+        self.valid = None
+
+    def reset(self):
+        """
+        Clears the accumulated values, before a new simulation.
+        """
+        self.value = None
+
+    def update_day(self, j, data):
+        """
+        Updates the reducer with the values of the day `j` of the simulation.
+
+        Args:
+            j (int): index of the day
+            data (xarray.Dataset or SimulationState): simulation data
+        """
+        self.update(j, np.asarray(data[self.variable][j]))
+
+    @abstractmethod
+    def update(self, j, values):
+        """
+        Args:
+            j (int): index of the day
+            values (np.ndarray): values of the day of the variable
+        """
+
+    def result(self):
+        """
+        Returns:
+            dict: summary arrays, by name
+        """
+        return {self.name: self.value}
+
+
+class Final(Reducer):
+    """
+    Keeps the value of the last day of the simulation, such as the final
+    yield.
+    """
+
+    def __init__(self, variable, name=None):
+        super().__init__(variable, name or "{}_final".format(variable))
+
+    def update(self, j, values):
+        if self.value is None:
+            self.value = np.array(values)
+        else:
+            np.copyto(self.value, values)
+
+
+class Maximum(Reducer):
+    """
+    Computes the maximum over the simulation, such as the maximum leaf area
+    index. NaNs are propagated.
+    """
+
+    def __init__(self, variable, name=None):
+        super().__init__(variable, name or "{}_max".format(variable))
+
+    def update(self, j, values):
+        if self.value is None:
+            self.value = np.array(values)
+        else:
+            np.maximum(self.value, values, out=self.value)
+
+
+class Sum(Reducer):
+    """
+    Computes the sum over the simulation, such as the cumulated
+    transpiration. The sum is computed in float64, NaNs are propagated.
+    """
+
+    def __init__(self, variable, name=None):
+        super().__init__(variable, name or "{}_sum".format(variable))
+
+    def update(self, j, values):
+        if self.value is None:
+            self.value = np.zeros(np.shape(values), dtype=np.float64)
+        np.add(self.value, values, out=self.value)
+
+
+class CountBelow(Reducer):
+    """
+    Counts the days when a variable is below a threshold, such as the number
+    of days of water stress (`cstr` below a threshold). When a phase variable
+    is given, only the days of the crop cycle, from emergence to maturity
+    (phases 1 to 6), are counted.
+    """
+
+    def __init__(self, variable, threshold, name=None, phase_variable=None):
+        """
+        Args:
+            variable (str): name of the reduced variable
+            threshold (float): days when the variable is strictly below the
+                threshold are counted
+            name (str, optional): name of the summary variable. Defaults to
+                None, in which case a name is derived from the variable.
+            phase_variable (str, optional): name of the phase variable, such
+                as "numPhase", restricting the count to the days of the crop
+                cycle. Defaults to None, in which case all days are counted.
+        """
+        super().__init__(variable, name or "{}_days_below_{}".format(variable, threshold))
+        self.threshold = threshold
+        self.phase_variable = phase_variable
+        if phase_variable is not None:
+            self.variables.append(phase_variable)
+
+    def update_day(self, j, data):
+        values = np.asarray(data[self.variable][j])
+        if self.phase_variable is not None:
+            phase = np.asarray(data[self.phase_variable][j])
+            # days outside of the crop cycle are never below the threshold
+            values = np.where((phase > 0) & (phase < 7), values, np.inf)
+        self.update(j, values)
+
+    def update(self, j, values):
+        if self.value is None:
+            self.value = np.zeros(np.shape(values), dtype=np.int32)
+        self.value += values < self.threshold
+
+
+class PhaseDays(Reducer):
+    """
+    Records the index of the first day of each phenological phase, from the
+    `numPhase` variable. Phases that are not reached are NaN.
+    """
+
+    def __init__(self, variable="numPhase", phases=range(1, 8), name="phase"):
+        """
+        Args:
+            variable (str, optional): name of the phase variable. Defaults to
+                "numPhase".
+            phases (iterable, optional): phases whose first day is recorded.
+                Defaults to phases 1 to 7.
+            name (str, optional): prefix of the summary variables, which are
+                named "{name}_{phase}_day". Defaults to "phase".
+        """
+        super().__init__(variable, name)
+        self.phases = list(phases)
+
+    def update(self, j, values):
+        if self.value is None:
+            self.value = np.full((len(self.phases),) + np.shape(values), np.nan, dtype=np.float32)
+        for i, phase in enumerate(self.phases):
+            self.value[i][np.isnan(self.value[i]) & (values == phase)] = j
+
+    def result(self):
+        return {"{}_{}_day".format(self.name, phase): self.value[i] for i, phase in enumerate(self.phases)}
+
+
+class BestMember(Reducer):
+    """
+    Finds the member of an ensemble giving the highest final value of a
+    variable, such as the sowing date giving the best yield among sowing date
+    scenarios. NaN values are ignored, and pixels where all members are NaN,
+    or that are not valid pixels of the simulation, such as pixels without
+    soil data, get a NaN best member.
+    """
+
+    def __init__(self, variable="rdt", labels=None, name=None):
+        """
+        Args:
+            variable (str, optional): name of the reduced variable. Defaults
+                to "rdt".
+            labels (list, optional): numeric label of each member, such as
+                the sowing day of each scenario, given instead of the index
+                of the best member. Defaults to None.
+            name (str, optional): prefix of the summary variables, which are
+                named "{name}_best_member" for the best member and
+                "{name}_best" for its final value. Defaults to None, in which
+                case the name of the variable is used.
+        """
+        super().__init__(variable, name or variable)
+        self.labels = labels
+
+    def update(self, j, values):
+        if self.value is None:
+            self.value = np.array(values)
+        else:
+            np.copyto(self.value, values)
+
+    def result(self):
+        # members are along the first axis of the values of a day
+        valid = ~np.isnan(self.value)
+        any_valid = valid.any(axis=0)
+        if self.valid is not None:
+            any_valid &= self.valid
+        best = np.where(valid, self.value, -np.inf).argmax(axis=0)
+        best_value = np.take_along_axis(self.value, best[np.newaxis], axis=0)[0]
+        labels = np.arange(self.value.shape[0]) if self.labels is None else np.asarray(self.labels)
+        best_member = np.where(any_valid, labels[best], np.nan).astype(np.float32)
+        return {
+            "{}_best_member".format(self.name): best_member,
+            "{}_best".format(self.name): np.where(any_valid, best_value, np.nan).astype(self.value.dtype),
+        }
+
+
+def seasonal_reducers(stress_threshold=0.5):
+    """
+    Returns the reducers of the usual seasonal products : final yield, final
+    total biomass, maximum leaf area index, cumulated transpiration, number
+    of days of water stress during the crop cycle, and first day of each
+    phenological phase.
+
+    Args:
+        stress_threshold (float, optional): days of the crop cycle with `cstr`
+            below this threshold are counted as stressed. Defaults to 0.5.
+
+    Returns:
+        list: reducers
+    """
+    return [
+        Final("rdt"),
+        Final("biomasseTotale"),
+        Maximum("lai"),
+        Sum("tr"),
+        CountBelow("cstr", stress_threshold, name="stressed_days", phase_variable="numPhase"),
+        PhaseDays(),
+    ]
+
+
+def update_reducers(reducers, j, data):
+    """
+    Updates the reducers with the values of the day `j`.
+
+    Args:
+        reducers (list): reducers
+        j (int): index of the day
+        data (xarray.Dataset or SimulationState): simulation data
+    """
+    for reducer in reducers:
+        reducer.update_day(j, data)
+
+
+def summary_dataset(reducers, data, valid=None):
+    """
+    Gathers the results of the reducers into a dataset over the spatial
+    dimensions of the simulation.
+
+    Args:
+        reducers (list): reducers
+        data (xarray.Dataset or SimulationState): simulation data
+        valid (np.ndarray, optional): boolean spatial mask of the valid
+            pixels of the simulation, as given by `valid_pixel_mask`, given
+            to the reducers as `Reducer.valid`. Defaults to None, in which
+            case all pixels are valid.
+
+    Returns:
+        xarray.Dataset: seasonal summary
+    """
+    for reducer in reducers:
+        reducer.valid = valid
+    if isinstance(data, SimulationState):
+        values = {}
+        for reducer in reducers:
+            values.update(reducer.result())
+        return data.to_summary_dataset(values)
+    summary = xr.Dataset(coords={name: coord for name, coord in data.coords.items() if "time" not in coord.dims})
+    for reducer in reducers:
+        dims = data[reducer.variable].dims[1:]
+        for name, value in reducer.result().items():
+            # reducers over members drop the leading dimensions
+            summary[name] = (dims[len(dims) - np.ndim(value):], value)
+    return summary
@@ -0,0 +1,219 @@
+import functools
+import hashlib
+import os
+
+import numpy as np
+import xarray as xr
+import rioxarray  # noqa: F401  (registers the .rio accessor)
+from rasterio.warp import transform as transform_coordinates
+
+
+RESAMPLING_METHODS = ["nearest", "bilinear"]
+
+# mappings already computed in this process, by signature
+_regrid_mappings = {}
+
+
+def _grid_signature(dataarray):
+    """
+    Returns the CRS, affine transform and shape defining the grid of a
+    rioxarray object.
+    """
+    if dataarray.rio.crs is None:
+        raise ValueError("the grid must have a CRS, see rio.write_crs")
+    shape = (dataarray.rio.height, dataarray.rio.width)
+    return dataarray.rio.crs, dataarray.rio.transform(), shape
+
+
+def grid_key(dataarray):
+    """
+    Returns a key identifying the grid of a rioxarray object, given by its
+    CRS, affine transform and shape.
+
+    Args:
+        dataarray (xarray.DataArray or xarray.Dataset): data on the grid
+
+    Returns:
+        str: key of the grid
+    """
+    crs, transform, shape = _grid_signature(dataarray)
+    return hashlib.sha1(repr([crs.to_wkt(), tuple(transform)[:6], shape]).encode()).hexdigest()[:16]
+
+
+def regrid_signature(source, target, resampling="nearest"):
+    """
+    Returns a key identifying the regridding of a source grid onto a target
+    grid, shared by all the days and variables defined on these grids.
+
+    Args:
+        source (xarray.DataArray or xarray.Dataset): data on the source grid
+        target (xarray.DataArray or xarray.Dataset): data on the target grid
+        resampling (str, optional): resampling method. Defaults to "nearest".
+
+    Returns:
+        str: signature of the regridding
+    """
+    parts = [resampling, grid_key(source), grid_key(target)]
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:16]
+
+
+def compute_regrid_mapping(source, target, resampling="nearest"):
+    """
+    Computes, for each pixel of the target grid, the flat indices of the
+    pixels of the source grid it is interpolated from, and their weights.
+
+    With "nearest" resampling, each target pixel takes the value of the
+    source pixel containing its center, as done by `rio.reproject_match`.
+    With "bilinear" resampling, it is interpolated from the 4 source pixels
+    whose centers surround its center. Target pixels whose center is outside
+    of the source grid get an index of -1.
+
+    Args:
+        source (xarray.DataArray or xarray.Dataset): data on the source grid
+        target (xarray.DataArray or xarray.Dataset): data on the target grid
+        resampling (str, optional): "nearest" or "bilinear". Defaults to
+            "nearest".
+
+    Returns:
+        tuple: (k, target pixels) int64 array of flat source indices, and
+            (k, target pixels) float32 array of weights
+    """
+    if resampling not in RESAMPLING_METHODS:
+        raise ValueError("resampling must be one of {}, got {}".format(RESAMPLING_METHODS, resampling))
+    source_crs, source_transform, (source_height, source_width) = _grid_signature(source)
+    target_crs, target_transform, (target_height, target_width) = _grid_signature(target)
+
+    # coordinates of the centers of the target pixels, in the source CRS
+    rows, cols = np.meshgrid(np.arange(target_height) + 0.5, np.arange(target_width) + 0.5, indexing="ij")
+    xs, ys = target_transform * (cols.ravel(), rows.ravel())
+    if source_crs != target_crs:
+        xs, ys = transform_coordinates(target_crs, source_crs, xs, ys)
+    cols, rows = ~source_transform * (np.asarray(xs), np.asarray(ys))
+    inside = (cols >= 0) & (cols < source_width) & (rows >= 0) & (rows < source_height)
+
+    if resampling == "nearest":
+        index = np.floor(rows).astype(np.int64) * source_width + np.floor(cols).astype(np.int64)
+        index = np.where(inside, index, -1)[np.newaxis]
+        return index, np.ones(index.shape, dtype=np.float32)
+
+    # bilinear interpolation between the centers of the source pixels,
+    # clamped to the edges of the source grid
+    cols, rows = np.clip(cols - 0.5, 0, source_width - 1), np.clip(rows - 0.5, 0, source_height - 1)
+    col0 = np.minimum(np.floor(cols).astype(np.int64), max(source_width - 2, 0))
+    row0 = np.minimum(np.floor(rows).astype(np.int64), max(source_height - 2, 0))
+    col1, row1 = np.minimum(col0 + 1, source_width - 1), np.minimum(row0 + 1, source_height - 1)
+    dx, dy = cols - col0, rows - row0
+    index = np.stack([row0 * source_width + col0, row0 * source_width + col1,
+                      row1 * source_width + col0, row1 * source_width + col1])
+    weights = np.stack([(1 - dx) * (1 - dy), dx * (1 - dy), (1 - dx) * dy, dx * dy]).astype(np.float32)
+    index = np.where(inside, index, -1)
+    return index, weights
+
+
+def regrid_mapping(source, target, resampling="nearest", cache_dir=None):
+    """
+    Returns the mapping of `compute_regrid_mapping`, computed once per
+    signature and kept in memory, and persisted in `cache_dir` if given so
+    that later sessions reuse it.
+
+    Args:
+        source (xarray.DataArray or xarray.Dataset): data on the source grid
+        target (xarray.DataArray or xarray.Dataset): data on the target grid
+        resampling (str, optional): "nearest" or "bilinear". Defaults to
+            "nearest".
+        cache_dir (str, optional): folder where mappings are stored. Defaults
+            to None, in which case mappings are only kept in memory.
+
+    Returns:
+        tuple: flat source indices and weights
+    """
+    signature = regrid_signature(source, target, resampling)
+    if signature in _regrid_mappings:
+        return _regrid_mappings[signature]
+
+    path = os.path.join(cache_dir, "regrid_{}.npz".format(signature)) if cache_dir is not None else None
+    if path is not None and os.path.exists(path):
+        with np.load(path) as cached:
+            mapping = cached["index"], cached["weights"]
+    else:
+        mapping = compute_regrid_mapping(source, target, resampling)
+        if path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.savez(path, index=mapping[0], weights=mapping[1])
+
+    _regrid_mappings[signature] = mapping
+    return mapping
+
+
+def _apply_regrid_mapping(values, index, weights, target_shape):
+    """
+    Regrids a (..., y, x) array with a mapping, as a gather over the
+    flattened source grid. NaN source values are left out of the
+    interpolation, target pixels without any valid source value are NaN.
+    """
+    values = values.reshape(values.shape[:-2] + (-1,))
+    gathered = values[..., np.maximum(index, 0)]
+    valid = (index >= 0) & ~np.isnan(gathered)
+    if index.shape[0] == 1:
+        result = np.where(valid, gathered, np.nan)[..., 0, :]
+    else:
+        total = np.where(valid, weights, 0).sum(axis=-2)
+        weighted = np.where(valid, gathered * weights, 0).sum(axis=-2)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            result = np.where(total > 0, weighted / total, np.nan)
+    return result.astype(values.dtype, copy=False).reshape(values.shape[:-1] + target_shape)
+
+
+def regrid(dataarray, target, resampling="nearest", cache_dir=None):
+    """
+    Regrids a (..., y, x) DataArray, such as a stack of daily rasters, onto
+    the grid of `target`. With "nearest" resampling, the result is the same
+    as `rio.reproject_match(target, nodata=np.nan)`.
+
+    The mapping between the grids is computed once per source grid, target
+    grid and resampling method, see `regrid_mapping`, and is applied to all
+    the days at once. Nodata values of the source are NaN in the result, and
+    are left out of bilinear interpolations.
+    Dask arrays are regridded lazily, block by block along the leading
+    dimensions.
+
+    Args:
+        dataarray (xarray.DataArray): data to regrid, with a CRS
+        target (xarray.DataArray or xarray.Dataset): data on the target grid
+        resampling (str, optional): "nearest" or "bilinear". Defaults to
+            "nearest".
+        cache_dir (str, optional): folder where mappings are stored, see
+            `regrid_mapping`. Defaults to None.
+
+    Returns:
+        xarray.DataArray: regridded data
+    """
+    index, weights = regrid_mapping(dataarray, target, resampling, cache_dir)
+    y_dim, x_dim = dataarray.rio.y_dim, dataarray.rio.x_dim
+    target_y_dim, target_x_dim = target.rio.y_dim, target.rio.x_dim
+    target_shape = (target.sizes[target_y_dim], target.sizes[target_x_dim])
+
+    dims = tuple(d for d in dataarray.dims if d not in (y_dim, x_dim))
+    attrs = dataarray.attrs
+    dataarray = dataarray.transpose(*dims, y_dim, x_dim)
+    if not np.issubdtype(dataarray.dtype, np.floating):
+        dataarray = dataarray.astype(np.float32)
+    nodata = dataarray.rio.nodata
+    if nodata is not None and not np.isnan(nodata):
+        dataarray = dataarray.where(dataarray != nodata)
+
+    values = dataarray.data
+    if hasattr(values, "map_blocks"):
+        values = values.rechunk({values.ndim - 2: -1, values.ndim - 1: -1})
+        regridded = values.map_blocks(
+            functools.partial(_apply_regrid_mapping, index=index, weights=weights, target_shape=target_shape),
+            chunks=values.chunks[:-2] + tuple((size,) for size in target_shape), dtype=values.dtype,
+        )
+    else:
+        regridded = _apply_regrid_mapping(values, index, weights, target_shape)
+
+    coords = {name: coord for name, coord in dataarray.coords.items()
+              if not set(coord.dims) & {y_dim, x_dim} and name != "spatial_ref"}
+    coords[y_dim], coords[x_dim] = target[target_y_dim].values, target[target_x_dim].values
+    result = xr.DataArray(regridded, dims=dims + (y_dim, x_dim), coords=coords, attrs=attrs)
+    return result.rio.write_crs(target.rio.crs)
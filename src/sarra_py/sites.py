@@ -0,0 +1,273 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import rasterio
+import rasterio.transform
+import xarray as xr
+from rasterio.windows import Window
+
+from .data_preparation import AgERA5_SARRA_correspondance, build_rainfall_files_df, build_soil_lut, map_soil_properties
+
+
+def sites_dataset(sites, names=None):
+    """
+    Creates the base dataset of a simulation on a list of sites, such as
+    field trial sites, rather than on a grid. Variables of the dataset have a
+    "site" dimension instead of the "y" and "x" dimensions, and the longitude
+    and latitude of the sites are given by the "x" and "y" coordinates along
+    it.
+
+    The loaders of this module read the values of the pixels containing the
+    sites only. Simulations on sites are run with the "rolling" or "numba"
+    engine, the procedures of the model being applied the same way as on a
+    grid. The grid size given to `initialize_simulation` is then the number
+    of sites and 1.
+
+    Args:
+        sites (list): (longitude, latitude) of each site, in degrees
+        names (list, optional): names of the sites. Defaults to None, in
+            which case sites are numbered.
+
+    Returns:
+        xarray.Dataset: base dataset
+    """
+    sites = np.asarray(sites, dtype=np.float64).reshape(-1, 2)
+    if names is None:
+        names = np.arange(len(sites))
+    if len(names) != len(sites):
+        raise ValueError("{} names given for {} sites".format(len(names), len(sites)))
+    return xr.Dataset(coords={
+        "site": np.asarray(names),
+        "x": ("site", sites[:, 0]),
+        "y": ("site", sites[:, 1]),
+    })
+
+
+def _sample_raster(src, x, y, masked=False):
+    """
+    Reads the values of the pixels containing the points (x, y) of an open
+    raster, reading only the blocks of the file holding them. Points outside
+    of the raster are NaN.
+    """
+    rows, cols = rasterio.transform.rowcol(src.transform, x, y)
+    rows, cols = np.asarray(rows), np.asarray(cols)
+    inside = (rows >= 0) & (rows < src.height) & (cols >= 0) & (cols < src.width)
+    values = np.full(len(x), np.nan, dtype=np.float32)
+
+    block_height, block_width = src.block_shapes[0]
+    blocks = pd.DataFrame({"row": rows[inside] // block_height, "col": cols[inside] // block_width,
+                           "point": np.flatnonzero(inside)})
+    for (block_row, block_col), points in blocks.groupby(["row", "col"])["point"]:
+        window = Window(block_col * block_width, block_row * block_height, block_width, block_height)
+        window = window.intersection(Window(0, 0, src.width, src.height))
+        block = src.read(1, window=window)
+        points = points.to_numpy()
+        pixels = block[rows[points] - window.row_off, cols[points] - window.col_off]
+        if masked and src.nodata is not None:
+            pixels = np.where(pixels == src.nodata, np.nan, pixels)
+        values[points] = pixels
+    return values
+
+
+def sample_raster_stack(file_paths, x, y, masked=False, n_threads=None):
+    """
+    Reads the values of the pixels containing a list of points from a list
+    of single-band raster files, such as daily rainfall files. Only the
+    blocks of the files holding the points are read, the files being read by
+    a pool of threads as done by `load_raster_stack`.
+
+    Args:
+        file_paths (list): paths of the raster files, in time order
+        x (np.ndarray): longitude of the points, in the CRS of the files
+        y (np.ndarray): latitude of the points, in the CRS of the files
+        masked (bool, optional): whether the nodata values of the files are
+            replaced by NaN. Defaults to False, in which case values are read
+            as they are, as done by `load_raster_stack`.
+        n_threads (int, optional): number of reading threads. Defaults to
+            None, in which case the default of ThreadPoolExecutor is used.
+
+    Returns:
+        np.ndarray: (file, point) float32 values, NaN for points outside of
+            the rasters
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    stack = np.empty((len(file_paths), len(x)), dtype=np.float32)
+
+    def read(i):
+        with rasterio.open(file_paths[i]) as src:
+            stack[i] = _sample_raster(src, x, y, masked=masked)
+
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        list(executor.map(read, range(len(file_paths))))
+
+    return stack
+
+
+def load_TAMSAT_data_sites(data, TAMSAT_path, date_start, duration):
+    """
+    Loads the rainfall of the sites of a dataset created by `sites_dataset`
+    from daily rainfall raster files, such as TAMSAT or CHIRPS files, as
+    `load_TAMSAT_data` does for a grid.
+
+    Args:
+        data (xarray.Dataset): sites dataset
+        TAMSAT_path (str): folder of the daily rainfall files
+        date_start (datetime.date): first day of the simulation
+        duration (int): number of days of the simulation
+
+    Returns:
+        xarray.Dataset: sites dataset
+    """
+    files_df = build_rainfall_files_df(TAMSAT_path, date_start, duration)
+    values = sample_raster_stack([os.path.join(TAMSAT_path, filename) for filename in files_df["filename"]],
+                                 data["x"].values, data["y"].values)
+    data["rain"] = (("time", "site"), values, {"units": "mm", "long_name": "rainfall"})
+    return data
+
+
+def load_AgERA5_data_sites(data, AgERA5_data_path, date_start, duration):
+    """
+    Loads the AgERA5 climate data of the sites of a dataset created by
+    `sites_dataset`, as `load_AgERA5_data` does for a grid. Values are read
+    from the AgERA5 pixels containing the sites rather than regridded.
+
+    Args:
+        data (xarray.Dataset): sites dataset
+        AgERA5_data_path (str): folder with one subfolder of daily files for
+            each AgERA5 variable
+        date_start (datetime.date): first day of the simulation
+        duration (int): number of days of the simulation
+
+    Returns:
+        xarray.Dataset: sites dataset
+    """
+    for variable in sorted(os.listdir(AgERA5_data_path)):
+        if AgERA5_SARRA_correspondance.get(variable) is None:
+            continue
+        path = os.path.join(AgERA5_data_path, variable)
+        files_df = build_rainfall_files_df(path, date_start, duration)
+        values = sample_raster_stack([os.path.join(path, filename) for filename in files_df["filename"]],
+                                     data["x"].values, data["y"].values)
+        data[AgERA5_SARRA_correspondance[variable]] = (("time", "site"), values)
+
+    # unit conversion for solar radiation (kJ/m2 as provided by AgERA5 to MJ/m2/day)
+    data["rg"] = data["rg"] / 1000
+
+    return data
+
+
+def load_forcing_store_sites(data, path, date_start, duration, variables=None):
+    """
+    Loads the days of a simulation for the sites of a dataset created by
+    `sites_dataset` from a store written by `ingest_forcing`, as
+    `load_forcing_store` does for a grid. Only the chunks of the store
+    holding the pixels of the sites are read.
+
+    Args:
+        data (xarray.Dataset): sites dataset
+        path (str): path of the store
+        date_start (datetime.date): first day of the simulation
+        duration (int): number of days of the simulation
+        variables (list, optional): names of the variables to load. Defaults
+            to None, in which case all variables of the store are loaded.
+
+    Returns:
+        xarray.Dataset: sites dataset
+    """
+    if os.path.splitext(str(path))[1] in (".nc", ".nc4"):
+        store = xr.open_dataset(path, chunks={}, decode_coords="all")
+    else:
+        store = xr.open_zarr(path, decode_coords="all")
+    store = store.set_coords([name for name in store.data_vars if "time" not in store[name].dims])
+
+    dates = pd.date_range(date_start, periods=duration, freq="D")
+    window = store.sel(time=slice(dates[0], dates[-1]))
+    if window.sizes["time"] != duration:
+        raise ValueError("The date range may not be covered by the store ; {} days available out of {}.".format(
+            window.sizes["time"], duration))
+
+    # pixels containing the sites, the coordinates of the store being the centers of the pixels
+    indices, inside = {}, np.ones(data.sizes["site"], dtype=bool)
+    for dim in ("y", "x"):
+        coord = window[dim].values
+        resolution = np.abs(coord[1] - coord[0]) if len(coord) > 1 else np.inf
+        index = pd.Index(coord).get_indexer(data[dim].values, method="nearest", tolerance=resolution / 2)
+        inside &= index >= 0
+        indices[dim] = xr.DataArray(np.maximum(index, 0), dims="site")
+
+    for name in (variables if variables is not None else list(store.data_vars)):
+        values = window[name].isel(indices).transpose("time", "site").values.astype(np.float32)
+        values[:, ~inside] = np.nan
+        data[name] = (("time", "site"), values, window[name].attrs)
+
+    return data
+
+
+def load_iSDA_soil_data_sites(data, alternate=False):
+    """
+    Loads the soil parameters of the sites of a dataset created by
+    `sites_dataset`, from the same asset files and with the same conversions
+    as `load_iSDA_soil_data`, or as `load_iSDA_soil_data_alternate` if
+    `alternate` is True. Values are read from the pixels of the assets
+    containing the sites rather than reprojected.
+
+    Args:
+        data (xarray.Dataset): sites dataset
+        alternate (bool, optional): whether soil parameters are derived as in
+            `load_iSDA_soil_data_alternate`. Defaults to False.
+
+    Returns:
+        xarray.Dataset: sites dataset
+    """
+    soil_depth_file_path = "../data/assets/gyga_af_erzd__m_1km.tif"
+    soil_type_file_path = "../data/assets/iSDA_at_TAMSAT_resolution_zeroclass_1E6.tif"
+    path_soil_type_correspondance = "../data/assets/TypeSol_Moy13_HWSD.csv"
+    soil_RZPAWC_file_path = "../data/assets/gyga_af_agg_erzd_tawcpf23mm__m_1km.tif"
+
+    def sample(path):
+        return sample_raster_stack([path], data["x"].values, data["y"].values, masked=True)[0]
+
+    # soil depth, converted from cm to mm
+    data["profRu"] = ("site", sample(soil_depth_file_path) * 10,
+                      {"units": "mm", "long_name": "Soil root zone depth (mm) adapted from Africa SoilGrids RZD"})
+
+    # soil type identifier, converted from 1E6 to 1E0
+    data["soil_type"] = ("site", (sample(soil_type_file_path) / 1000000).astype("float32"),
+                         {"units": "arbitrary", "long_name": "soil_type"})
+
+    if alternate:
+        soil_variables = {
+            "runoff_threshold": "SeuilRuiss",
+            "runoff_rate": "PourcRuiss",
+        }
+    else:
+        soil_variables = {
+            "epaisseurProf": "EpaisseurProf",
+            "epaisseurSurf": "EpaisseurSurf",
+            "stockIniProf": "StockIniProf",
+            "stockIniSurf": "StockIniSurf",
+            "runoff_threshold": "SeuilRuiss",
+            "runoff_rate": "PourcRuiss",
+            "ru": "Ru",
+        }
+
+    lut = build_soil_lut(soil_variables, path_soil_type_correspondance)
+    data = map_soil_properties(data, soil_variables, lut)
+
+    # converting pourcRuiss to decimal %
+    data["runoff_rate"] = data["runoff_rate"] / 100
+
+    if alternate:
+        data["epaisseurSurf"] = 200 * xr.ones_like(data["profRu"])
+        data["epaisseurSurf"].attrs = {"units": "mm", "long_name": "Soil surface reservoir depth (mm)"}
+        data["stockIniProf"] = 0 * xr.ones_like(data["profRu"])
+        data["stockIniProf"].attrs = {"units": "mm", "long_name": "Initial water stock in the deep surface reservoir (mm)"}
+        data["RZPAWC"] = ("site", sample(soil_RZPAWC_file_path),
+                          {"units": "mm", "long_name": "Root zone plant available water capacity (mm)"})
+        # calculating RU (mm/m)
+        data["ru"] = data["RZPAWC"] / (data["profRu"] / 1000)
+
+    return data
@@ -0,0 +1,702 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import xarray as xr
+
+from .bilan_carbo import variable_dict
+from .fields import has_constant_days, promote_fields
+
+
+def valid_pixel_mask(data, mask=None):
+    """
+    Computes the mask of the pixels on which the simulation is meaningful,
+    that is to say the pixels where all static variables of the simulation
+    dataset (soil parameters) are defined and where rainfall is given at
+    least once. An optional user mask, such as a cropland mask, further
+    restricts the valid pixels.
+
+    Args:
+        data (xarray.Dataset): simulation dataset
+        mask (xarray.DataArray or np.ndarray, optional): spatial mask, pixels
+            where it is zero or NaN are excluded. Defaults to None.
+
+    Returns:
+        np.ndarray: boolean spatial mask of the valid pixels
+    """
+    spatial_dims = data["rain"].dims[1:]
+    valid = np.isfinite(data["rain"]).any(data["rain"].dims[0]).values
+    for name in data.data_vars:
+        variable = data[name]
+        if "time" not in variable.dims and set(variable.dims) == set(spatial_dims) \
+                and np.issubdtype(variable.dtype, np.floating):
+            valid &= np.isfinite(variable.transpose(*spatial_dims).values)
+    if mask is not None:
+        if isinstance(mask, xr.DataArray):
+            mask = mask.transpose(*spatial_dims).values
+        mask = np.asarray(mask)
+        if mask.shape != valid.shape:
+            raise ValueError("mask must have shape {}, got {}".format(valid.shape, mask.shape))
+        valid &= np.nan_to_num(mask.astype(np.float64)) != 0
+    return valid
+
+
+def select_outputs(data, outputs):
+    """
+    Keeps the listed time-varying variables of a simulation dataset, along
+    with its static variables.
+
+    Args:
+        data (xarray.Dataset): simulation data
+        outputs (list): names of the time-varying variables to keep
+
+    Returns:
+        xarray.Dataset: simulation data
+    """
+
+    missing = [name for name in outputs if name not in data]
+    if missing:
+        raise ValueError("unknown output variables {}".format(missing))
+
+    return data[[name for name in data.data_vars if name in outputs or "time" not in data[name].dims]]
+
+
+class ForcingPrefetcher:
+    """
+    Loads lazy time-varying variables of a simulation dataset, such as the
+    dask arrays of forcing data returned by `load_TAMSAT_data_fast`,
+    `load_AgERA5_data_fast_dask` or `load_forcing_store`, by blocks of days.
+
+    Indexing a dask array for each day of the simulation builds and computes
+    a small task graph every day. Instead, all lazy variables are computed
+    together for a block of `block_days` days, and the next block is computed
+    in a background thread while the current one is simulated, so that at
+    most two blocks of each variable are held in memory.
+    """
+
+    def __init__(self, duration, block_days=30):
+        """
+        Args:
+            duration (int): number of days of the simulation
+            block_days (int, optional): number of days computed at once.
+                Defaults to 30.
+        """
+        self.duration = duration
+        self.block_days = block_days
+        self.arrays = []
+        self.executor = None
+        self.index = None
+        self.blocks = None
+        self.pending = None
+
+    def add(self, values, spatial_ndim=0, pixels=None, members=None):
+        """
+        Adds a lazy variable to the prefetched variables.
+
+        Args:
+            values (dask.array.Array): (time, ...) values of the variable
+            spatial_ndim (int, optional): number of trailing spatial
+                dimensions of `values`, flattened when `pixels` is given.
+                Defaults to 0.
+            pixels (np.ndarray, optional): flat indices of the pixels gathered
+                from the spatial dimensions. Defaults to None.
+            members (int, optional): number of members the values are
+                broadcast to, along a new dimension after time. Defaults to
+                None.
+
+        Returns:
+            PrefetchedArray: (time, ...) array read by blocks of days
+        """
+        array = PrefetchedArray(self, len(self.arrays), values, spatial_ndim, pixels, members)
+        self.arrays.append(array)
+        return array
+
+    def _load(self, start, stop):
+        return [array.transform(np.asarray(array.values[start:stop])) for array in self.arrays]
+
+    def _block(self, k):
+        if k != self.index:
+            if self.pending is not None and self.pending[0] == k:
+                self.blocks = self.pending[1].result()
+            else:
+                self.blocks = self._load(k * self.block_days, min((k + 1) * self.block_days, self.duration))
+            self.index = k
+            self.pending = None
+            start = (k + 1) * self.block_days
+            if start < self.duration:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=1)
+                stop = min(start + self.block_days, self.duration)
+                self.pending = (k + 1, self.executor.submit(self._load, start, stop))
+            elif self.executor is not None:
+                self.executor.shutdown(wait=False)
+                self.executor = None
+        return self.blocks
+
+    def day_values(self, index, day):
+        """
+        Args:
+            index (int): index of the variable
+            day (int): index of the day, within the simulation
+
+        Returns:
+            np.ndarray: values of the day
+        """
+        k = day // self.block_days
+        return self._block(k)[index][day - k * self.block_days]
+
+
+class PrefetchedArray:
+    """
+    Read-only (time, ...) array of a lazy variable, whose days are read from
+    the blocks of a `ForcingPrefetcher`. The valid pixels are gathered and
+    the values are broadcast to the members of an ensemble block by block,
+    so that the array has the layout of the other variables of the state.
+    """
+
+    def __init__(self, prefetcher, index, values, spatial_ndim=0, pixels=None, members=None):
+        self.prefetcher = prefetcher
+        self.index = index
+        self.values = values
+        self.lead_ndim = values.ndim - spatial_ndim
+        self.pixels = pixels
+        self.members = members
+        day_shape = values.shape[1:]
+        if pixels is not None:
+            day_shape = values.shape[1:self.lead_ndim] + pixels.shape
+        if members is not None:
+            day_shape = (members,) + day_shape
+        self.shape = values.shape[:1] + day_shape
+        self.ndim = len(self.shape)
+        self.dtype = values.dtype
+
+    def transform(self, block):
+        """
+        Args:
+            block (np.ndarray): (days, ...) values of the variable
+
+        Returns:
+            np.ndarray: values in the layout of the state
+        """
+        if self.pixels is not None:
+            block = block.reshape(block.shape[:self.lead_ndim] + (-1,))[..., self.pixels]
+        if self.members is not None:
+            block = np.broadcast_to(block[:, np.newaxis], block.shape[:1] + (self.members,) + block.shape[1:])
+        return block
+
+    def __getitem__(self, day):
+        if isinstance(day, slice):
+            return self.transform(np.asarray(self.values[day]))
+        if 0 <= day < self.prefetcher.duration:
+            return self.prefetcher.day_values(self.index, day)
+        day = day % self.shape[0]
+        return self.transform(np.asarray(self.values[day:day + 1]))[0]
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.transform(np.asarray(self.values)), dtype=dtype)
+
+
+class RollingVariable:
+    """
+    Time-varying model variable seen through a single "current day" array.
+
+    The procedures of the model read and write time-varying variables with the
+    `data[var][j,:,:]`, `data[var][j-1,:,:]` and `data[var][j:,:,:]` idioms, the
+    last one broadcasting the value of the day over all the remaining days of
+    the simulation. Writing the remaining days at each time step makes a
+    simulation of `duration` days cost O(duration²) memory writes.
+
+    This class reproduces the exact same semantics with O(1) work per access :
+    the value of the day is held in a 2D `current` array, and the last value
+    that was broadcast over the remaining days is kept in a 2D `carry` array
+    rather than being written to the future days. At the end of each day, the
+    value of the day is committed once into the (time, ...) `output` array.
+
+    Spatial parts of the indexing keys are ignored, so that the same
+    procedures can be run on any spatial layout.
+
+    When `source` is a read-only `constant_field` or a `PrefetchedArray`,
+    the (time, ...) output array is only allocated when the variable is
+    first written, so that variables that keep their initial value all along
+    the simulation are never expanded over time.
+    """
+
+    def __init__(self, source, duration, record=True, pixels=None, members=None):
+        """
+        Args:
+            source (np.ndarray): (time, ...) array holding the initial values of
+                the variable. Committed values are written back into it, or
+                into a copy of it if it is read-only.
+            duration (int): number of days of the simulation.
+            record (bool, optional): whether the values of each day are
+                recorded. If not, `source` is left unchanged and only the
+                value of the previous day is kept. Defaults to True.
+            pixels (np.ndarray, optional): flat indices of the pixels gathered
+                from the last axis of each day of `source`, used when the
+                variable is not recorded. Defaults to None.
+            members (int, optional): number of members of an ensemble the
+                values of each day of `source` are broadcast to, used when the
+                variable is not recorded. Defaults to None.
+        """
+        self.source = source
+        self.record = record
+        self.output = source if record and isinstance(source, np.ndarray) and source.flags.writeable else None
+        self.pixels = pixels
+        self.duration = duration
+        self.day = None
+        shape = source.shape[1:] if pixels is None else source.shape[1:-1] + pixels.shape
+        if members is not None:
+            shape = (members,) + shape
+        self.current = np.empty(shape, dtype=source.dtype)
+        self.carry = np.empty(shape, dtype=source.dtype)
+        self.last = None if record else np.empty(shape, dtype=source.dtype)
+        self.broadcast = False
+        self.loaded = False
+        self.touched = False
+        self.written = False
+
+    def start_day(self, j):
+        """
+        Moves the variable to day `j`. The value of the day is only loaded
+        when the variable is first accessed.
+
+        Args:
+            j (int): index of the day
+        """
+        self.day = j
+        self.loaded = False
+        self.touched = False
+
+    def _source_day(self, day):
+        if self.pixels is None:
+            return self.source[day]
+        return self.source[day][..., self.pixels]
+
+    def _load(self):
+        if not self.loaded:
+            if self.broadcast:
+                np.copyto(self.current, self.carry)
+            else:
+                np.copyto(self.current, self._source_day(self.day))
+            self.loaded = True
+        return self.current
+
+    def _time_index(self, key):
+        return key[0] if isinstance(key, tuple) else key
+
+    def __getitem__(self, key):
+        t = self._time_index(key)
+        if isinstance(t, slice):
+            # tail reads are uniform over the remaining days
+            return self._load()
+        if t == self.day:
+            return self._load()
+        if t == self.day - 1 or (self.day == 0 and t == -1):
+            return self.previous()
+        raise IndexError(
+            "only the current day, the previous day and the remaining days can be accessed (got {})".format(t)
+        )
+
+    def __setitem__(self, key, value):
+        t = self._time_index(key)
+        self._load()
+        np.copyto(self.current, value, casting="unsafe")
+        self.touched = True
+        self.written = True
+        if isinstance(t, slice):
+            np.copyto(self.carry, self.current)
+            self.broadcast = True
+        elif t != self.day:
+            raise IndexError("only the current day or the remaining days can be written (got {})".format(t))
+
+    def previous(self):
+        """
+        Returns the value of the previous day.
+
+        At the first day, index -1 points to the last day of the simulation, as
+        it would for a full (time, ...) array.
+
+        Returns:
+            np.ndarray: value of the previous day
+        """
+        if self.day > 0:
+            if self.output is not None:
+                return self.output[self.day - 1]
+            # a recorded variable without output has not been written yet
+            return self._source_day(self.day - 1) if self.record else self.last
+        if self.duration == 1:
+            return self._load()
+        if self.broadcast:
+            return self.carry
+        return self._source_day(-1)
+
+    def remaining_days(self, j):
+        """
+        Returns the values of the source of the variable from day `j` to the
+        end of the simulation. These are the values of the variable for the
+        variables that are not written by the procedures, such as forcing data
+        or the thermal time computed by `calculate_once_daily_thermal_time`.
+
+        Args:
+            j (int): index of the first day
+
+        Returns:
+            np.ndarray: (days, ...) values, not broadcast to the members of an
+                ensemble
+        """
+        values = self.source[j:self.duration]
+        if self.pixels is not None:
+            values = values[..., self.pixels]
+        return values
+
+    def fill_remaining_days(self):
+        """
+        Carries the value of the current day, once committed, over all the
+        remaining days, as if the variable kept its final state. The value is
+        written into the output array, and broadcast so that the days that are
+        still committed afterwards hold it as well. Variables that were never
+        written, such as forcing data, keep their own values.
+        """
+        if not self.written:
+            return
+        np.copyto(self.carry, self.last if self.output is None else self.output[self.day])
+        self.broadcast = True
+        if self.output is not None:
+            self.output[self.day + 1:self.duration] = self.carry
+
+    def commit(self):
+        """
+        Writes the value of the day into the output array, or keeps it as the
+        value of the previous day if the variable is not recorded.
+        """
+        if self.output is None and self.record:
+            if not (self.touched or self.broadcast):
+                return
+            self.output = np.array(self.source)
+        if self.output is None:
+            if self.touched:
+                np.copyto(self.last, self.current)
+            elif self.broadcast:
+                np.copyto(self.last, self.carry)
+            else:
+                np.copyto(self.last, self._source_day(self.day))
+        elif self.touched:
+            self.output[self.day] = self.current
+        elif self.broadcast:
+            self.output[self.day] = self.carry
+
+
+class SimulationState(dict):
+    """
+    Plain numpy container for the variables of a simulation.
+
+    Time-varying variables are `RollingVariable` objects and static variables
+    are plain numpy arrays, so that the procedures of the model can be applied
+    to it exactly as they are to the simulation dataset, without going through
+    the indexing and alignment machinery of xarray at each access. The state
+    is built from the simulation dataset with `from_dataset`, and converted
+    back to a dataset with `to_dataset` at the end of the simulation.
+
+    Variables sharing the same memory in the dataset share the same
+    `RollingVariable`, so that writing one of them updates the other, as it
+    does with the dataset.
+
+    When built with a pixel mask, the state only holds the valid pixels of
+    the grid, gathered along a single "pixel" dimension, so that the
+    procedures do not spend time on pixels without soil or climate data.
+    Results are scattered back to the grid by `to_dataset`.
+    """
+
+    def __init__(self, duration, coords=None):
+        """
+        Args:
+            duration (int): number of days of the simulation
+            coords (dict, optional): coordinates used when converting the state
+                back to a dataset. Defaults to None.
+        """
+        super().__init__()
+        self.duration = duration
+        self.coords = coords
+        self.dims = {}
+        self.attrs = {}
+        self.variables = []
+        self.mask = None
+        self.spatial_dims = None
+        self.outputs = None
+        self.members = None
+
+    @classmethod
+    def from_dataset(cls, data, duration, mask=None, outputs=None, members=None, prefetch_days=30):
+        """
+        Builds a simulation state from a simulation dataset, as prepared by
+        `initialize_simulation`. Variables are copied into contiguous arrays,
+        so that the dataset is left unchanged by the simulation, except for
+        read-only broadcast views, such as the day length computed by
+        `calc_day_length_raster_fast`, which are used as they are, and the
+        variables whose days all have the same values, which are held as a
+        single day until they are written, see `has_constant_days`. Lazy
+        time-varying variables are not loaded at once, but by blocks of days
+        while the simulation runs, see `ForcingPrefetcher`.
+
+        Args:
+            data (xarray.Dataset): simulation dataset
+            duration (int): number of days of the simulation
+            mask (np.ndarray, optional): boolean spatial mask of the pixels to
+                simulate, as given by `valid_pixel_mask`. Other pixels are set
+                to NaN in the results. Defaults to None, in which case all
+                pixels are simulated on the grid.
+            outputs (list, optional): names of the time-varying variables
+                whose values are recorded for each day. Other time-varying
+                variables are not copied, and only their values of the current
+                and previous days are kept. Defaults to None, in which case all
+                variables are recorded.
+            members (int, optional): number of members of an ensemble
+                simulation. Time-varying variables get a "member" dimension
+                after "time", variables of `data` already having it keep their
+                values for each member. Defaults to None.
+            prefetch_days (int, optional): number of days of the lazy
+                time-varying variables, such as dask arrays of forcing data,
+                computed at once in a background thread, see
+                `ForcingPrefetcher`. Defaults to 30.
+
+        Returns:
+            SimulationState: simulation state
+        """
+        state = cls(duration, coords=data.coords)
+        prefetcher = ForcingPrefetcher(duration, prefetch_days)
+        state.spatial_dims = tuple(d for d in data["rain"].dims[1:] if d != "member")
+        state.members = members
+        if mask is not None:
+            state.mask = np.asarray(mask, dtype=bool)
+            pixels = np.flatnonzero(state.mask)
+
+        keys = {}
+        for name in data.data_vars:
+            values = data[name].data
+            if isinstance(values, np.ndarray):
+                keys[name] = (values.__array_interface__["data"][0], values.shape, values.strides)
+            else:
+                # lazy arrays are not computed to find aliases
+                keys[name] = (id(values), values.shape, None)
+        if outputs is None:
+            recorded = set(keys.values())
+        else:
+            missing = [name for name in outputs if name not in keys]
+            if missing:
+                raise ValueError("unknown output variables {}".format(missing))
+            # aliased variables are recorded together
+            recorded = {keys[name] for name in outputs}
+            state.outputs = list(outputs)
+
+        copies = {}
+        for name in data.data_vars:
+            variable = data[name]
+            key = keys[name]
+            record = key in recorded or "time" not in variable.dims
+            # time first, then member, then the other dimensions
+            dims = tuple(d for d in ("time", "member") if d in variable.dims)
+            dims += tuple(d for d in variable.dims if d not in dims and d not in state.spatial_dims)
+            spatial = tuple(d for d in state.spatial_dims if d in variable.dims)
+            lazy = "time" in dims and not isinstance(variable.data, np.ndarray)
+            if lazy:
+                values = variable.transpose(*dims, *spatial).data
+            else:
+                values = variable.transpose(*dims, *spatial).values
+            # constant fields, or variables whose days all have the same
+            # values, are gathered and expanded over a single day
+            constant = not lazy and "time" in dims and has_constant_days(values)
+            if constant:
+                length = values.shape[0]
+                values = values[:1]
+            # other read-only views, such as the day length broadcast along x,
+            # are never written by the procedures and are not copied
+            view = not lazy and not constant and "time" in dims and not values.flags.writeable and 0 in values.strides
+            gathered = mask is not None and spatial == state.spatial_dims
+            if gathered:
+                # gathering valid pixels along a trailing "pixel" dimension
+                if view:
+                    # flattening the view would expand it over the whole grid
+                    values = values[(Ellipsis,) + np.unravel_index(pixels, values.shape[len(dims):])]
+                elif not lazy:
+                    values = values.reshape(values.shape[:len(dims)] + (-1,))
+                spatial = ("pixel",)
+            # time-varying variables shared by all members get a member dimension
+            expand = members is not None and "time" in dims and "member" not in dims
+            if key not in copies and lazy:
+                # gathered and expanded by the prefetcher, block by block
+                copies[key] = prefetcher.add(values, values.ndim - len(dims), pixels=pixels if gathered else None,
+                                             members=members if expand else None)
+            elif key not in copies and view:
+                if expand:
+                    values = np.broadcast_to(values[:, np.newaxis], (values.shape[0], members) + values.shape[1:])
+                copies[key] = values
+            elif key not in copies:
+                if not record:
+                    copies[key] = values
+                else:
+                    if gathered:
+                        values = values[..., pixels]
+                    if expand:
+                        values = np.broadcast_to(values[:, np.newaxis], (values.shape[0], members) + values.shape[1:])
+                    copies[key] = np.ascontiguousarray(values) if gathered or expand else np.array(values, order="C")
+                if constant:
+                    copies[key] = np.broadcast_to(copies[key], (length,) + copies[key].shape[1:])
+            if expand:
+                dims = ("time", "member") + dims[1:]
+            state.add_variable(
+                name, copies[key], dims + spatial, variable.attrs, record=record,
+                pixels=pixels if gathered and not record and not lazy and not view else None,
+                members=members if expand and not record and not lazy and not view else None,
+            )
+        return state
+
+    def add_variable(self, name, values, dims, attrs=None, record=True, pixels=None, members=None):
+        """
+        Adds a variable to the state. Variables having "time" as first
+        dimension are handled as `RollingVariable`, variables given with the
+        same array share the same `RollingVariable`.
+
+        Args:
+            name (str): name of the variable
+            values (np.ndarray): values of the variable
+            dims (tuple): dimensions of the variable
+            attrs (dict, optional): attributes of the variable. Defaults to None.
+            record (bool, optional): whether the values of each day of a
+                time-varying variable are recorded, see `RollingVariable`.
+                Defaults to True.
+            pixels (np.ndarray, optional): flat indices of the pixels gathered
+                from `values` when it is not recorded, see `RollingVariable`.
+                Defaults to None.
+            members (int, optional): number of members the values of each
+                day are broadcast to when `values` has no member dimension and
+                is not recorded, see `RollingVariable`. Defaults to None.
+        """
+        self.dims[name] = tuple(dims)
+        self.attrs[name] = dict(attrs) if attrs else {}
+        if "time" not in dims:
+            self[name] = values
+            return
+        if dims[0] != "time":
+            raise ValueError("time must be the first dimension of {}".format(name))
+        for variable in self.variables:
+            if variable.source is values:
+                self[name] = variable
+                return
+        variable = RollingVariable(values, self.duration, record=record, pixels=pixels, members=members)
+        self.variables.append(variable)
+        self[name] = variable
+
+    def start_day(self, j):
+        """
+        Args:
+            j (int): index of the day
+        """
+        for variable in self.variables:
+            variable.start_day(j)
+
+    def commit_day(self):
+        """
+        Commits the values of the day of all time-varying variables.
+        """
+        for variable in self.variables:
+            variable.commit()
+
+    def fill_remaining_days(self):
+        """
+        Fills the days after the current one, once committed, with the final
+        values of the variables written during the simulation, see
+        `RollingVariable.fill_remaining_days`.
+        """
+        for variable in self.variables:
+            variable.fill_remaining_days()
+
+    def scatter(self, dims, value):
+        """
+        Scatters a (..., pixel) array of a state built with a pixel mask back
+        to the grid. Pixels outside of the mask are NaN, or zero for non
+        floating point variables.
+
+        Args:
+            dims (tuple): dimensions of the array, ending with "pixel"
+            value (np.ndarray): array to scatter
+
+        Returns:
+            tuple: dimensions and values of the scattered array
+        """
+        if value.ndim > 1 and value.shape[0] > 1 and value.strides[0] == 0:
+            # constant fields stay constant once scattered
+            dims, grid = self.scatter(dims, value[:1])
+            return dims, np.broadcast_to(grid, value.shape[:1] + grid.shape[1:])
+        dims = dims[:-1] + self.spatial_dims
+        fill_value = np.nan if np.issubdtype(value.dtype, np.floating) else 0
+        grid = np.full(value.shape[:-1] + (self.mask.size,), fill_value, dtype=value.dtype)
+        grid[..., self.mask.ravel()] = value
+        return dims, grid.reshape(value.shape[:-1] + self.mask.shape)
+
+    @property
+    def day_dims(self):
+        """
+        Dimensions of the values of a day of the time-varying variables.
+        """
+        dims = ("member",) if self.members is not None else ()
+        return dims + (("pixel",) if self.mask is not None else self.spatial_dims)
+
+    def to_summary_dataset(self, values):
+        """
+        Converts spatial arrays computed on the state, such as the results of
+        reducers, to an xarray dataset over the spatial dimensions of the
+        simulation, scattering them back to the grid if needed.
+
+        Args:
+            values (dict): spatial arrays, by name
+
+        Returns:
+            xarray.Dataset: summary dataset
+        """
+        coords = {name: coord for name, coord in self.coords.items() if "time" not in coord.dims}
+        data = xr.Dataset(coords=coords)
+        for name, value in values.items():
+            # values reduced over the members lack the leading dimensions
+            dims = self.day_dims[len(self.day_dims) - np.ndim(value):]
+            if self.mask is not None:
+                data[name] = self.scatter(dims, value)
+            else:
+                data[name] = (dims, value)
+        return data
+
+    def to_dataset(self):
+        """
+        Converts the state to an xarray dataset. Variables without attributes
+        get the units and long name given by `variable_dict`. Variables of a
+        state built with a pixel mask are scattered back to the grid, and
+        time-varying variables that are not recorded are left out. Constant
+        fields are replaced by writable arrays, see `promote_fields`.
+
+        Returns:
+            xarray.Dataset: simulation dataset
+        """
+        variables = variable_dict()
+        data = xr.Dataset(coords=self.coords)
+        scattered = {}
+        for name, value in self.items():
+            if isinstance(value, RollingVariable):
+                if not value.record or (self.outputs is not None and name not in self.outputs):
+                    continue
+                value = value.source if value.output is None else value.output
+            # aliases are found from the arrays held by the state, which stay
+            # alive, unlike the arrays loaded from lazy variables below
+            key = id(value)
+            if isinstance(value, PrefetchedArray):
+                # lazy variables that were not written are left lazy when possible
+                value = value.values if value.pixels is None and value.members is None else np.asarray(value)
+            dims = self.dims[name]
+            if self.mask is not None and dims[-1:] == ("pixel",):
+                # aliased variables keep sharing the same array
+                if key not in scattered:
+                    scattered[key] = self.scatter(dims, value)
+                dims, value = scattered[key]
+            attrs = self.attrs[name]
+            if not attrs and name in variables:
+                attrs = {"units": variables[name][1], "long_name": variables[name][0]}
+            data[name] = (dims, value, attrs)
+        # constant fields that were not written stay writable for the user
+        return promote_fields(data)
@@ -0,0 +1,217 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import xarray as xr
+
+from .bilan_carbo import initialize_simulation, variable_dict
+from .bilan_pheno import calculate_once_daily_thermal_time
+from .data_preparation import initialize_default_irrigation
+from .ensemble import ensemble_size, initialize_ensemble
+from .models import run_model
+
+
+def available_memory():
+    """
+    Returns the physical memory currently available, in bytes.
+
+    Returns:
+        int: available memory, or None if it can not be determined
+    """
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def auto_tile_size(base_data, duration, n_workers=1, memory_fraction=0.5):
+    """
+    Chooses the size of square tiles so that `n_workers` simulations of one
+    tile each fit in a fraction of the available memory.
+
+    The memory needed by the simulation of one pixel is estimated from the
+    number of variables of the base data and of the simulation, stored in
+    float64 for each day, once in the simulation dataset and once in the
+    results.
+
+    Args:
+        base_data (xarray.Dataset): base data, as prepared by the data
+            loading functions
+        duration (int): number of days of the simulation
+        n_workers (int, optional): number of tiles simulated at the same
+            time. Defaults to 1.
+        memory_fraction (float, optional): fraction of the available memory
+            given to the simulations. Defaults to 0.5.
+
+    Returns:
+        int: number of pixels along each side of the tiles
+    """
+    memory = available_memory()
+    if memory is None:
+        memory = 4 * 1024**3
+    n_variables = len(base_data.data_vars) + len(variable_dict()) + 20
+    pixel_bytes = 2 * n_variables * duration * 8
+    pixels = memory * memory_fraction / (n_workers * pixel_bytes)
+    return max(1, int(np.sqrt(pixels)))
+
+
+def tile_slices(sizes, tile_size):
+    """
+    Splits a grid into tiles.
+
+    Args:
+        sizes (dict): size of the grid along each spatial dimension, such as
+            {"y": 1000, "x": 800}
+        tile_size (int or dict): number of pixels along each side of the
+            tiles, or along each spatial dimension
+
+    Returns:
+        list: one dict of slices by dimension for each tile
+    """
+    if not isinstance(tile_size, dict):
+        tile_size = {dim: tile_size for dim in sizes}
+    tiles = [{}]
+    for dim, size in sizes.items():
+        step = tile_size.get(dim, size)
+        tiles = [dict(tile, **{dim: slice(start, min(start + step, size))})
+                 for tile in tiles for start in range(0, size, step)]
+    return tiles
+
+
+def run_tile(base_tile, paramVariete, paramITK, paramTypeSol, duration, date_start, run_kwargs):
+    """
+    Prepares and runs the simulation of one tile of the base data, as done
+    in the notebooks for a whole grid, or with `initialize_ensemble` for
+    ensemble simulations.
+
+    Args:
+        base_tile (xarray.Dataset): tile of the base data
+        paramVariete (dict): crop variety parameters
+        paramITK (dict): crop management parameters
+        paramTypeSol (dict): soil parameters
+        duration (int): number of days of the simulation
+        date_start (datetime.date): first day of the simulation
+        run_kwargs (dict): keyword arguments given to `run_model`
+
+    Returns:
+        xarray.Dataset: simulation data of the tile
+    """
+    data = base_tile.load().copy()
+    grid_width, grid_height = data["rain"].shape[1:]
+    if ensemble_size(paramVariete, paramITK) is not None:
+        data = initialize_ensemble(data, grid_width, grid_height, duration, paramVariete, paramITK, date_start)
+    else:
+        data = initialize_simulation(data, grid_width, grid_height, duration, paramVariete, paramITK, date_start)
+        data = initialize_default_irrigation(data)
+        data = calculate_once_daily_thermal_time(data, paramVariete)
+    return run_model(paramVariete, paramITK, paramTypeSol, data, duration, **run_kwargs)
+
+
+def _run_tile(args):
+    return run_tile(*args)
+
+
+def run_model_tiled(base_data, paramVariete, paramITK, paramTypeSol, duration, date_start,
+                    tile_size=None, n_workers=None, engine="rolling", mask=None, **run_kwargs):
+    """
+    Runs the model on a large grid by splitting it into spatial tiles, each
+    tile being initialized and simulated in a worker process, and
+    reassembles the results.
+
+    As pixels do not interact with each other, results are the same as
+    those of a simulation of the whole grid. Each worker only receives the
+    base data of its tile, and only holds the simulation of one tile at a
+    time.
+
+    Args:
+        base_data (xarray.Dataset): base data, as prepared by the data
+            loading functions
+        paramVariete (dict): crop variety parameters
+        paramITK (dict): crop management parameters
+        paramTypeSol (dict): soil parameters
+        duration (int): number of days of the simulation
+        date_start (datetime.date): first day of the simulation
+        tile_size (int or dict, optional): number of pixels along each side
+            of the tiles, or along each spatial dimension. Defaults to None,
+            in which case it is chosen with `auto_tile_size`.
+        n_workers (int, optional): number of worker processes. Defaults to
+            None, in which case the number of CPUs is used. With one worker,
+            tiles are simulated in the current process.
+        engine (str, optional): engine of `run_model`. Defaults to "rolling".
+        mask (xarray.DataArray or np.ndarray, optional): spatial mask
+            restricting the simulated pixels, see `run_days`. Defaults to
+            None.
+        **run_kwargs: other keyword arguments given to `run_model`, such as
+            `outputs`, `reducers` or `compact`. Writers can not be shared by
+            several tiles.
+
+    Returns:
+        xarray.Dataset: simulation data
+    """
+    if run_kwargs.get("writer") is not None:
+        raise ValueError("writers can not be used with tiled simulations")
+
+    spatial_dims = base_data["rain"].dims[1:]
+    sizes = {dim: base_data.sizes[dim] for dim in spatial_dims}
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if tile_size is None:
+        tile_size = auto_tile_size(base_data, duration, n_workers)
+    tiles = tile_slices(sizes, tile_size)
+
+    if mask is not None and not isinstance(mask, xr.DataArray):
+        mask = xr.DataArray(np.asarray(mask), dims=spatial_dims)
+
+    def tasks():
+        for tile in tiles:
+            kwargs = dict(run_kwargs, engine=engine)
+            if mask is not None:
+                kwargs["mask"] = mask.isel(tile)
+            yield (base_data.isel(tile), paramVariete, paramITK, paramTypeSol, duration, date_start, kwargs)
+
+    if n_workers == 1 or len(tiles) == 1:
+        results = map(_run_tile, tasks())
+        return _assemble(base_data, tiles, results, sizes)
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        return _assemble(base_data, tiles, _bounded_map(executor, tasks(), 2 * n_workers), sizes)
+
+
+def _bounded_map(executor, tasks, max_pending):
+    """
+    Yields the results of the tasks in order, submitting new tasks as
+    results are consumed, so that the data of at most `max_pending` tiles is
+    waiting to be processed at the same time (`Executor.map` would submit all
+    of them at once).
+    """
+    pending = deque()
+    for task in tasks:
+        pending.append(executor.submit(_run_tile, task))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _assemble(base_data, tiles, results, sizes):
+    """
+    Writes the results of the tiles into a dataset over the whole grid.
+    """
+    arrays = {}
+    for tile, result in zip(tiles, results):
+        for name, variable in result.data_vars.items():
+            if name not in arrays:
+                shape = tuple(sizes.get(dim, size) for dim, size in zip(variable.dims, variable.shape))
+                fill_value = np.nan if np.issubdtype(variable.dtype, np.floating) else 0
+                arrays[name] = (variable.dims, np.full(shape, fill_value, dtype=variable.dtype), variable.attrs)
+            dims, values, _ = arrays[name]
+            values[tuple(tile.get(dim, slice(None)) for dim in dims)] = variable.values
+
+    coords = {name: coord for name, coord in base_data.coords.items() if "time" not in coord.dims}
+    data = xr.Dataset(coords=coords)
+    for name, variable in arrays.items():
+        data[name] = variable
+    if "time" in base_data.coords and "time" in data.dims:
+        data = data.assign_coords(time=base_data["time"].values[:data.sizes["time"]])
+    return data
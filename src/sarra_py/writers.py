@@ -0,0 +1,174 @@
+import os
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from .state import SimulationState
+
+
+class OutputWriter:
+    """
+    Writes the daily values of selected variables to a chunked and
+    compressed Zarr or NetCDF store while the simulation runs.
+
+    The values of each day are buffered, and the buffer is flushed to the
+    store every `block_days` days, so that the memory used by the outputs
+    does not depend on the duration of the simulation, and that the days
+    already written can be read before the end of the simulation.
+
+    Writers are given to `run_model` and `run_waterbalance_model` through the
+    `writer` argument. The store is created when the simulation starts,
+    overwriting any existing store at `path`.
+
+    Zarr stores require the zarr package, and NetCDF stores the netCDF4
+    package, installed with the "zarr" and "netcdf" extras of sarra_py.
+    """
+
+    def __init__(self, path, variables, block_days=30, chunks=None, format=None, complevel=4):
+        """
+        Args:
+            path (str): path of the store
+            variables (list): names of the time-varying variables to write
+            block_days (int, optional): number of days buffered before each
+                write. Defaults to 30.
+            chunks (dict, optional): chunk size along each dimension of the
+                written variables, such as {"time": 30, "y": 256, "x": 256}.
+                Dimensions that are not given are not split, except "time",
+                which is chunked by `block_days`. Defaults to None.
+            format (str, optional): "zarr" or "netcdf". Defaults to None, in
+                which case the format is given by the extension of `path`,
+                ".nc" giving NetCDF and other extensions Zarr.
+            complevel (int, optional): zlib compression level of NetCDF
+                stores. Zarr stores use the default compressor of zarr.
+                Defaults to 4.
+        """
+        if format is None:
+            format = "netcdf" if os.path.splitext(str(path))[1] in (".nc", ".nc4") else "zarr"
+        if format not in ("zarr", "netcdf"):
+            raise ValueError("format must be zarr or netcdf, got {}".format(format))
+        if not variables:
+            raise ValueError("at least one variable must be written")
+        self.path = path
+        self.variables = list(variables)
+        self.block_days = block_days
+        self.chunks = dict(chunks) if chunks else {}
+        self.format = format
+        self.complevel = complevel
+        self.start = 0
+
+    def open(self, data):
+        """
+        Prepares the writer for a simulation.
+
+        Args:
+            data (xarray.Dataset or SimulationState): simulation data
+        """
+        missing = [name for name in self.variables if name not in data]
+        if missing:
+            raise ValueError("unknown output variables {}".format(missing))
+        if isinstance(data, SimulationState):
+            self.state = data
+            member_dims = ("member",) if data.members is not None else ()
+            self.dims = ("time",) + member_dims + data.spatial_dims
+            self.attrs = {name: data.attrs[name] for name in self.variables}
+        else:
+            self.state = None
+            self.dims = data[self.variables[0]].dims
+            self.attrs = {name: data[name].attrs for name in self.variables}
+        self.coords = {name: coord for name, coord in data.coords.items() if "time" not in coord.dims}
+        self.time = data.coords["time"].values if "time" in data.coords else None
+        self.buffers = None
+        self.start = 0
+        self.count = 0
+
+    def _day_values(self, name, j, data):
+        values = np.asarray(data[name][j])
+        if self.state is not None and self.state.mask is not None:
+            values = self.state.scatter(self.state.day_dims, values)[1]
+        return values
+
+    def update(self, j, data):
+        """
+        Buffers the values of the day `j`, and writes the buffer to the store
+        when it is full.
+
+        Args:
+            j (int): index of the day
+            data (xarray.Dataset or SimulationState): simulation data
+        """
+        if self.buffers is None:
+            self.buffers = {}
+            for name in self.variables:
+                values = self._day_values(name, j, data)
+                self.buffers[name] = np.empty((self.block_days,) + values.shape, dtype=values.dtype)
+        for name in self.variables:
+            self.buffers[name][self.count] = self._day_values(name, j, data)
+        self.count += 1
+        if self.count == self.block_days:
+            self.flush()
+
+    def _encoding(self, variable):
+        chunks = (self.chunks.get("time", self.block_days),) + tuple(
+            min(self.chunks.get(dim, size), size) for dim, size in zip(variable.dims[1:], variable.shape[1:])
+        )
+        if self.format == "zarr":
+            return {"chunks": chunks}
+        return {"zlib": True, "complevel": self.complevel, "chunksizes": chunks}
+
+    def flush(self):
+        """
+        Writes the buffered days to the store.
+        """
+        if self.count == 0:
+            return
+        coords = dict(self.coords)
+        if self.time is not None:
+            coords["time"] = self.time[self.start:self.start + self.count]
+        block = xr.Dataset(
+            {name: (self.dims, self.buffers[name][:self.count], self.attrs[name]) for name in self.variables},
+            coords=coords,
+        )
+        self.write_block(block)
+        self.count = 0
+
+    def write_block(self, block):
+        """
+        Writes consecutive days to the store, after the days already written.
+        The first block creates the store.
+
+        Args:
+            block (xarray.Dataset): values of the days of the variables, with
+                "time" as first dimension
+        """
+        end = self.start + block.sizes["time"]
+        encoding = {name: self._encoding(block[name]) for name in self.variables}
+        if self.format == "zarr":
+            if self.start == 0:
+                block.to_zarr(self.path, mode="w", encoding=encoding)
+            else:
+                block.to_zarr(self.path, append_dim="time")
+        elif self.start == 0:
+            block.to_netcdf(self.path, mode="w", engine="netcdf4", unlimited_dims=["time"], encoding=encoding)
+        else:
+            self._append_netcdf(block, end)
+        self.start = end
+
+    def _append_netcdf(self, block, end):
+        import netCDF4
+
+        with netCDF4.Dataset(self.path, "a") as store:
+            for name in self.variables:
+                store[name][self.start:end] = block[name].values
+            if "time" in block.coords:
+                times = pd.to_datetime(block["time"].values).to_pydatetime()
+                store["time"][self.start:end] = netCDF4.date2num(
+                    times, store["time"].units, getattr(store["time"], "calendar", "standard")
+                )
+
+    def close(self):
+        """
+        Writes the remaining buffered days to the store.
+        """
+        self.flush()
+        self.buffers = None
@@ -0,0 +1,101 @@
+import datetime
+import os
+
+import numpy as np
+import pytest
+import rasterio
+import xarray as xr
+
+import sarra_py
+
+# the parameters files are loaded relatively to the notebooks folder
+NOTEBOOKS_PATH = os.path.join(os.path.dirname(__file__), "..", "notebooks")
+
+DATE_START = datetime.date(2017, 5, 1)
+
+
+def synthetic_base_data(duration, grid_height=4, grid_width=5, seed=0):
+    """
+    Builds the base data of a simulation on a small synthetic grid, with a
+    rainy season and two pixels without soil data.
+    """
+    rng = np.random.default_rng(seed)
+    shape = (duration, grid_height, grid_width)
+    dims = ("time", "y", "x")
+    data = xr.Dataset(coords={"y": np.linspace(14, 12, grid_height), "x": np.linspace(2, 4, grid_width)})
+
+    season = np.sin(np.linspace(0, np.pi, duration))[:, np.newaxis, np.newaxis]
+    data["rain"] = (dims, (rng.gamma(0.4, 20, size=shape) * (rng.random(shape) < 0.35) * (0.3 + season)).astype("float32"))
+    data["tpMoy"] = (dims, (27 + 4 * rng.random(shape)).astype("float32"))
+    data["rg"] = (dims, (18 + 6 * rng.random(shape)).astype("float32"))
+    data["ET0"] = (dims, (4 + 2 * rng.random(shape)).astype("float32"))
+    data["dureeDuJour"] = (dims, (11.5 + 1.5 * season) * np.ones(shape))
+
+    ru = (100 + 90 * rng.random(shape[1:])).astype("float32")
+    ru[0, :2] = np.nan
+    data["ru"] = (("y", "x"), ru)
+    data["epaisseurSurf"] = (("y", "x"), np.full(shape[1:], 200, dtype="float32"))
+    data["epaisseurProf"] = (("y", "x"), np.full(shape[1:], 1600, dtype="float32"))
+    data["stockIniProf"] = (("y", "x"), np.zeros(shape[1:], dtype="float32"))
+    data["stockIniSurf"] = (("y", "x"), np.zeros(shape[1:], dtype="float32"))
+    data["profRu"] = (("y", "x"), (1000 + 1000 * rng.random(shape[1:])).astype("float32"))
+    data["runoff_threshold"] = (("y", "x"), (10 + 10 * rng.random(shape[1:])).astype("float32"))
+    data["runoff_rate"] = (("y", "x"), (0.3 + 0.1 * rng.random(shape[1:])).astype("float32"))
+    return data
+
+
+def write_daily_rasters(folder, prefix, values, transform, date_start=DATE_START):
+    """
+    Writes one single-band GeoTIFF file per day, named with a "_YYYY_MM_DD.tif"
+    suffix, as the rainfall and AgERA5 files.
+    """
+    os.makedirs(folder)
+    for i, day in enumerate(values):
+        date = date_start + datetime.timedelta(days=i)
+        path = os.path.join(folder, "{}_{:%Y_%m_%d}.tif".format(prefix, date))
+        with rasterio.open(path, "w", driver="GTiff", height=day.shape[0], width=day.shape[1], count=1,
+                           dtype="float32", crs="EPSG:4326", transform=transform) as dst:
+            dst.write(day, 1)
+
+
+def load_parameters():
+    """
+    Loads the millet parameters of the repository, with shortened phases so
+    that crops go through all phases within a few months.
+    """
+    cwd = os.getcwd()
+    os.chdir(NOTEBOOKS_PATH)
+    try:
+        paramVariete, paramITK, paramTypeSol = sarra_py.load_YAML_parameters(
+            "millet_variety.yaml", "millet_niger_2017.yaml", "USA_iowa_V42.yaml")
+    finally:
+        os.chdir(cwd)
+    paramITK["DateSemis"] = datetime.date(2017, 5, 10)
+    paramITK["nbjTestSemis"] = 10
+    paramVariete.update(SDJBVP=400.0, SDJRPR=300.0, PPsens=1.0)
+    return paramVariete, paramITK, paramTypeSol
+
+
+@pytest.fixture(scope="session")
+def simulation():
+    """
+    Returns a function preparing a simulation on the synthetic grid, as
+    (data, paramVariete, paramITK, paramTypeSol). Each call returns new data
+    and parameters, as engines may update them.
+    """
+    def prepare(duration, **kwargs):
+        paramVariete, paramITK, paramTypeSol = load_parameters()
+        data = synthetic_base_data(duration, **kwargs)
+        data = sarra_py.initialize_simulation(data, data.sizes["y"], data.sizes["x"], duration,
+                                              paramVariete, paramITK, DATE_START)
+        data = sarra_py.initialize_default_irrigation(data)
+        data = sarra_py.calculate_once_daily_thermal_time(data, paramVariete)
+        return data, paramVariete, paramITK, paramTypeSol
+    return prepare
+
+
+def time_variables(data):
+    """
+    Names of the time-varying variables of a simulation dataset.
+    """
+    return [name for name in data.data_vars if "time" in data[name].dims]
@@ -0,0 +1,146 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import rioxarray
+import xarray as xr
+from rasterio.transform import from_origin
+
+import sarra_py
+
+from conftest import DATE_START, write_daily_rasters
+
+TRANSFORM = from_origin(2.0, 14.0, 0.1, 0.1)
+
+SOIL_TYPE_CORRESPONDANCE_PATH = os.path.join(os.path.dirname(__file__), "..", "data", "assets",
+                                             "TypeSol_Moy13_HWSD.csv")
+
+# soil properties mapped by load_iSDA_soil_data
+SOIL_VARIABLES = {
+    "epaisseurProf": "EpaisseurProf",
+    "epaisseurSurf": "EpaisseurSurf",
+    "stockIniProf": "StockIniProf",
+    "stockIniSurf": "StockIniSurf",
+    "runoff_threshold": "SeuilRuiss",
+    "runoff_rate": "PourcRuiss",
+    "ru": "Ru",
+}
+
+
+@pytest.fixture
+def rainfall_files(tmp_path):
+    """
+    Eight days of rainfall files on a 6x8 grid, with their values.
+    """
+    values = (20 * np.random.default_rng(0).random((8, 6, 8))).astype("float32")
+    path = str(tmp_path / "rainfall")
+    write_daily_rasters(path, "rfe", values, TRANSFORM)
+    return path, values
+
+
+def test_load_raster_stack_equals_concatenated_files(rainfall_files):
+    path, values = rainfall_files
+    file_paths = [os.path.join(path, filename) for filename in sorted(os.listdir(path))]
+
+    stack = sarra_py.load_raster_stack(file_paths, n_threads=3)
+
+    expected = xr.concat([rioxarray.open_rasterio(file_path).squeeze("band").drop_vars(["band"])
+                          for file_path in file_paths], "time")
+    assert stack.dims == expected.dims
+    assert stack.dtype == np.float32
+    np.testing.assert_array_equal(stack.values, values)
+    for dim in ["y", "x"]:
+        np.testing.assert_array_equal(stack[dim].values, expected[dim].values)
+
+
+def test_load_raster_stack_rejects_other_grids(rainfall_files, tmp_path):
+    path, values = rainfall_files
+    other_path = str(tmp_path / "other")
+    write_daily_rasters(other_path, "rfe", values[:1, :4], TRANSFORM)
+
+    with pytest.raises(ValueError):
+        sarra_py.load_raster_stack([os.path.join(path, sorted(os.listdir(path))[0]),
+                                    os.path.join(other_path, os.listdir(other_path)[0])])
+
+
+def test_load_TAMSAT_data_reads_the_simulation_period(rainfall_files):
+    path, values = rainfall_files
+
+    data = sarra_py.load_TAMSAT_data(xr.Dataset(), path, DATE_START + datetime.timedelta(days=2), 4)
+
+    assert data["rain"].dims == ("time", "y", "x")
+    assert data["rain"].attrs["units"] == "mm"
+    np.testing.assert_array_equal(data["rain"].values, values[2:6])
+
+
+def test_map_soil_properties_equals_dict_mapping():
+    df_soil_type_correspondance = pd.read_csv(SOIL_TYPE_CORRESPONDANCE_PATH, sep=";", skiprows=1)
+    ids = df_soil_type_correspondance["Id"].to_numpy()
+    soil_type = np.stack([np.append(ids, 0), np.append(ids[::-1], 0)]).astype(np.float32)
+    data = xr.Dataset({"soil_type": (("y", "x"), soil_type)})
+
+    lut = sarra_py.build_soil_lut(SOIL_VARIABLES, SOIL_TYPE_CORRESPONDANCE_PATH)
+    data = sarra_py.map_soil_properties(data, SOIL_VARIABLES, lut)
+
+    # per-pixel mapping of the previous loaders
+    for soil_variable, column in SOIL_VARIABLES.items():
+        dict_values = dict(zip(df_soil_type_correspondance["Id"], df_soil_type_correspondance[column]))
+        dict_values[0] = np.nan
+        expected = np.reshape([dict_values[x.astype(int)] for x in soil_type.flatten()], soil_type.shape)
+        np.testing.assert_array_equal(data[soil_variable].values, expected.astype("float32"), err_msg=soil_variable)
+
+
+def test_map_soil_properties_of_unknown_classes_are_nan():
+    soil_type = np.array([[np.nan, 1, 10000]], dtype=np.float32)
+    data = xr.Dataset({"soil_type": (("y", "x"), soil_type)})
+
+    lut = sarra_py.build_soil_lut(SOIL_VARIABLES, SOIL_TYPE_CORRESPONDANCE_PATH)
+    data = sarra_py.map_soil_properties(data, SOIL_VARIABLES, lut)
+
+    np.testing.assert_array_equal(np.isnan(data["ru"].values), [[True, False, True]])
+
+
+def soil_grid(width=5, resolution=0.1):
+    data = xr.Dataset(coords={"y": 14 - resolution * (np.arange(4) + 0.5),
+                              "x": 2 + resolution * (np.arange(width) + 0.5)})
+    data["ru"] = (("y", "x"), np.random.default_rng(0).random((4, width)).astype("float32"), {"units": "mm"})
+    data["ru"][0, 0] = np.nan
+    data["soil_type"] = (("y", "x"), np.arange(4 * width, dtype="float32").reshape(4, width))
+    return data.rio.write_crs(4326)
+
+
+def test_soil_layers_cache_reloads_saved_layers(tmp_path):
+    data = soil_grid()
+    cache_path = sarra_py.soil_layers_cache_path(data, str(tmp_path / "cache"), "iSDA_soil_data",
+                                                 [SOIL_TYPE_CORRESPONDANCE_PATH])
+    sarra_py.save_soil_layers(data, ["ru", "soil_type"], cache_path)
+
+    loaded = sarra_py.load_soil_layers(soil_grid().drop_vars(["ru", "soil_type"]), cache_path)
+    for name in ["ru", "soil_type"]:
+        assert loaded[name].dims == data[name].dims
+        assert loaded[name].attrs == data[name].attrs
+        np.testing.assert_array_equal(loaded[name].values, data[name].values)
+
+
+def test_soil_layers_cache_path_depends_on_grid_and_assets(tmp_path, monkeypatch):
+    asset_path = str(tmp_path / "asset.csv")
+    with open(asset_path, "w") as file:
+        file.write("Id;Ru\n1;100\n")
+    cache_dir = str(tmp_path / "cache")
+    path = sarra_py.soil_layers_cache_path(soil_grid(), cache_dir, "iSDA_soil_data", [asset_path])
+
+    assert sarra_py.soil_layers_cache_path(soil_grid(), cache_dir, "iSDA_soil_data", [asset_path]) == path
+    assert sarra_py.soil_layers_cache_path(soil_grid(width=6), cache_dir, "iSDA_soil_data", [asset_path]) != path
+    assert sarra_py.soil_layers_cache_path(soil_grid(resolution=0.2), cache_dir, "iSDA_soil_data",
+                                           [asset_path]) != path
+    with open(asset_path, "a") as file:
+        file.write("2;120\n")
+    assert sarra_py.soil_layers_cache_path(soil_grid(), cache_dir, "iSDA_soil_data", [asset_path]) != path
+
+    # the cache is used by default, in the per-user cache folder
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "user_cache"))
+    default_path = sarra_py.soil_layers_cache_path(soil_grid(), None, "iSDA_soil_data", [asset_path])
+    assert default_path.startswith(os.path.join(str(tmp_path / "user_cache"), "sarra_py", "soil_layers"))
+    assert sarra_py.soil_layers_cache_path(soil_grid(), False, "iSDA_soil_data", [asset_path]) is None
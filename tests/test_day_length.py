@@ -0,0 +1,62 @@
+import datetime
+
+import numpy as np
+
+import sarra_py
+
+from conftest import DATE_START, synthetic_base_data
+
+DURATION = 30
+
+
+def test_day_length_equals_astral():
+    dates = [datetime.date(2017, 1, 1) + datetime.timedelta(days=i) for i in range(0, 730, 7)]
+    latitudes = np.arange(-60, 61, 7.5)
+
+    result = sarra_py.day_length(np.array(dates, dtype="datetime64[D]")[:, np.newaxis], latitudes[np.newaxis, :])
+
+    expected = np.array([[sarra_py.calc_day_length(date, latitude) for latitude in latitudes] for date in dates])
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_day_length_raster_equals_astral_raster():
+    data = sarra_py.calc_day_length_raster_fast(synthetic_base_data(DURATION), DATE_START, DURATION)
+
+    # raster computed with astral for each day and latitude, repeated along x
+    days = np.array([DATE_START + datetime.timedelta(days=i) for i in range(DURATION)])[..., np.newaxis]
+    latitudes = np.array(data["y"])[np.newaxis, ...]
+    result = np.vectorize(sarra_py.calc_day_length)(days, latitudes)
+    expected = np.repeat(result[..., np.newaxis], data["rain"].shape[2], axis=2)
+
+    assert data["dureeDuJour"].dims == data["rain"].dims
+    np.testing.assert_array_equal(data["dureeDuJour"].values, expected)
+
+
+def test_day_length_view_is_not_copied_by_the_rolling_engine():
+    data = sarra_py.calc_day_length_raster_fast(synthetic_base_data(DURATION), DATE_START, DURATION)
+    values = data["dureeDuJour"].values
+
+    state = sarra_py.SimulationState.from_dataset(data, DURATION)
+    assert np.shares_memory(state["dureeDuJour"].source, values)
+
+    valid = sarra_py.valid_pixel_mask(data)
+    state = sarra_py.SimulationState.from_dataset(data, DURATION, mask=valid)
+    np.testing.assert_array_equal(state["dureeDuJour"].source, values[:, valid])
+
+
+def test_day_length_view_gives_the_same_results(simulation):
+    results = {}
+    for materialized, compact in [(False, False), (False, True), (True, False)]:
+        data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+        data = sarra_py.calc_day_length_raster_fast(data, DATE_START, DURATION)
+        if materialized:
+            data["dureeDuJour"] = (data["dureeDuJour"].dims, np.array(data["dureeDuJour"].values))
+        results[materialized, compact] = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION,
+                                                            engine="rolling", compact=compact)
+
+    valid = sarra_py.valid_pixel_mask(data)
+    expected = results[True, False]
+    for name in ["numPhase", "phasePhotoper", "sumPP", "lai"]:
+        np.testing.assert_array_equal(results[False, False][name].values, expected[name].values, err_msg=name)
+        np.testing.assert_array_equal(results[False, True][name].values[:, valid], expected[name].values[:, valid],
+                                      err_msg=name)
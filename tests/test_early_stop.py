@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+import sarra_py
+
+from conftest import time_variables
+
+# long enough for the crops of all pixels to be harvested before the end
+DURATION = 180
+
+# variables written day by day, which hold no broadcast value
+DAY_VARIABLES = ["kce", "evapPot", "trPot", "fesw", "eauTranspi", "Ncrit", "assim"]
+
+
+@pytest.fixture(scope="module")
+def early_simulation(simulation):
+    """
+    Returns a function preparing the simulation of the synthetic grid, with
+    crops maturing early enough to be harvested within the simulation.
+    """
+    def prepare():
+        data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+        paramVariete.update(SDJMatu1=150.0, SDJMatu2=100.0)
+        return data, paramVariete, paramITK, paramTypeSol
+    return prepare
+
+
+@pytest.fixture(scope="module")
+def full_results(early_simulation):
+    data, paramVariete, paramITK, paramTypeSol = early_simulation()
+    return sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling")
+
+
+@pytest.fixture(scope="module")
+def stopped_results(early_simulation):
+    data, paramVariete, paramITK, paramTypeSol = early_simulation()
+    return sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling",
+                              early_stop=True)
+
+
+def stop_day(results):
+    valid = sarra_py.valid_pixel_mask(results)
+    harvested = (results["numPhase"].values[:, valid] == 7).all(axis=1)
+    assert harvested.any() and not harvested[0]
+    return int(np.argmax(harvested))
+
+
+def test_early_stop_equals_full_run_until_stop_day(full_results, stopped_results):
+    stop = stop_day(full_results)
+    assert stop < DURATION - 1
+
+    for name in time_variables(full_results):
+        np.testing.assert_array_equal(stopped_results[name].values[:stop + 1], full_results[name].values[:stop + 1],
+                                      err_msg=name)
+
+
+def test_early_stop_carries_final_state(full_results, stopped_results):
+    stop = stop_day(full_results)
+
+    for name in DAY_VARIABLES + ["numPhase", "root_tank_stock", "rdt", "lai"]:
+        values = stopped_results[name].values
+        np.testing.assert_array_equal(values[stop + 1:], np.broadcast_to(values[stop], values[stop + 1:].shape),
+                                      err_msg=name)
+    # forcing data is left as is
+    for name in ["rain", "ET0", "ddj"]:
+        np.testing.assert_array_equal(stopped_results[name].values, full_results[name].values, err_msg=name)
+
+
+def test_early_stop_with_reducers_carries_final_state(early_simulation, stopped_results):
+    outputs = DAY_VARIABLES + ["numPhase", "rdt", "rain"]
+    data, paramVariete, paramITK, paramTypeSol = early_simulation()
+    results = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling",
+                                 early_stop=True, outputs=outputs, reducers=sarra_py.seasonal_reducers())
+
+    for name in outputs:
+        np.testing.assert_array_equal(results[name].values, stopped_results[name].values, err_msg=name)
+    np.testing.assert_allclose(results["tr_sum"].values, stopped_results["tr"].sum("time").values, rtol=1e-5)
+
+
+def test_early_stop_xarray_engine_equals_rolling_engine(early_simulation, stopped_results):
+    data, paramVariete, paramITK, paramTypeSol = early_simulation()
+    results = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="xarray",
+                                 early_stop=True)
+
+    for name in time_variables(results):
+        np.testing.assert_array_equal(results[name].values, stopped_results[name].values, err_msg=name)
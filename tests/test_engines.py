@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+import sarra_py
+
+from conftest import time_variables
+
+DURATION = 60
+
+
+@pytest.fixture(scope="module")
+def xarray_results(simulation):
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    return sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="xarray")
+
+
+def test_rolling_engine_equals_xarray_engine(simulation, xarray_results):
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    results = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling")
+
+    assert set(time_variables(results)) == set(time_variables(xarray_results))
+    for name in time_variables(xarray_results):
+        np.testing.assert_array_equal(results[name].values, xarray_results[name].values, err_msg=name)
+
+
+def test_compact_rolling_engine_equals_xarray_engine(simulation, xarray_results):
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    results = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling",
+                                 compact=True)
+
+    valid = sarra_py.valid_pixel_mask(data)
+    assert not valid.all()
+    for name in time_variables(xarray_results):
+        np.testing.assert_array_equal(results[name].values[:, valid], xarray_results[name].values[:, valid],
+                                      err_msg=name)
+        if np.issubdtype(results[name].dtype, np.floating):
+            assert np.isnan(results[name].values[:, ~valid]).all(), name
+
+
+def test_outputs_keep_recorded_variables(simulation, xarray_results):
+    outputs = ["numPhase", "root_tank_stock", "lai", "rdt", "previous_total_tank_stock"]
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    results = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling",
+                                 outputs=outputs)
+
+    assert set(time_variables(results)) == set(outputs)
+    for name in outputs:
+        np.testing.assert_array_equal(results[name].values, xarray_results[name].values, err_msg=name)
+    for name in xarray_results.data_vars:
+        if name not in time_variables(xarray_results):
+            assert name in results
+
+
+def test_unknown_outputs_raise(simulation):
+    data, paramVariete, paramITK, paramTypeSol = simulation(5)
+    with pytest.raises(ValueError):
+        sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, 5, engine="rolling", outputs=["unknown"])
+
+
+@pytest.mark.parametrize("engine", ["xarray", "rolling"])
+def test_fused_water_consumption_equals_separate_procedures(simulation, xarray_results, engine):
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    results = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine=engine,
+                                 water_consumption="fused")
+
+    for name in time_variables(xarray_results):
+        np.testing.assert_array_equal(results[name].values, xarray_results[name].values, err_msg=name)
+
+
+@pytest.mark.parametrize("engine", ["xarray", "rolling"])
+def test_event_phenology_equals_daily_phenology(simulation, xarray_results, engine):
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    results = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine=engine,
+                                 phenology="event")
+
+    # crops went through several phases
+    assert (xarray_results["numPhase"].values[-1] >= 3).any()
+    for name in time_variables(xarray_results):
+        np.testing.assert_array_equal(results[name].values, xarray_results[name].values, err_msg=name)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_phase_gated_procedures_equal_ungated_procedures(simulation, xarray_results, monkeypatch, compact):
+    gates = []
+    carbon_balance_needed = sarra_py.models.carbon_balance_needed
+
+    def recorded(j, data, occupancy):
+        gates.append(carbon_balance_needed(j, data, occupancy))
+        return gates[-1]
+
+    monkeypatch.setattr(sarra_py.models, "carbon_balance_needed", recorded)
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    gated = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling",
+                               compact=compact)
+    # the carbon balance was skipped on some days, and applied on others
+    assert len(gates) == DURATION and 0 < sum(gates) < DURATION
+
+    # every pixel taken as in all phases, so that no procedure is skipped
+    monkeypatch.setattr(sarra_py.models, "phase_occupancy", lambda j, data: np.ones(8, dtype=np.int64))
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    ungated = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="xarray")
+
+    valid = sarra_py.valid_pixel_mask(data)
+    for name in time_variables(xarray_results):
+        np.testing.assert_array_equal(ungated[name].values, xarray_results[name].values, err_msg=name)
+        np.testing.assert_array_equal(gated[name].values[:, valid], ungated[name].values[:, valid], err_msg=name)
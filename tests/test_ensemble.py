@@ -0,0 +1,50 @@
+import datetime
+
+import numpy as np
+import pytest
+
+import sarra_py
+
+from conftest import DATE_START, load_parameters, synthetic_base_data, time_variables
+
+DURATION = 40
+
+SOWING_DATES = [datetime.date(2017, 5, 5), datetime.date(2017, 5, 20)]
+
+
+def prepare_ensemble():
+    paramVariete, paramITK, paramTypeSol = load_parameters()
+    paramVariete["SDJBVP"] = [350.0, 450.0]
+    paramITK["DateSemis"] = SOWING_DATES
+    data = synthetic_base_data(DURATION)
+    data = sarra_py.initialize_ensemble(data, data.sizes["y"], data.sizes["x"], DURATION, paramVariete, paramITK,
+                                        DATE_START)
+    return data, paramVariete, paramITK, paramTypeSol
+
+
+def test_ensemble_size():
+    assert sarra_py.ensemble_size({"a": 1.0}, {"b": "c"}) is None
+    assert sarra_py.ensemble_size({"a": [1.0, 2.0]}, {"b": np.arange(2)}) == 2
+    with pytest.raises(ValueError):
+        sarra_py.ensemble_size({"a": [1.0, 2.0]}, {"b": [1.0, 2.0, 3.0]})
+
+
+def test_ensemble_members_equal_single_runs():
+    data, paramVariete, paramITK, paramTypeSol = prepare_ensemble()
+    results = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling")
+
+    assert results.sizes["member"] == 2
+    assert not results["numPhase"].isel(member=0).equals(results["numPhase"].isel(member=1))
+    for member in range(2):
+        variete = sarra_py.member_parameters(paramVariete, member)
+        itk = sarra_py.member_parameters(paramITK, member)
+        data = synthetic_base_data(DURATION)
+        data = sarra_py.initialize_simulation(data, data.sizes["y"], data.sizes["x"], DURATION, variete, itk,
+                                              DATE_START)
+        data = sarra_py.initialize_default_irrigation(data)
+        data = sarra_py.calculate_once_daily_thermal_time(data, variete)
+        expected = sarra_py.run_model(variete, itk, paramTypeSol, data, DURATION, engine="rolling")
+
+        for name in time_variables(expected):
+            values = results[name].isel(member=member) if "member" in results[name].dims else results[name]
+            np.testing.assert_array_equal(values.values, expected[name].values, err_msg=name)
@@ -0,0 +1,64 @@
+import importlib.util
+
+import numpy as np
+import pytest
+import xarray as xr
+
+import sarra_py
+
+from conftest import time_variables
+
+# variables initialized as constant fields
+CONSTANT_VARIABLES = ["irrigation", "irrigAuto", "sowing_date", "ltr", "biomMc"]
+
+
+def test_initial_fields_are_writable(simulation):
+    data, paramVariete, paramITK, paramTypeSol = simulation(10)
+    data["irrigation"][3:,:,:] = 5
+    np.testing.assert_array_equal(data["irrigation"].values[3:][np.isfinite(data["irrigation"].values[3:])], 5)
+    np.testing.assert_array_equal(data["irrigation"].values[:3][np.isfinite(data["irrigation"].values[:3])], 0)
+    for name in CONSTANT_VARIABLES:
+        assert data[name].values.flags.writeable, name
+        assert not sarra_py.is_constant_field(data[name].values), name
+
+
+def test_promote_fields_makes_constant_fields_writable():
+    data = xr.Dataset({
+        "zero": (("time", "y"), sarra_py.constant_field(0, (4, 3), np.float32)),
+        "value": (("time", "y"), sarra_py.constant_field(2.5, (4, 3), np.float32)),
+    })
+    promoted = sarra_py.promote_fields(data)
+    for name, value in [("zero", 0), ("value", 2.5)]:
+        assert promoted[name].values.flags.writeable, name
+        assert promoted[name].dtype == np.float32, name
+        np.testing.assert_array_equal(promoted[name].values, value)
+
+
+def test_rolling_engine_holds_constant_variables_as_single_day(simulation):
+    data, paramVariete, paramITK, paramTypeSol = simulation(10)
+    data["irrigation"][3:,:,:] = 5
+    state = sarra_py.SimulationState.from_dataset(data, 10)
+    for name in CONSTANT_VARIABLES[1:]:
+        assert sarra_py.is_constant_field(state[name].source), name
+    # written variables and forcing data are held over time
+    assert not sarra_py.is_constant_field(state["irrigation"].source)
+    assert not sarra_py.has_constant_days(data["rain"].values)
+
+
+def test_written_irrigation_is_simulated(simulation):
+    data, paramVariete, paramITK, paramTypeSol = simulation(30)
+    data["irrigation"][5:,:,:] = 10
+    results = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, 30, engine="rolling")
+    np.testing.assert_array_equal(results["irrigation"].values[5:][np.isfinite(results["irrigation"].values[5:])], 10)
+
+
+@pytest.mark.parametrize("engine", [
+    "rolling", "xarray",
+    pytest.param("numba", marks=pytest.mark.skipif(importlib.util.find_spec("numba") is None, reason="requires numba")),
+])
+def test_results_are_writable(simulation, engine):
+    data, paramVariete, paramITK, paramTypeSol = simulation(10)
+    results = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, 10, engine=engine)
+    for name in time_variables(results):
+        assert results[name].values.flags.writeable, name
+    results["irrigation"][3:,:,:] = 5
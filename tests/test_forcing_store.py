@@ -0,0 +1,88 @@
+import importlib.util
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("dask")
+
+import xarray as xr
+from rasterio.transform import from_origin
+
+import sarra_py
+
+from conftest import DATE_START, time_variables, write_daily_rasters
+
+DURATION = 5
+
+AgERA5_VARIABLES = ["2m_temperature_24_hour_mean", "ET0Hargeaves", "solar_radiation_flux_daily"]
+
+
+@pytest.fixture
+def forcing_files(tmp_path):
+    """
+    Daily rainfall files on a 6x8 grid, and AgERA5 files of three variables
+    on a coarser 4x5 grid covering it.
+    """
+    rng = np.random.default_rng(0)
+    rainfall_path = str(tmp_path / "rainfall")
+    write_daily_rasters(rainfall_path, "rfe", (20 * rng.random((DURATION, 6, 8))).astype("float32"),
+                        from_origin(2.0, 14.0, 0.1, 0.1))
+    AgERA5_data_path = str(tmp_path / "AgERA5")
+    for variable in AgERA5_VARIABLES:
+        write_daily_rasters(os.path.join(AgERA5_data_path, variable), variable,
+                            (1000 * rng.random((DURATION, 4, 5))).astype("float32"),
+                            from_origin(1.95, 14.05, 0.2, 0.2))
+    return rainfall_path, AgERA5_data_path
+
+
+def requires(package):
+    return pytest.mark.skipif(importlib.util.find_spec(package) is None, reason="requires " + package)
+
+
+@pytest.mark.parametrize("store_name", [
+    pytest.param("forcing.zarr", marks=requires("zarr")),
+    pytest.param("forcing.nc", marks=requires("netCDF4")),
+])
+def test_forcing_store_round_trip(tmp_path, forcing_files, store_name):
+    rainfall_path, AgERA5_data_path = forcing_files
+
+    expected = sarra_py.load_TAMSAT_data(xr.Dataset(), rainfall_path, DATE_START, DURATION)
+    expected = sarra_py.load_AgERA5_data(expected, AgERA5_data_path, DATE_START, DURATION)
+
+    path = str(tmp_path / store_name)
+    dates = sarra_py.ingest_forcing(path, rainfall_path=rainfall_path, AgERA5_data_path=AgERA5_data_path,
+                                    block_days=2)
+    assert len(dates) == DURATION
+
+    data = sarra_py.load_forcing_store(xr.Dataset(), path, DATE_START, DURATION)
+    for dim in ["y", "x"]:
+        np.testing.assert_allclose(data[dim].values, expected[dim].values)
+    for name in ["rain", "tpMoy", "ET0", "rg"]:
+        assert data[name].dims == expected[name].dims
+        assert np.isfinite(expected[name].values).any()
+        np.testing.assert_array_equal(data[name].values, expected[name].values, err_msg=name)
+
+
+@requires("zarr")
+@pytest.mark.parametrize("compact", [False, True])
+def test_prefetched_store_forcing_equals_loaded_forcing(tmp_path, simulation, compact):
+    duration = 30
+    forcing = ["rain", "tpMoy", "rg", "ET0"]
+    data, paramVariete, paramITK, paramTypeSol = simulation(duration)
+    path = str(tmp_path / "forcing.zarr")
+    data[forcing].drop_vars("time", errors="ignore").chunk({"time": 4}).to_zarr(path)
+    expected = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, duration, engine="rolling",
+                                  compact=compact)
+
+    data, paramVariete, paramITK, paramTypeSol = simulation(duration)
+    store = xr.open_zarr(path)
+    for name in forcing:
+        data[name] = store[name]
+        assert not isinstance(data[name].data, np.ndarray)
+    # blocks of days aligned neither on the chunks nor on the duration
+    results = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, duration, engine="rolling",
+                                 compact=compact, prefetch_days=7)
+
+    for name in time_variables(expected):
+        np.testing.assert_array_equal(np.asarray(results[name].values), expected[name].values, err_msg=name)
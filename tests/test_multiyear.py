@@ -0,0 +1,75 @@
+import threading
+import time
+
+import pytest
+
+import sarra_py
+
+YEARS = [2015, 2016, 2017, 2018, 2019]
+
+# time given to the background worker to load a year
+TIMEOUT = 10
+
+
+class Loader:
+    """
+    Loads years as `load_year`, recording the years whose loading started,
+    the later years being loaded faster than the earlier ones.
+    """
+
+    def __init__(self):
+        self.started = []
+        self.events = {year: threading.Event() for year in YEARS}
+
+    def __call__(self, year):
+        self.started.append(year)
+        self.events[year].set()
+        time.sleep(0.01 * (YEARS[-1] - year))
+        return "data of {}".format(year)
+
+
+def test_run_years_yields_years_in_order():
+    loader = Loader()
+    results = list(sarra_py.run_years(YEARS, loader, lambda year, data: (year, data), prefetch=3))
+
+    assert [year for year, _ in results] == YEARS
+    assert [result for _, result in results] == [(year, "data of {}".format(year)) for year in YEARS]
+    assert loader.started == YEARS
+
+
+@pytest.mark.parametrize("prefetch", [1, 2])
+def test_run_years_loads_next_years_while_running(prefetch):
+    loader = Loader()
+
+    def run_year(year, data):
+        index = YEARS.index(year)
+        # the next years are loaded in the background while the year runs
+        for next_year in YEARS[index + 1:index + 1 + prefetch]:
+            assert loader.events[next_year].wait(TIMEOUT), next_year
+        # but no more than `prefetch` years ahead
+        assert set(loader.started) <= set(YEARS[:index + 1 + prefetch])
+        return data
+
+    results = dict(sarra_py.run_years(YEARS, loader, run_year, prefetch=prefetch))
+    assert results == {year: "data of {}".format(year) for year in YEARS}
+
+
+def test_run_years_stops_loading_when_stopped():
+    loader = Loader()
+    for year, _ in sarra_py.run_years(YEARS, loader, lambda year, data: data, prefetch=2):
+        break
+
+    assert year == YEARS[0]
+    # the worker is shut down once the years being loaded are done
+    assert set(loader.started) <= set(YEARS[:3])
+
+
+def test_run_years_loads_in_processes():
+    # str is picklable, and returns the year as loaded data
+    results = list(sarra_py.run_years(YEARS, str, lambda year, data: data, processes=True))
+    assert results == [(year, str(year)) for year in YEARS]
+
+
+def test_run_years_requires_prefetch():
+    with pytest.raises(ValueError):
+        list(sarra_py.run_years(YEARS, str, lambda year, data: data, prefetch=0))
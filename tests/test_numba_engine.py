@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("numba")
+
+import sarra_py
+from sarra_py.numba_engine import KERNEL_VARIABLES, WATERBALANCE_OUTPUTS
+
+from conftest import DATE_START, load_parameters, synthetic_base_data
+
+DURATION = 60
+
+# variables computed with additions and comparisons only, which the kernel
+# reproduces exactly
+PHENOLOGY_VARIABLES = ["numPhase", "changePhase", "initPhase", "phasePhotoper", "seuilTempPhaseSuivante",
+                       "seuilTempPhasePrec", "sdj"]
+
+
+def assert_close_float32(actual, desired, name):
+    # the float32 exponential and power functions of numba and numpy may
+    # differ by a few ulps, which spreads over the following days
+    finite = np.isfinite(desired)
+    scale = np.abs(desired[finite]).max(initial=0)
+    np.testing.assert_allclose(actual, desired, rtol=1e-3, atol=1e-4 * scale, err_msg=name)
+
+
+def test_numba_engine_matches_numpy_procedures(simulation):
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    expected = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling")
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    results = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="numba")
+
+    assert np.isnan(expected["root_tank_stock"].values).any()
+    for name in KERNEL_VARIABLES:
+        actual, desired = results[name].values, expected[name].values
+        np.testing.assert_array_equal(np.isnan(actual), np.isnan(desired), err_msg=name)
+        if name in PHENOLOGY_VARIABLES:
+            np.testing.assert_array_equal(actual, desired, err_msg=name)
+        else:
+            assert_close_float32(actual, desired, name)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_numba_waterbalance_equals_rolling_engine(simulation, compact):
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    expected = sarra_py.run_waterbalance_model(paramVariete, paramITK, paramTypeSol, data, DURATION,
+                                               engine="rolling", compact=compact)
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    results = sarra_py.run_waterbalance_model(paramVariete, paramITK, paramTypeSol, data, DURATION,
+                                              engine="numba", compact=compact)
+
+    assert np.isnan(expected["root_tank_stock"].values).any()
+    for name in WATERBALANCE_OUTPUTS:
+        np.testing.assert_array_equal(results[name].values, expected[name].values, err_msg=name)
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_numba_waterbalance_runs_from_base_data(simulation, compact):
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    expected = sarra_py.run_waterbalance_model(paramVariete, paramITK, paramTypeSol, data, DURATION,
+                                               engine="rolling", compact=compact)
+
+    paramVariete, paramITK, paramTypeSol = load_parameters()
+    data = synthetic_base_data(DURATION)
+    mask = sarra_py.valid_pixel_mask(data) if compact else None
+    results = sarra_py.run_waterbalance_numba(paramVariete, paramITK, paramTypeSol, data, DURATION, mask=mask,
+                                              date_start=DATE_START)
+
+    assert "sowing_date" not in data
+    for name in WATERBALANCE_OUTPUTS:
+        np.testing.assert_array_equal(results[name].values, expected[name].values, err_msg=name)
+        assert results[name].attrs == expected[name].attrs, name
+
+    with pytest.raises(ValueError):
+        sarra_py.run_waterbalance_numba(paramVariete, paramITK, paramTypeSol, data, DURATION)
@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+import sarra_py
+
+DURATION = 60
+
+
+@pytest.fixture(scope="module")
+def daily_results(simulation):
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    return sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling")
+
+
+def test_seasonal_reducers_equal_daily_values(simulation, daily_results):
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    summary = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling",
+                                 reducers=sarra_py.seasonal_reducers(stress_threshold=0.5))
+
+    valid = sarra_py.valid_pixel_mask(daily_results)
+    assert "time" not in summary.dims
+    np.testing.assert_array_equal(summary["rdt_final"].values, daily_results["rdt"].values[-1])
+    np.testing.assert_array_equal(summary["lai_max"].values, daily_results["lai"].max("time", skipna=False).values)
+    np.testing.assert_allclose(summary["tr_sum"].values, daily_results["tr"].values.sum(axis=0, dtype=np.float64))
+
+    cstr = daily_results["cstr"].values
+    num_phase = daily_results["numPhase"].values
+    stressed = ((cstr < 0.5) & (num_phase > 0) & (num_phase < 7)).sum(axis=0)
+    np.testing.assert_array_equal(summary["stressed_days"].values[valid], stressed[valid])
+    # days before sowing, when cstr is 0, are not counted
+    assert (stressed[valid] < (cstr[:, valid] < 0.5).sum(axis=0)).any()
+
+    for phase in range(1, 8):
+        reached = (num_phase == phase).any(axis=0)
+        first_day = np.where(reached, (num_phase == phase).argmax(axis=0), np.nan)
+        np.testing.assert_array_equal(summary["phase_{}_day".format(phase)].values, first_day)
+
+
+def test_reducer_requires_update():
+    class Incomplete(sarra_py.Reducer):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete("rdt")
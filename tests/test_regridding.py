@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+import sarra_py
+
+
+def grid(values, x_start, y_start, resolution, crs=4326):
+    """
+    Returns a (..., y, x) DataArray on a regular grid, whose first pixel
+    center is (x_start, y_start), y decreasing.
+    """
+    height, width = values.shape[-2:]
+    dataarray = xr.DataArray(
+        values,
+        dims=tuple("dim_{}".format(i) for i in range(values.ndim - 2)) + ("y", "x"),
+        coords={"y": y_start - resolution * np.arange(height), "x": x_start + resolution * np.arange(width)},
+    )
+    return dataarray.rio.write_crs(crs)
+
+
+@pytest.fixture
+def source():
+    rng = np.random.default_rng(0)
+    values = rng.random((3, 7, 9)).astype("float32")
+    values[:, 2, 3] = np.nan
+    return grid(values, 2.05, 13.95, 0.1)
+
+
+@pytest.mark.parametrize("target", [
+    # finer grid, partly outside of the source grid
+    grid(np.zeros((12, 15), dtype="float32"), 1.93, 14.02, 0.0613),
+    # coarser grid, not aligned with the source grid
+    grid(np.zeros((3, 4), dtype="float32"), 2.11, 13.87, 0.23),
+    # projected grid
+    grid(np.zeros((8, 10), dtype="float32"), 410000.0, 1540000.0, 7000.0, crs=32631),
+])
+def test_nearest_regrid_equals_reproject_match(source, target):
+    expected = source.rio.reproject_match(target, nodata=np.nan)
+    result = sarra_py.regrid(source, target, "nearest")
+
+    assert np.isfinite(expected.values).any()
+    np.testing.assert_array_equal(result.values, expected.values)
+    np.testing.assert_allclose(result["y"].values, expected["y"].values)
+    np.testing.assert_allclose(result["x"].values, expected["x"].values)
@@ -0,0 +1,110 @@
+import importlib.util
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("dask")
+
+import xarray as xr
+from rasterio.transform import from_origin
+
+import sarra_py
+
+from conftest import DATE_START, load_parameters, synthetic_base_data, time_variables, write_daily_rasters
+
+DURATION = 60
+
+GRID_HEIGHT, GRID_WIDTH = 4, 5
+
+AgERA5_VARIABLES = ["2m_temperature_24_hour_mean", "ET0Hargeaves", "solar_radiation_flux_daily"]
+
+SOIL_VARIABLES = ["ru", "epaisseurSurf", "epaisseurProf", "stockIniProf", "stockIniSurf", "profRu",
+                  "runoff_threshold", "runoff_rate"]
+
+# (y, x) indices of the pixels of the sites, the first one having no soil data
+PIXELS = [(0, 1), (1, 3), (2, 0), (3, 4), (3, 2)]
+
+
+@pytest.fixture(scope="module")
+def forcing_files(tmp_path_factory):
+    """
+    Daily rainfall files of the synthetic grid, and AgERA5 files of three
+    variables on a coarser grid covering it.
+    """
+    tmp_path = tmp_path_factory.mktemp("sites")
+    base_data = synthetic_base_data(DURATION, grid_height=GRID_HEIGHT, grid_width=GRID_WIDTH)
+    rng = np.random.default_rng(1)
+    rainfall_path = str(tmp_path / "rainfall")
+    write_daily_rasters(rainfall_path, "rfe", base_data["rain"].values, from_origin(2.0, 14.0, 0.1, 0.1))
+    AgERA5_data_path = str(tmp_path / "AgERA5")
+    for variable, values in zip(AgERA5_VARIABLES, [28, 5, 20000]):
+        write_daily_rasters(os.path.join(AgERA5_data_path, variable), variable,
+                            (values * (1 + 0.1 * rng.random((DURATION, 3, 3)))).astype("float32"),
+                            from_origin(1.95, 14.05, 0.2, 0.2))
+    return rainfall_path, AgERA5_data_path, tmp_path
+
+
+def pixel_centers(data):
+    """
+    Longitude and latitude of the centers of the pixels of the sites.
+    """
+    return [(data["x"].values[x], data["y"].values[y]) for y, x in PIXELS]
+
+
+def with_soil(data, dims):
+    """
+    Adds the soil parameters of the synthetic grid to data, along dims.
+    """
+    soil = synthetic_base_data(DURATION, grid_height=GRID_HEIGHT, grid_width=GRID_WIDTH)
+    for name in SOIL_VARIABLES:
+        values = soil[name].values
+        if dims == ("site",):
+            values = np.array([values[y, x] for y, x in PIXELS])
+        data[name] = (dims, values)
+    return data
+
+
+def simulate(data):
+    paramVariete, paramITK, paramTypeSol = load_parameters()
+    data = sarra_py.calc_day_length_raster_fast(data, DATE_START, DURATION)
+    data = sarra_py.initialize_simulation(data, data["rain"].shape[1], data["rain"].shape[-1], DURATION,
+                                          paramVariete, paramITK, DATE_START)
+    data = sarra_py.initialize_default_irrigation(data)
+    data = sarra_py.calculate_once_daily_thermal_time(data, paramVariete)
+    return sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling")
+
+
+def test_rainfall_of_sites_equals_grid_pixels(forcing_files):
+    rainfall_path, AgERA5_data_path, tmp_path = forcing_files
+    grid = sarra_py.load_TAMSAT_data(xr.Dataset(), rainfall_path, DATE_START, DURATION)
+    # the last site is out of the rasters
+    sites = sarra_py.sites_dataset(pixel_centers(grid) + [(10.0, 14.0)])
+    sites = sarra_py.load_TAMSAT_data_sites(sites, rainfall_path, DATE_START, DURATION)
+
+    assert sites["rain"].dims == ("time", "site")
+    for site, (y, x) in enumerate(PIXELS):
+        np.testing.assert_array_equal(sites["rain"].values[:, site], grid["rain"].values[:, y, x])
+    assert np.isnan(sites["rain"].values[:, -1]).all()
+
+
+@pytest.mark.skipif(importlib.util.find_spec("zarr") is None, reason="requires zarr")
+def test_simulation_of_sites_equals_grid_pixels(forcing_files):
+    rainfall_path, AgERA5_data_path, tmp_path = forcing_files
+    path = str(tmp_path / "forcing.zarr")
+    sarra_py.ingest_forcing(path, rainfall_path=rainfall_path, AgERA5_data_path=AgERA5_data_path)
+
+    grid = sarra_py.load_forcing_store(xr.Dataset(), path, DATE_START, DURATION)
+    grid = with_soil(grid, ("y", "x"))
+    sites = sarra_py.sites_dataset(pixel_centers(grid))
+    sites = sarra_py.load_forcing_store_sites(sites, path, DATE_START, DURATION)
+    sites = with_soil(sites, ("site",))
+
+    grid_results = simulate(grid)
+    sites_results = simulate(sites)
+
+    # crops grew on the sites with soil data
+    assert (sites_results["biomasseTotale"].values[-1, 1:] > 0).all()
+    for name in time_variables(grid_results):
+        expected = np.stack([grid_results[name].values[:, y, x] for y, x in PIXELS], axis=1)
+        np.testing.assert_array_equal(sites_results[name].values, expected, err_msg=name)
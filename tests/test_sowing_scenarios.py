@@ -0,0 +1,51 @@
+import datetime
+
+import numpy as np
+
+import sarra_py
+
+from conftest import DATE_START, time_variables
+
+DURATION = 60
+
+SOWING_DATES = sarra_py.sowing_date_scenarios(datetime.date(2017, 5, 5), 15, interval=5)
+
+
+def test_sowing_date_scenarios():
+    assert SOWING_DATES == [datetime.date(2017, 5, 5), datetime.date(2017, 5, 10), datetime.date(2017, 5, 15)]
+
+
+def test_sowing_scenarios_equal_single_runs(simulation):
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    data = sarra_py.set_sowing_dates(data, SOWING_DATES, DATE_START)
+    results = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling")
+
+    assert results.sizes["member"] == len(SOWING_DATES)
+    for member, sowing_date in enumerate(SOWING_DATES):
+        data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+        data["sowing_date"] = data["sowing_date"].copy(data=np.full(data["sowing_date"].shape,
+                                                                    (sowing_date - DATE_START).days))
+        expected = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling")
+        for name in time_variables(expected):
+            values = results[name].isel(member=member) if "member" in results[name].dims else results[name]
+            np.testing.assert_array_equal(values.values, expected[name].values, err_msg=name)
+
+
+def test_best_member_of_sowing_scenarios(simulation):
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    data = sarra_py.set_sowing_dates(data, SOWING_DATES, DATE_START)
+    labels = [(date - DATE_START).days for date in SOWING_DATES]
+    results = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling",
+                                 outputs=["biomasseTotale"],
+                                 reducers=[sarra_py.BestMember("biomasseTotale", labels=labels)])
+
+    valid = sarra_py.valid_pixel_mask(data)
+    assert not valid.all()
+    final = results["biomasseTotale"].values[-1]
+    best = np.asarray(labels)[final.argmax(axis=0)]
+    assert len(np.unique(best[valid])) > 1
+    np.testing.assert_array_equal(results["biomasseTotale_best_member"].values[valid], best[valid])
+    np.testing.assert_array_equal(results["biomasseTotale_best"].values[valid], final.max(axis=0)[valid])
+    # pixels without soil data have no best member
+    assert np.isnan(results["biomasseTotale_best_member"].values[~valid]).all()
+    assert np.isnan(results["biomasseTotale_best"].values[~valid]).all()
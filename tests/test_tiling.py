@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+import sarra_py
+
+from conftest import DATE_START, load_parameters, synthetic_base_data, time_variables
+
+DURATION = 30
+
+
+@pytest.fixture(scope="module")
+def grid_results(simulation):
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    return sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling")
+
+
+def test_tile_slices_cover_the_grid():
+    tiles = sarra_py.tile_slices({"y": 5, "x": 3}, {"y": 2})
+    assert tiles == [{"y": slice(0, 2), "x": slice(0, 3)}, {"y": slice(2, 4), "x": slice(0, 3)},
+                     {"y": slice(4, 5), "x": slice(0, 3)}]
+
+
+@pytest.mark.parametrize("n_workers", [1, 2])
+def test_tiled_run_equals_grid_run(grid_results, n_workers):
+    paramVariete, paramITK, paramTypeSol = load_parameters()
+    results = sarra_py.run_model_tiled(synthetic_base_data(DURATION), paramVariete, paramITK, paramTypeSol,
+                                       DURATION, DATE_START, tile_size={"y": 3, "x": 2}, n_workers=n_workers)
+
+    assert set(time_variables(results)) == set(time_variables(grid_results))
+    for name in time_variables(grid_results):
+        assert results[name].dims == grid_results[name].dims
+        np.testing.assert_array_equal(results[name].values, grid_results[name].values, err_msg=name)
@@ -0,0 +1,45 @@
+import importlib.util
+
+import numpy as np
+import pytest
+import xarray as xr
+
+import sarra_py
+
+DURATION = 30
+
+VARIABLES = ["numPhase", "root_tank_stock", "lai"]
+
+
+def requires(package):
+    return pytest.mark.skipif(importlib.util.find_spec(package) is None, reason="requires " + package)
+
+
+@pytest.fixture(scope="module")
+def daily_results(simulation):
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    return sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling")
+
+
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize("store_name", [
+    pytest.param("outputs.zarr", marks=requires("zarr")),
+    pytest.param("outputs.nc", marks=requires("netCDF4")),
+])
+def test_written_store_equals_daily_results(tmp_path, simulation, daily_results, store_name, compact):
+    path = str(tmp_path / store_name)
+    # the last block of days is not full
+    writer = sarra_py.OutputWriter(path, VARIABLES, block_days=7)
+    data, paramVariete, paramITK, paramTypeSol = simulation(DURATION)
+    results = sarra_py.run_model(paramVariete, paramITK, paramTypeSol, data, DURATION, engine="rolling",
+                                 compact=compact, writer=writer)
+
+    assert not any("time" in results[name].dims for name in results.data_vars)
+    with (xr.open_zarr(path) if store_name.endswith(".zarr") else xr.open_dataset(path)) as store:
+        for name in VARIABLES:
+            assert store[name].dims == daily_results[name].dims
+            expected = daily_results[name].values.copy()
+            if compact:
+                # pixels that are not simulated are NaN
+                expected[:, ~sarra_py.valid_pixel_mask(data)] = np.nan
+            np.testing.assert_array_equal(store[name].values, expected, err_msg=name)